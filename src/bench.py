@@ -0,0 +1,337 @@
+import finder
+import kd
+import model
+import peaks
+import sequence
+import translate
+import argparse
+import binascii
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import timeit
+import unittest
+
+
+
+# benchmarks of the scanning, translation, smoothing and peak finding steps
+# on deterministic synthetic genomes;  run as
+#     python bench.py [--sizes ...] [--gc 0.43] [--baseline ../bench_baseline.json]
+# results are written as JSON, and compared against a baseline if there is one
+
+# defaults every benchmark finishes in seconds;  ask for bigger genomes with --sizes
+SIZES = [100000, 1000000]
+OUTPUT = '../bench_output.txt'
+BASELINE = '../bench_baseline.json'
+
+# a benchmark is a regression if it takes this many times as long as its baseline
+THRESHOLD = 1.25
+
+_FORMAT_VERSION = 1
+_CHUNK_SIZE = 1 << 20
+
+
+
+def synthetic_genome(size, gc=0.5, seed=0):
+    '''Int -> Float -> Int -> [Base]
+
+    `size` random bases (rounded down to a whole number of codons), with
+    G + C making up a fraction `gc` of them (to within 1/256).  The same
+    arguments always give the same genome.
+    '''
+    size -= size % 3
+    gcCodes = int(round(256 * gc))
+    table = bytearray([ord('GC'[i % 2]) if i < gcCodes else ord('AT'[i % 2]) for i in range(256)])
+    table = bytes(table)
+    rand, pieces, left = random.Random(seed), [], size
+    while left > 0:
+        count = min(left, _CHUNK_SIZE)
+        raw = binascii.unhexlify('%0*x' % (2 * count, rand.getrandbits(8 * count)))
+        pieces.append(raw.translate(table))
+        left -= count
+    bases = b''.join(pieces)
+    return bases if isinstance(bases, str) else bases.decode('ascii')
+
+
+##############################
+# what each benchmark runs on:  computed once per genome, not timed
+
+def _codons(genome, prepared):
+    return sequence.makeCodons(genome)
+
+def _sense_codons(genome, prepared):
+    return [c for c in prepared(_codons) if c not in sequence.STOPS]
+
+def _scores(genome, prepared):
+    return [kd.kdIndex[r] for r in translate.codonsToResidues(prepared(_sense_codons))]
+
+def _profile(genome, prepared):
+    return kd.smooth(prepared(_scores), 9)
+
+def _genome(genome, prepared):
+    return genome
+
+
+def _finder_pipeline(genome):
+    '''finder.get_all_medium_orfs, on `genome` instead of B. subtilis'''
+    seq = model.Sequence(genome, True)
+    return finder.filter_by_length(seq.get_all_orfs(100) + seq.get_reverse_complement().get_all_orfs(100))
+
+
+# benchmarks that keep a codon list per frame and strand, plus every Orf,
+# run out of memory on big genomes:  they're skipped above these sizes
+MAX_SIZES = {
+    'finder pipeline': 10000000
+}
+
+# (name, input, timed function)
+BENCHMARKS = [
+    ('sequence.makeCodons',             _genome,         sequence.makeCodons),
+    ('sequence.getOrfEndsCircular',     _codons,         sequence.getOrfEndsCircular),
+    ('sequence.getAllOrfEndsCircular',  _codons,         sequence.getAllOrfEndsCircular),
+    ('sequence.reverseComplement',      _genome,         sequence.reverseComplement),
+    ('translate.codonsToResidues',      _sense_codons,   translate.codonsToResidues),
+    ('kd.smooth',                       _scores,         lambda values: kd.smooth(values, 9)),
+    ('kd.triangleSmooth',               _scores,         lambda values: kd.triangleSmooth(values, 9)),
+    ('peaks.find1DPeaks',               _profile,        lambda profile: peaks.find1DPeaks(profile, 9)),
+    ('finder pipeline',                 _genome,         _finder_pipeline)
+]
+
+
+
+def _time(f, arg, repeat):
+    '''the fastest of `repeat` runs, in seconds'''
+    timer, best = timeit.default_timer, None
+    for _ in range(repeat):
+        began = timer()
+        f(arg)
+        elapsed = timer() - began
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_benchmarks(sizes=SIZES, gc=0.5, seed=0, repeat=3, names=None, log=None):
+    '''[Int] -> ... -> {results}
+
+    Times each benchmark (or just those in `names`) on a synthetic genome
+    of each size, skipping those over their MAX_SIZES;  `log`, if given, is
+    called with a line per result.
+    '''
+    results = []
+    for size in sizes:
+        genome = synthetic_genome(size, gc, seed)
+        inputs = {}
+        def prepared(make):
+            if make not in inputs:
+                inputs[make] = make(genome, prepared)
+            return inputs[make]
+        for (name, make, f) in BENCHMARKS:
+            if names is not None and name not in names:
+                continue
+            if len(genome) > MAX_SIZES.get(name, len(genome)):
+                if log is not None:
+                    log('%-34s %10d      skipped' % (name, len(genome)))
+                continue
+            seconds = _time(f, prepared(make), repeat)
+            results.append({
+                'benchmark': name,
+                'size': len(genome),
+                'seconds': seconds,
+                'ns_per_base': 1e9 * seconds / len(genome)
+            })
+            if log is not None:
+                log('%-34s %10d %12.6f s' % (name, len(genome), seconds))
+    return {
+        'format': _FORMAT_VERSION,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'gc': gc,
+        'seed': seed,
+        'repeat': repeat,
+        'results': results
+    }
+
+
+def write_results(path, results):
+    with open(path, 'w') as outfile:
+        json.dump(results, outfile, indent=2, sort_keys=True)
+
+
+def read_results(path):
+    with open(path, 'r') as infile:
+        return json.load(infile)
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    '''{results} -> {results} -> [{comparison}]
+
+    For each benchmark and size in both, the time relative to the baseline,
+    and whether it's a regression (more than `threshold` times as slow).
+    '''
+    before = dict(((r['benchmark'], r['size']), r['seconds']) for r in baseline['results'])
+    comparisons = []
+    for r in results['results']:
+        key = (r['benchmark'], r['size'])
+        if key not in before:
+            continue
+        ratio = r['seconds'] / before[key] if before[key] > 0 else float('inf')
+        comparisons.append({
+            'benchmark': r['benchmark'],
+            'size': r['size'],
+            'seconds': r['seconds'],
+            'baseline': before[key],
+            'ratio': ratio,
+            'regression': ratio > threshold
+        })
+    return comparisons
+
+
+def format_comparisons(comparisons):
+    lines = ['%-34s %10s %12s %12s %8s' % ('benchmark', 'size', 'seconds', 'baseline', 'ratio')]
+    for c in comparisons:
+        lines.append('%-34s %10d %12.6f %12.6f %8.2f%s' % (
+            c['benchmark'], c['size'], c['seconds'], c['baseline'], c['ratio'],
+            '  REGRESSION' if c['regression'] else ''))
+    return '\n'.join(lines)
+
+
+def main(argv, log=None):
+    '''[String] -> ... -> Int
+
+    Runs the benchmarks given by the command line `argv`, writes the
+    results, and returns 1 if any regressed from the baseline, else 0.
+    Progress and the comparison go to `log`, if given.
+    '''
+    parser = argparse.ArgumentParser(description='benchmarks on synthetic genomes')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='genome sizes, in bases')
+    parser.add_argument('--gc', type=float, default=0.5, help='GC content, from 0 to 1')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3, help='runs per benchmark;  the fastest is kept')
+    parser.add_argument('--only', nargs='+', default=None, help='names of the benchmarks to run')
+    parser.add_argument('--output', default=OUTPUT, help='where to write the results (JSON)')
+    parser.add_argument('--baseline', default=BASELINE, help='results to compare against, if the file exists')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    parser.add_argument('--save-baseline', action='store_true', help='also write the results to --baseline')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.sizes, args.gc, args.seed, args.repeat, args.only, log)
+    write_results(args.output, results)
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        comparisons = compare(results, read_results(args.baseline), args.threshold)
+        if log is not None:
+            log(format_comparisons(comparisons))
+        regressions = [c for c in comparisons if c['regression']]
+    if args.save_baseline:
+        write_results(args.baseline, results)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    def log(line):
+        sys.stderr.write(line + '\n')
+    sys.exit(main(sys.argv[1:], log))
+
+
+
+########################################################
+# unit tests
+########################################################
+
+class SyntheticGenomeTest(unittest.TestCase):
+
+    def test_deterministic(self):
+        self.assertEqual(synthetic_genome(3000, 0.4, 7), synthetic_genome(3000, 0.4, 7))
+        self.assertNotEqual(synthetic_genome(3000, 0.4, 7), synthetic_genome(3000, 0.4, 8))
+
+    def test_size_and_content(self):
+        genome = synthetic_genome(10001, 0.3)
+        self.assertEqual(9999, len(genome))
+        self.assertEqual(set('ACGT'), set(genome))
+        gc = (genome.count('G') + genome.count('C')) / float(len(genome))
+        self.assertTrue(abs(gc - 0.3) < 0.02)
+
+    def test_extremes(self):
+        self.assertEqual(set('GC'), set(synthetic_genome(300, 1.0)))
+        self.assertEqual(set('AT'), set(synthetic_genome(300, 0.0)))
+
+    def test_more_than_a_chunk(self):
+        size = 2 * _CHUNK_SIZE + 4
+        genome = synthetic_genome(size)
+        self.assertEqual(size - size % 3, len(genome))
+        self.assertEqual(set('ACGT'), set(genome[-100:]))
+
+
+class BenchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.paths = []
+
+    def tearDown(self):
+        for path in self.paths:
+            os.remove(path)
+
+    def test_run(self):
+        names = [name for (name, _, _) in BENCHMARKS]
+        results = run_benchmarks([3000, 6000], repeat=1)
+        self.assertEqual(names * 2, [r['benchmark'] for r in results['results']])
+        self.assertEqual([3000] * len(names) + [6000] * len(names), [r['size'] for r in results['results']])
+        self.assertTrue(all(r['seconds'] >= 0 for r in results['results']))
+
+    def test_finder_pipeline(self):
+        genome = synthetic_genome(6000, seed=3)
+        seq = model.Sequence(genome, True)
+        orfs = seq.get_all_orfs(100) + seq.get_reverse_complement().get_all_orfs(100)
+        self.assertEqual([o.start for o in finder.filter_by_length(orfs)], [o.start for o in _finder_pipeline(genome)])
+
+    def test_compare(self):
+        baseline = {'results': [{'benchmark': 'a', 'size': 10, 'seconds': 1.0},
+                                {'benchmark': 'b', 'size': 10, 'seconds': 1.0}]}
+        results = {'results': [{'benchmark': 'a', 'size': 10, 'seconds': 1.1},
+                               {'benchmark': 'b', 'size': 10, 'seconds': 2.0},
+                               {'benchmark': 'c', 'size': 10, 'seconds': 2.0}]}
+        comparisons = compare(results, baseline)
+        self.assertEqual([('a', False), ('b', True)], [(c['benchmark'], c['regression']) for c in comparisons])
+        self.assertTrue('REGRESSION' in format_comparisons(comparisons).splitlines()[2])
+        self.assertEqual([False, False], [c['regression'] for c in compare(results, baseline, threshold=3)])
+
+    def test_main(self):
+        for _ in range(2):
+            handle, path = tempfile.mkstemp()
+            os.close(handle)
+            self.paths.append(path)
+        output, baseline = self.paths
+        os.remove(baseline)
+        args = ['--sizes', '3000', '--repeat', '1', '--only', 'kd.smooth',
+                '--output', output, '--baseline', baseline]
+        self.assertEqual(0, main(args + ['--save-baseline']))
+        self.assertEqual(read_results(output), read_results(baseline))
+        self.assertEqual(['kd.smooth'], [r['benchmark'] for r in read_results(output)['results']])
+        lines = []
+        self.assertEqual(0, main(args + ['--threshold', '1000'], lines.append))
+        # a line of progress, then the comparison with the baseline
+        self.assertEqual(2, len(lines))
+        self.assertTrue(lines[0].startswith('kd.smooth'))
+        self.assertEqual(format_comparisons(compare(read_results(output), read_results(baseline), threshold=1000)), lines[1])
+
+    def test_max_sizes(self):
+        lines = []
+        results = run_benchmarks([3000, 6000], repeat=1, names=['kd.smooth'], log=lines.append)
+        self.assertEqual([3000, 6000], [r['size'] for r in results['results']])
+        previous = MAX_SIZES.copy()
+        MAX_SIZES['kd.smooth'] = 3000
+        try:
+            results = run_benchmarks([3000, 6000], repeat=1, names=['kd.smooth'], log=lines.append)
+        finally:
+            MAX_SIZES.clear()
+            MAX_SIZES.update(previous)
+        self.assertEqual([3000], [r['size'] for r in results['results']])
+        self.assertTrue(lines[-1].endswith('skipped'))
+
+
+
+testClasses = [SyntheticGenomeTest, BenchTest]
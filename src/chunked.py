@@ -0,0 +1,146 @@
+import loader
+import model
+import packed
+import sequence
+import unittest
+
+
+
+class ReverseComplementView(object):
+
+    '''The reverse complement of `bases`, computed a slice at a time,
+       so that the reverse strand can be scanned without ever being built.
+
+       public methods:
+        - len / indexing / slicing (step 1 only)
+    '''
+
+    def __init__(self, bases):
+        self._bases = bases
+
+    def __len__(self):
+        return len(self._bases)
+
+    def __getitem__(self, index):
+        length = len(self._bases)
+        if isinstance(index, slice):
+            start, stop, step = index.indices(length)
+            assert step == 1, "only contiguous slices are supported"
+            if stop <= start:
+                return ''
+            return sequence.reverseComplement(self._bases[length - stop:length - start])
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("base index out of range")
+        return sequence.reverseComplement(self._bases[length - index - 1])
+
+
+
+def iter_orfs(bases, n, all_orfs=False, chunk_size=sequence.CHUNK_SIZE, lazy=False):
+    '''[Base] -> Int -> Generator Orf
+
+    The same Orfs, in the same order, as get_orfs (or get_all_orfs) on the
+    forward and then the reverse strand of `bases`, with only `chunk_size`
+    bases (plus the Orfs themselves) held at a time:  codons are streamed
+    a chunk at a time, and the reverse strand is complemented as it's read.
+    `bases` can be a string, a packed.PackedBases or an mmap.
+    '''
+    for (strand, is_sense) in [(bases, True), (ReverseComplementView(bases), False)]:
+        for orf in model.Sequence(strand, is_sense).iter_orfs(n, all_orfs, lazy, chunk_size):
+            yield orf
+
+
+def scan_records(path, n, all_orfs=False, chunk_size=sequence.CHUNK_SIZE, pack=True):
+    '''Path -> Int -> Generator (String, Orf)
+
+    iter_orfs on each record of a FASTA or GenBank file (each contig is
+    its own circular sequence), one record at a time.  Records are packed
+    to 2 bits per base a chunk at a time, straight out of the file's
+    mapping, so a record is only ever held packed (a quarter byte per base:
+    Orfs wrap around the contig, so the whole of it has to be kept).  With
+    `pack` off, each record is read whole into a string.
+    '''
+    for (name, pieces) in loader.read_records(path, chunks=True):
+        if pack:
+            bases = packed.PackedBases.from_chunks(pieces)
+        else:
+            bases = ''.join(pieces)
+        for orf in iter_orfs(bases, n, all_orfs, chunk_size):
+            yield name, orf
+
+
+
+########################################################
+# unit tests
+########################################################
+
+class ReverseComplementViewTest(unittest.TestCase):
+
+    def test_slices(self):
+        bases = 'AACGTTTGCAN'
+        view, reverse = ReverseComplementView(bases), sequence.reverseComplement(bases)
+        self.assertEqual(len(reverse), len(view))
+        for start in range(len(bases)):
+            self.assertEqual(reverse[start], view[start])
+            for stop in range(len(bases) + 1):
+                self.assertEqual(reverse[start:stop], view[start:stop])
+        self.assertEqual(reverse[4:], view[4:])
+        self.assertEqual(reverse[-1], view[-1])
+
+
+class ChunkedScanTest(unittest.TestCase):
+
+    def setUp(self):
+        import random
+        rand = random.Random(21)
+        self.genomes = [''.join(rand.choice('ACGT') for _ in range(length)) for length in [300, 603, 900, 1200]]
+
+    def _full(self, bases, all_orfs):
+        fwd = model.Sequence(bases, True)
+        return sum([s.get_all_orfs(5) if all_orfs else s.get_orfs(5) for s in [fwd, fwd.get_reverse_complement()]], [])
+
+    def _ends(self, orfs):
+        return [o.to_JSON_object() for o in orfs]
+
+    def test_same_as_full_scan(self):
+        for bases in self.genomes:
+            for all_orfs in [False, True]:
+                expected = self._ends(self._full(bases, all_orfs))
+                for chunk_size in [3, 30, 33, 10000]:
+                    self.assertEqual(expected, self._ends(iter_orfs(bases, 5, all_orfs, chunk_size)))
+
+    def test_packed(self):
+        bases = self.genomes[2]
+        self.assertEqual(self._ends(self._full(bases, True)),
+                         self._ends(iter_orfs(packed.PackedBases(bases), 5, True, 30)))
+
+    def test_lazy(self):
+        bases = self.genomes[1]
+        orfs = list(iter_orfs(bases, 5, True, 30, lazy=True))
+        self.assertTrue(all(isinstance(o, model.LazyOrf) for o in orfs))
+        self.assertEqual(self._ends(self._full(bases, True)), self._ends(orfs))
+
+    def test_scan_records(self):
+        import os
+        import tempfile
+        handle, path = tempfile.mkstemp()
+        os.write(handle, ('>one\n%s\n>two\n%s\n' % (self.genomes[1], self.genomes[2])).encode('ascii'))
+        os.close(handle)
+        # records read out of the file 101 bytes at a time
+        previous, loader._CHUNK_SIZE = loader._CHUNK_SIZE, 101
+        try:
+            found = list(scan_records(path, 5, all_orfs=True, chunk_size=30))
+            unpacked = list(scan_records(path, 5, all_orfs=True, chunk_size=30, pack=False))
+        finally:
+            loader._CHUNK_SIZE = previous
+            os.remove(path)
+        expected = [('one', o) for o in self._full(self.genomes[1], True)] + \
+                   [('two', o) for o in self._full(self.genomes[2], True)]
+        expected = [(name, o.to_JSON_object()) for (name, o) in expected]
+        self.assertEqual(expected, [(name, o.to_JSON_object()) for (name, o) in found])
+        self.assertEqual(expected, [(name, o.to_JSON_object()) for (name, o) in unpacked])
+
+
+
+testClasses = [ReverseComplementViewTest, ChunkedScanTest]
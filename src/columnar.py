@@ -0,0 +1,238 @@
+import model
+import unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+
+def _require_numpy():
+    if numpy is None:
+        raise ImportError("OrfColumns requires numpy to be installed")
+
+
+class OrfColumns(object):
+
+    '''Column-oriented collection of Orfs:  one typed array per field,
+       so filters are boolean masks over whole columns instead of a
+       Python call per Orf.
+
+       columns (numpy arrays, one entry per Orf):
+        - start, stop (normalized by direction, like Orf)
+        - length (in codons, not counting the stop codon)
+        - frame (codon alignment in its Sequence;  -1 if not known)
+        - is_sense
+        - any metrics added with `with_metric` / `compute_metric`
+
+       predicates (each returns a boolean mask;  combine with &, |, ~):
+        - length_between(low, high)
+        - strand(is_sense)
+        - in_frame(frame)
+        - in_window(low, high)
+        - metric_between(name, low, high)
+
+       public methods:
+        - select(mask)
+        - get_orfs / __iter__ / get_orf(i)
+        - to_collection
+    '''
+
+    def __init__(self, columns, metrics, materialize, rows):
+        _require_numpy()
+        self._columns = columns
+        self._metrics = metrics
+        self._materialize = materialize
+        self._rows = rows      # which Orf, in terms of `materialize`, each entry is
+
+    @staticmethod
+    def from_orfs(orfs):
+        '''[Orf] -> OrfColumns, keeping the Orf objects'''
+        _require_numpy()
+        orfs = list(orfs)
+        columns = {
+            'start': numpy.array([o.start for o in orfs], dtype=numpy.int64),
+            'stop': numpy.array([o.stop for o in orfs], dtype=numpy.int64),
+            'length': numpy.array([len(o.bases) // 3 for o in orfs], dtype=numpy.int64),
+            'frame': numpy.array([getattr(o, 'frame', -1) for o in orfs], dtype=numpy.int8),
+            'is_sense': numpy.array([o.is_sense for o in orfs], dtype=bool)
+        }
+        return OrfColumns(columns, {}, orfs.__getitem__, numpy.arange(len(orfs)))
+
+    @staticmethod
+    def from_collection(collection):
+        '''model.OrfCollection -> OrfColumns'''
+        return OrfColumns.from_orfs(collection.get_orfs())
+
+    @staticmethod
+    def from_sequences(seqs, width, all_orfs=False, engine='python', lazy=False):
+        '''[Sequence] -> Int -> OrfColumns
+
+        Scans the Sequences without building any Orfs;  Orfs (with
+        `width` flanking bases) are only built when asked for.
+        '''
+        _require_numpy()
+        seqs = list(seqs)
+        parts = {'seq': [], 'frame': [], 'bstart': [], 'bstop': []}
+        for (ix, seq) in enumerate(seqs):
+            ends = seq.get_orf_ends(engine=engine, all_orfs=all_orfs)
+            parts['seq'].append(numpy.repeat(numpy.int64(ix), len(ends)))
+            parts['frame'].append(numpy.array([e[0] for e in ends], dtype=numpy.int8))
+            parts['bstart'].append(numpy.array([e[1] for e in ends], dtype=numpy.int64))
+            parts['bstop'].append(numpy.array([e[2] for e in ends], dtype=numpy.int64))
+        cols = dict((k, numpy.concatenate(v) if v else numpy.array([], dtype=numpy.int64)) for (k, v) in parts.items())
+
+        lengths = numpy.array([s.get_length() for s in seqs], dtype=numpy.int64)
+        senses = numpy.array([s.is_sense() for s in seqs], dtype=bool)
+        seqLengths, isSense = lengths[cols['seq']], senses[cols['seq']]
+
+        def norm(ix):
+            return numpy.where(isSense, ix, seqLengths - ix - 1)
+
+        columns = {
+            'start': norm(cols['bstart']),
+            'stop': norm(cols['bstop']),
+            'length': ((cols['bstop'] - cols['bstart']) % seqLengths) // 3,
+            'frame': cols['frame'],
+            'is_sense': isSense
+        }
+        seqIxs, bstarts, bstops = cols['seq'], cols['bstart'], cols['bstop']
+
+        def materialize(row):
+            seq = seqs[int(seqIxs[row])]
+            build = seq.build_lazy_orf if lazy else seq.build_orf
+            return build(int(bstarts[row]), int(bstops[row]), width)
+
+        return OrfColumns(columns, {}, materialize, numpy.arange(len(bstarts)))
+
+    ##############################
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __getattr__(self, name):
+        columns = self.__dict__.get('_columns', {})
+        if name in columns:
+            return columns[name]
+        raise AttributeError(name)
+
+    def get_metric(self, name):
+        return self._metrics[name]
+
+    def with_metric(self, name, values):
+        '''a copy with an extra per-Orf metric column'''
+        values = numpy.asarray(values, dtype=numpy.float64)
+        if len(values) != len(self):
+            raise ValueError("metric <%s> needs one value per Orf" % str(name))
+        metrics = dict(self._metrics)
+        metrics[name] = values
+        return OrfColumns(self._columns, metrics, self._materialize, self._rows)
+
+    def compute_metric(self, name, f):
+        '''with_metric, calling `f` on each (materialized) Orf once'''
+        return self.with_metric(name, [f(orf) for orf in self])
+
+    ##############################
+    # predicates
+
+    def length_between(self, low=50, high=80):
+        '''same bounds as finder.filter_by_length'''
+        return (low <= self.length) & (self.length <= high)
+
+    def strand(self, is_sense):
+        return self.is_sense == bool(is_sense)
+
+    def in_frame(self, frame):
+        return self.frame == frame
+
+    def in_window(self, low, high):
+        '''Orfs whose start is in [low, high)'''
+        return (low <= self.start) & (self.start < high)
+
+    def metric_between(self, name, low, high):
+        values = self._metrics[name]
+        return (low <= values) & (values <= high)
+
+    ##############################
+
+    def select(self, mask):
+        '''the Orfs where `mask` (a boolean array or a list of positions) is set'''
+        columns = dict((k, v[mask]) for (k, v) in self._columns.items())
+        metrics = dict((k, v[mask]) for (k, v) in self._metrics.items())
+        return OrfColumns(columns, metrics, self._materialize, self._rows[mask])
+
+    def get_orf(self, i):
+        return self._materialize(int(self._rows[i]))
+
+    def __iter__(self):
+        for row in self._rows:
+            yield self._materialize(int(row))
+
+    def get_orfs(self):
+        return list(self)
+
+    def to_collection(self):
+        return model.OrfCollection(self.get_orfs())
+
+
+
+########################################################
+# unit tests
+########################################################
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class OrfColumnsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.orfs = [
+            model.Orf(14, 27, 'ACGGGGTTTCCC', 'CCC', 'ATT', True),
+            model.Orf(21, 3, 'CGAGAATAG', 'GGG', '', False),
+            model.Orf(18, 900, 'ACGGGGTTTCCCAAA', '', '', True),
+            model.Orf(45, 54, 'ACGGGGTTTCCC', '', '', False)
+        ]
+        self.cols = OrfColumns.from_orfs(self.orfs)
+        self.seq = model.Sequence('AATTAAAATAGA' + 'ATGGTGTGCTGC', False)
+
+    def test_columns(self):
+        self.assertEqual(4, len(self.cols))
+        self.assertEqual([14, 21, 18, 45], self.cols.start.tolist())
+        self.assertEqual([4, 3, 5, 4], self.cols.length.tolist())
+        self.assertEqual([True, False, True, False], self.cols.is_sense.tolist())
+
+    def test_predicates(self):
+        c = self.cols
+        self.assertEqual([14, 45], c.select(c.length_between(4, 4)).start.tolist())
+        self.assertEqual([21, 45], c.select(c.strand(False)).start.tolist())
+        self.assertEqual([14, 18], c.select(c.in_window(10, 20)).start.tolist())
+        self.assertEqual([14], c.select(c.in_window(10, 20) & c.length_between(3, 4)).start.tolist())
+        self.assertEqual([21], c.select(~c.strand(True) & ~c.in_window(40, 50)).start.tolist())
+
+    def test_yields_orfs(self):
+        selected = self.cols.select(self.cols.strand(False))
+        self.assertTrue(selected.get_orfs()[0] is self.orfs[1])
+        self.assertEqual(2, len(selected.to_collection().get_orfs()))
+
+    def test_metrics(self):
+        c = self.cols.compute_metric('gc', lambda o: o.bases.count('G') + o.bases.count('C'))
+        self.assertEqual([8.0, 4.0, 8.0, 8.0], c.get_metric('gc').tolist())
+        s = c.select(c.metric_between('gc', 0, 5))
+        self.assertEqual([4.0], s.get_metric('gc').tolist())
+        self.assertRaises(ValueError, c.with_metric, 'x', [1, 2])
+
+    def test_from_sequences(self):
+        seqs = [self.seq, self.seq.get_reverse_complement()]
+        cols = OrfColumns.from_sequences(seqs, 5, all_orfs=True)
+        orfs = self.seq.get_all_orfs(5) + self.seq.get_reverse_complement().get_all_orfs(5)
+        self.assertEqual([o.to_JSON_object() for o in orfs], [o.to_JSON_object() for o in cols])
+        self.assertEqual([len(o.bases) // 3 for o in orfs], cols.length.tolist())
+        self.assertEqual([(o.start, o.stop) for o in orfs], list(zip(cols.start.tolist(), cols.stop.tolist())))
+
+    def test_from_sequences_lazy(self):
+        cols = OrfColumns.from_sequences([self.seq], 5, all_orfs=True, lazy=True)
+        self.assertTrue(isinstance(cols.get_orf(0), model.LazyOrf))
+        self.assertEqual([o.frame for o in cols], cols.frame.tolist())
+
+
+
+testClasses = [OrfColumnsTest]
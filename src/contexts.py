@@ -0,0 +1,135 @@
+import filterer
+import model
+import bisect
+import unittest
+
+
+
+_PAD = '\0'
+
+
+def _interleave(seq, up, down, k):
+    '''bases prefix, upstream suffix (read backwards from the start codon)
+    and downstream prefix, interleaved one character at a time, so that
+    a shorter context is a prefix of a longer one'''
+    a = seq[:k].ljust(k, _PAD)
+    b = up[::-1][:k].ljust(k, _PAD)
+    c = down[:k].ljust(k, _PAD)
+    return ''.join([x + y + z for (x, y, z) in zip(a, b, c)])
+
+
+class ContextIndex(object):
+
+    '''Index of Orfs by their context:  the first `k` bases, the last `k`
+       upstream bases, and the first `k` downstream bases -- i.e. what
+       filterer.matchBases looks at.
+
+       Queries with all three parts of length `k` are a hash lookup.
+       Shorter queries fall back to a prefix search over the sorted,
+       interleaved keys (a flattened trie);  longer ones are narrowed down
+       by their first `k` characters and then checked with matchBases.
+
+       public methods:
+        - lookup(seq, up, down)
+        - lookup_many([(seq, up, down)])
+    '''
+
+    def __init__(self, orfs, k=6):
+        self._orfs = list(orfs)
+        self._k = k
+        self._exact = {}
+        keyed = []
+        for (ix, orf) in enumerate(self._orfs):
+            key = _interleave(orf.bases, orf.upstream, orf.downstream, k)
+            self._exact.setdefault(key, []).append(ix)
+            keyed.append((key, ix))
+        keyed.sort()
+        self._keys = [key for (key, _) in keyed]
+        self._ixs = [ix for (_, ix) in keyed]
+
+    @staticmethod
+    def from_collection(collection, k=6):
+        '''model.OrfCollection -> ContextIndex'''
+        return ContextIndex(collection.get_orfs(), k)
+
+    ##############################
+
+    def _prefix_ixs(self, prefix):
+        lo = bisect.bisect_left(self._keys, prefix)
+        hi = bisect.bisect_left(self._keys, prefix + '\xff')
+        return sorted(self._ixs[lo:hi])
+
+    def _candidate_ixs(self, seq, up, down):
+        k = self._k
+        if len(seq) >= k and len(up) >= k and len(down) >= k:
+            return self._exact.get(_interleave(seq, up[-k:], down, k), [])
+        m = min(len(seq), len(up), len(down))
+        return self._prefix_ixs(_interleave(seq, up[len(up) - m:], down, m))
+
+    ##############################
+
+    def __len__(self):
+        return len(self._orfs)
+
+    def lookup(self, seq, up, down):
+        '''Orfs for which filterer.matchBases(seq, up, down) holds'''
+        ixs = self._candidate_ixs(seq, up, down)
+        k = self._k
+        if not (len(seq) == len(up) == len(down) == k):
+            isMatch = filterer.matchBases(seq, up, down)
+            ixs = [ix for ix in ixs if isMatch(self._orfs[ix])]
+        return [self._orfs[ix] for ix in ixs]
+
+    def lookup_many(self, queries):
+        '''[(seq, up, down)] -> [[Orf]], each distinct query looked up once'''
+        results = {}
+        for query in queries:
+            if query not in results:
+                results[query] = self.lookup(*query)
+        return [results[query] for query in queries]
+
+
+
+########################################################
+# unit tests
+########################################################
+
+class ContextIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.orfs = [
+            model.Orf(1, 10, 'ATGAAACCC', 'GGATAAAG', 'TAATTC', True),
+            model.Orf(2, 11, 'ATGAAATTT', 'CCATAAAG', 'TAATTG', True),
+            model.Orf(3, 12, 'ATGCTTCCC', 'TTTTTT', 'TAGTTT', False),
+            model.Orf(4, 13, 'GTG', 'AG', 'TGA', True)
+        ]
+        self.index = ContextIndex.from_collection(model.OrfCollection(self.orfs), k=6)
+
+    def _naive(self, seq, up, down):
+        return list(filter(filterer.matchBases(seq, up, down), self.orfs))
+
+    def test_exact(self):
+        self.assertEqual([self.orfs[0]], self.index.lookup('ATGAAA', 'ATAAAG', 'TAATTC'))
+        self.assertEqual([], self.index.lookup('ATGAAA', 'ATAAAG', 'TAATTA'))
+
+    def test_same_as_match_bases(self):
+        queries = [
+            ('ATGAAA', 'ATAAAG', 'TAATT'),
+            ('ATG', 'AG', 'TAA'),
+            ('ATGAAACC', 'GGATAAAG', 'TAATTC'),
+            ('', '', ''),
+            ('G', '', 'T'),
+            ('GTG', 'AG', 'TGA'),
+            ('GTGA', 'AG', 'TGA'),
+            ('ATGCTTCCC', 'TTTTTTT', 'TAG')
+        ]
+        for query in queries:
+            self.assertEqual(self._naive(*query), self.index.lookup(*query))
+
+    def test_lookup_many(self):
+        queries = [('ATG', 'AAG', 'TAA'), ('ATGCTT', 'TTTTTT', 'TAGTTT'), ('ATG', 'AAG', 'TAA')]
+        self.assertEqual([self._naive(*q) for q in queries], self.index.lookup_many(queries))
+
+
+
+testClasses = [ContextIndexTest]
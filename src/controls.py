@@ -1,5 +1,5 @@
 import finder
-import filterer
+import contexts
 import model
 import unittest
 
@@ -24,10 +24,10 @@ class ControlTest(unittest.TestCase):
     
     def test_find_positives(self):
         orfs = finder.get_all_medium_orfs(100)
-        oas = model.OrfCollection(orfs)
-        for (up, seq, down, ix, is_sense) in positives:
+        index = contexts.ContextIndex.from_collection(model.OrfCollection(orfs))
+        queries = [(seq, up, down) for (up, seq, down, _, _) in positives]
+        for ((up, seq, down, ix, is_sense), matches) in zip(positives, index.lookup_many(queries)):
             print "trying", up, seq, down, ix
-            matches = oas.filter(filterer.matchBases(seq=seq, up=up, down=down)).get_orfs()
             self.assertEqual(len(matches), 1)
             self.assertEqual(matches[0].start, ix)
             self.assertEqual(matches[0].is_sense, is_sense)
@@ -1,7 +1,6 @@
 import kd         as kd
-import translate
+import model
 import peaks
-import sequence
 import unittest
 
 
@@ -21,8 +20,7 @@ def hasHighPhobicPeak(orf,
                       windowRadius  = 9, 
                       minHeight = 2.0, 
                       algorithm = kd.triangleKyteDoolittle):
-    residues = translate.codonsToResidues(sequence.makeCodons(orf.bases))
-    phobicity = algorithm(residues, windowRadius)
+    phobicity = orf.get_phobicity(algorithm, windowRadius)     # memoized:  see model.derived
     return len(filter(lambda x: x > minHeight, phobicity)) > 0
   
     
@@ -32,8 +30,7 @@ def hasNPhobicPeaks(orf,
                     peakRadius = 9, 
                     kdRadius   = 9, 
                     algorithm  = kd.triangleKyteDoolittle):
-    residues = translate.codonsToResidues(sequence.makeCodons(orf.bases))
-    pks = peaks.get1DPeaks(algorithm(residues, windowRadius, peakRadius))
+    pks = orf.get_phobicity_peaks(algorithm, kdRadius, peakRadius)
     highPeaks = filter(lambda p: p['height'] >= minHeight, pks)
     return len(highPeaks) == numPeaks
 
@@ -64,6 +61,22 @@ class FiltersTest(unittest.TestCase):
     def testOne(self):
         self.assertTrue(False)
 
+    def testPhobicPeaks(self):
+        orf = model.Orf(0, 60, 'ATG' + 'ATTCTGGTT' * 3 + 'GATGAAAAA' * 3 + 'CTGATTTTT' * 3, '', '', True)
+        self.assertTrue(hasHighPhobicPeak(orf, windowRadius=2, minHeight=3.5))
+        self.assertFalse(hasHighPhobicPeak(orf, windowRadius=2, minHeight=4.5))
+        pks = peaks.find1DPeaks(kd.kyteDoolittle(orf.get_residues(), 2), 3)
+        high = len([p for p in pks if p['height'] >= 1.5])
+        self.assertTrue(hasNPhobicPeaks(orf, high, 1.5, 3, 2, kd.kyteDoolittle))
+        self.assertFalse(hasNPhobicPeaks(orf, high + 1, 1.5, 3, 2, kd.kyteDoolittle))
+
+    def testGoesThroughDerivedCache(self):
+        orf = model.Orf(0, 30, 'ATGCTGATTGTTATTTTTCTGGCTGTGATT', '', '', True)
+        before = model.derived.misses
+        hasHighPhobicPeak(orf, windowRadius=2)
+        hasNPhobicPeaks(orf, kdRadius=2, peakRadius=2)
+        self.assertEqual(before + 4, model.derived.misses)
+
 
     
 
@@ -1,39 +1,94 @@
-import bacillussubtilis168 as bs
+import chunked
+import loader
 import model
+import parallel
 import unittest
 
 
 
-def find_orfs(n):
-    ''' () -> ([Orf], [Orf]) '''
-    seq = model.Sequence(bs.bases, True)
-    return [seq.get_orfs(n), seq.get_reverse_complement().get_orfs(n)]
+_cache = None
 
+def set_cache(cache):
+    '''scancache.ResultCache that results of find_orfs, find_all_orfs,
+    get_medium_orfs and get_all_medium_orfs are kept in, keyed by the
+    genome, the scan and `n`;  off (None) unless it's set.  A hit gives
+    scancache.CachedOrfs (LazyOrfs, built as they're asked for) where a
+    scan gives lists.'''
+    global _cache
+    _cache = cache
 
-def find_all_orfs(n):
+
+def _cached(mode, n, compute, parts):
+    if _cache is None:
+        return compute()
+    return _cache.get_or_compute(loader.get_genome(), mode, n, compute, parts)
+
+
+
+def find_orfs(n, processes=1):
+    ''' () -> ([Orf], [Orf])
+
+    With `processes` other than 1, the 6 alignments are scanned in a
+    process pool (None:  one worker per CPU);  the result is the same.
+    '''
+    def scan():
+        if processes != 1:
+            return list(parallel.scan_genomes([loader.get_genome()], n, processes=processes)[0])
+        seq = model.Sequence(loader.get_genome(), True)
+        return [seq.get_orfs(n), seq.get_reverse_complement().get_orfs(n)]
+    return _cached('longest', n, scan, 2)
+
+
+def find_all_orfs(n, processes=1):
     ''' () -> [Orf] '''
-    seq = model.Sequence(bs.bases, True)
-    return seq.get_all_orfs(n) + seq.get_reverse_complement().get_all_orfs(n)
+    def scan():
+        if processes != 1:
+            forward, reverse = parallel.scan_genomes([loader.get_genome()], n, all_orfs=True, processes=processes)[0]
+            return [forward + reverse]
+        seq = model.Sequence(loader.get_genome(), True)
+        return [seq.get_all_orfs(n) + seq.get_reverse_complement().get_all_orfs(n)]
+    return _cached('all', n, scan, 1)[0]
     
 
 
+def iter_all_orfs(n):
+    ''' () -> Generator Orf:  same Orfs as find_all_orfs, one at a time,
+    streamed off the genome (see chunked.iter_orfs) '''
+    return chunked.iter_orfs(loader.get_genome(), n, all_orfs=True)
+
+
+
 def filter_by_length(orfs, low = 50, high = 80):
     return [orf for orf in orfs if low <= (len(orf.bases) / 3) <= high]
 
 
+def iter_by_length(orfs, low = 50, high = 80):
+    '''filter_by_length, as a generator'''
+    return (orf for orf in orfs if low <= (len(orf.bases) / 3) <= high)
+
+
 def get_medium_orfs(n):
-    f, r = find_orfs(n)
+    def scan():
+        f, r = find_orfs(n)
     
-    med_Fors = filter_by_length(f)
-    med_Revs = filter_by_length(r)
+        med_Fors = filter_by_length(f)
+        med_Revs = filter_by_length(r)
     
-    return [med_Fors, med_Revs]
+        return [med_Fors, med_Revs]
+    return _cached('medium', n, scan, 2)
 
 
 def get_all_medium_orfs(n):
     '''() -> [Orf]'''
-    orfs = find_all_orfs(n)
-    return filter_by_length(orfs)
+    def scan():
+        orfs = find_all_orfs(n)
+        return [filter_by_length(orfs)]
+    return _cached('all-medium', n, scan, 1)[0]
+
+
+def iter_all_medium_orfs(n):
+    '''() -> Generator Orf'''
+    return iter_by_length(iter_all_orfs(n))
 
 
 
@@ -58,7 +113,7 @@ class OrfFinderTest(unittest.TestCase):
         orfs = find_all_orfs(5)
         self.assertEqual(561841, len(orfs))
         
-        seq, rev = bs.bases, model.Sequence(bs.bases, True).get_reverse_complement().get_bases()
+        seq, rev = loader.get_genome(), model.Sequence(loader.get_genome(), True).get_reverse_complement().get_bases()
         starts = set(["ATG", "TTG", "CTG", "GTG"])
         
         i, j, ct = 0, 0, 0
@@ -83,6 +138,36 @@ class OrfFinderTest(unittest.TestCase):
     def testFilteredAllOrfs(self):
         orfs = get_all_medium_orfs(5)
         self.assertEqual(42302, len(orfs))
+
+
+    def testParallel(self):
+        ends = lambda orfs: [(o.start, o.stop, o.is_sense) for o in orfs]
+        previous = _cache
+        set_cache(None)     # or both sides would come out of the cache
+        try:
+            self.assertEqual(map(ends, find_orfs(5)), map(ends, find_orfs(5, processes=None)))
+            self.assertEqual(ends(find_all_orfs(5)), ends(find_all_orfs(5, processes=4)))
+        finally:
+            set_cache(previous)
+
+    def testCache(self):
+        import scancache
+        import shutil
+        import tempfile
+        ends = lambda orfs: [(o.start, o.stop, o.bases, o.is_sense) for o in orfs]
+        directory, previous = tempfile.mkdtemp(), _cache
+        try:
+            set_cache(scancache.ResultCache(directory))
+            first, second = get_medium_orfs(5), get_medium_orfs(5)
+            self.assertEqual(map(ends, first), map(ends, second))
+            self.assertEqual(12220, sum(map(len, second)))
+            self.assertEqual(1, _cache.hits)
+        finally:
+            set_cache(previous)
+            shutil.rmtree(directory)
+
+    def testIterAllMediumOrfs(self):
+        self.assertEqual(42302, sum(1 for _ in iter_all_medium_orfs(5)))
         
 
     
@@ -0,0 +1,326 @@
+import sequence
+import array
+import hashlib
+import os
+import struct
+import tempfile
+import unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+
+_MAGIC = b'FMIX1\n'
+_HEADER = struct.Struct('<40sQQI')
+
+# the strands are joined as  forward + _SEPARATOR + reverse + _END;
+# neither is ever part of a pattern, so no match spans the two strands
+_SEPARATOR = '\x01'
+_END = '\x00'
+
+# one stored occurrence count per this many BWT characters
+_STEP = 128
+
+
+def _to_str(data):
+    if isinstance(data, str):
+        return data
+    return data.decode('latin-1')
+
+
+def _to_bytes(text):
+    if isinstance(text, bytes):
+        return text
+    return text.encode('latin-1')
+
+
+def _digest(bases):
+    return hashlib.sha1(_to_bytes(bases)).hexdigest()
+
+
+def directSuffixArray(text):
+    '''[Char] -> [Int]:  reference version, sorting the suffixes themselves'''
+    return sorted(range(len(text)), key=lambda i: text[i:])
+
+
+def _pythonSuffixArray(text):
+    '''prefix doubling:  sort by the first k characters, then 2k, ...'''
+    n = len(text)
+    rank = [ord(c) for c in text]
+    sa = list(range(n))
+    k = 1
+    while True:
+        def key(i):
+            return (rank[i], rank[i + k] if i + k < n else -1)
+        sa.sort(key=key)
+        new = [0] * n
+        for j in range(1, n):
+            new[sa[j]] = new[sa[j - 1]] + (key(sa[j]) != key(sa[j - 1]))
+        rank = new
+        if n == 0 or rank[sa[-1]] == n - 1:
+            return sa
+        k *= 2
+
+
+def _numpySuffixArray(text):
+    '''prefix doubling, one argsort over whole columns per round:
+    each suffix's (rank, rank k further on) pair packed into one int64'''
+    n = len(text)
+    if n == 0:
+        return numpy.array([], dtype=numpy.int64)
+    rank = numpy.frombuffer(_to_bytes(text), dtype=numpy.uint8).astype(numpy.int64)
+    k = 1
+    while True:
+        second = numpy.zeros(n, dtype=numpy.int64)
+        second[:n - k] = rank[k:] + 1
+        keys = rank * (int(rank.max()) + 2) + second
+        order = numpy.argsort(keys, kind='mergesort')
+        sortedKeys = keys[order]
+        new = numpy.empty(n, dtype=numpy.int64)
+        new[order] = numpy.concatenate(([0], numpy.cumsum(sortedKeys[1:] != sortedKeys[:-1])))
+        rank = new
+        if rank[order[-1]] == n - 1:
+            return order
+        k *= 2
+
+
+def suffixArray(text):
+    '''[Char] -> array of Int:  start of each suffix of `text`, in sorted order'''
+    if numpy is not None:
+        return array.array('i', _numpySuffixArray(text).astype(numpy.int32).tobytes())
+    return array.array('i', _pythonSuffixArray(text))
+
+
+
+class FMIndex(object):
+
+    '''FM-index over both strands of a genome:  the Burrows-Wheeler
+       transform of  forward + reverse complement, its suffix array, and
+       occurrence counts every _STEP characters.
+
+       A pattern is matched backwards, one character at a time, so
+       `count` takes time proportional to the pattern's length;  `locate`
+       adds one step per occurrence.
+
+       Positions are (is_sense, index), where index is into that strand's
+       bases -- i.e. what `bases.find` or `reverseComplement(bases).find`
+       would report.
+
+       public methods:
+        - count(pattern)
+        - locate(pattern)
+        - is_unique(pattern)
+        - find_once(pattern, is_sense)
+        - save(path)  /  FMIndex.load(path)  /  FMIndex.load_or_build(bases, path)
+    '''
+
+    def __init__(self, bases, _parts=None):
+        if _parts is None:
+            text = bases + _SEPARATOR + sequence.reverseComplement(bases) + _END
+            sa = suffixArray(text)
+            bwt = ''.join([text[i - 1] for i in sa])
+            _parts = (_digest(bases), len(bases), bwt, sa)
+        self._digest, self._length, self._bwt, self._sa = _parts
+        self._build_counts()
+
+    def _build_counts(self):
+        bwt = self._bwt
+        alphabet = sorted(set(bwt))
+        # _first[c]:  how many characters in the text sort before c
+        self._first, total = {}, 0
+        for c in alphabet:
+            self._first[c] = total
+            total += bwt.count(c)
+        self._occ = {}
+        for c in alphabet:
+            counts, running = array.array('i', [0]), 0
+            for start in range(0, len(bwt), _STEP):
+                running += bwt.count(c, start, start + _STEP)
+                counts.append(running)
+            self._occ[c] = counts
+
+    def _rank(self, c, i):
+        '''occurrences of c in bwt[:i]'''
+        block = i // _STEP
+        return self._occ[c][block] + self._bwt.count(c, block * _STEP, i)
+
+    def _range(self, pattern):
+        '''[lo, hi) of the suffix array rows that start with `pattern`'''
+        lo, hi = 0, len(self._bwt)
+        for c in reversed(pattern):
+            if c not in self._first:
+                return (0, 0)
+            lo = self._first[c] + self._rank(c, lo)
+            hi = self._first[c] + self._rank(c, hi)
+            if lo >= hi:
+                return (0, 0)
+        return (lo, hi)
+
+    ##############################
+
+    @staticmethod
+    def load(path):
+        '''Path -> FMIndex, as written by `save`'''
+        with open(path, 'rb') as infile:
+            if infile.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError("<%s> is not an FMIndex file" % str(path))
+            digest, length, size, step = _HEADER.unpack(infile.read(_HEADER.size))
+            if step != _STEP:
+                raise ValueError("<%s> was written with a different occurrence step" % str(path))
+            bwt = _to_str(infile.read(size))
+            sa = array.array('i')
+            sa.fromfile(infile, size)
+        return FMIndex(None, (_to_str(digest), length, bwt, sa))
+
+    @staticmethod
+    def load_or_build(bases, path):
+        '''[Base] -> Path -> FMIndex
+
+        Loads the index saved at `path` if it was built from `bases`,
+        otherwise builds it and saves it there.
+        '''
+        if os.path.exists(path):
+            try:
+                index = FMIndex.load(path)
+                if index._digest == _digest(bases):
+                    return index
+            except (ValueError, EOFError, struct.error):
+                pass
+        index = FMIndex(bases)
+        index.save(path)
+        return index
+
+    def save(self, path):
+        '''written to a temporary file first, so a reader never sees half of it'''
+        handle, temp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+        with os.fdopen(handle, 'wb') as outfile:
+            outfile.write(_MAGIC)
+            outfile.write(_HEADER.pack(_to_bytes(self._digest), self._length, len(self._bwt), _STEP))
+            outfile.write(_to_bytes(self._bwt))
+            self._sa.tofile(outfile)
+        os.rename(temp, path)
+
+    ##############################
+
+    def __len__(self):
+        '''length of one strand'''
+        return self._length
+
+    def count(self, pattern):
+        '''Int:  occurrences on both strands'''
+        lo, hi = self._range(pattern)
+        return hi - lo
+
+    def locate(self, pattern):
+        '''[(Bool, Int)]:  every occurrence on both strands, sorted'''
+        lo, hi = self._range(pattern)
+        hits = []
+        for i in self._sa[lo:hi]:
+            if i < self._length:
+                hits.append((True, i))
+            else:
+                hits.append((False, i - self._length - 1))
+        hits.sort(key=lambda hit: (not hit[0], hit[1]))
+        return hits
+
+    def is_unique(self, pattern):
+        '''Bool:  does `pattern` occur exactly once, on either strand?'''
+        return self.count(pattern) == 1
+
+    def find_once(self, pattern, is_sense=True):
+        '''Int:  like peters.find_once on one strand -- the position if it
+        occurs once, -1 if not at all, None if more than once'''
+        hits = [i for (sense, i) in self.locate(pattern) if sense == is_sense]
+        if len(hits) > 1:
+            return None
+        return hits[0] if hits else -1
+
+
+
+########################################################
+# unit tests
+########################################################
+
+class SuffixArrayTest(unittest.TestCase):
+
+    def test_suffix_array(self):
+        import random
+        rand = random.Random(3)
+        for text in ['', 'A', 'banana', 'AAAAAAAA', 'ACGTACGTAC\x00']:
+            self.assertEqual(directSuffixArray(text), list(suffixArray(text)))
+            self.assertEqual(directSuffixArray(text), _pythonSuffixArray(text))
+        for _ in range(20):
+            text = ''.join(rand.choice('ACGT') for _ in range(rand.randint(1, 200))) + '\x00'
+            self.assertEqual(directSuffixArray(text), list(suffixArray(text)))
+            self.assertEqual(directSuffixArray(text), _pythonSuffixArray(text))
+
+
+class FMIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        import random
+        rand = random.Random(11)
+        self.bases = ''.join(rand.choice('ACGT') for _ in range(600)) + 'NNACGT'
+        self.reverse = sequence.reverseComplement(self.bases)
+        self.index = FMIndex(self.bases)
+        self.paths = []
+
+    def tearDown(self):
+        for path in self.paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _naive(self, pattern):
+        hits = []
+        for (is_sense, bases) in [(True, self.bases), (False, self.reverse)]:
+            hits.extend((is_sense, i) for i in range(len(bases)) if bases.startswith(pattern, i))
+        return hits
+
+    def test_count_and_locate(self):
+        for pattern in ['A', 'ACG', 'GATTACA', 'TTT', 'NNA', 'ACGTN', self.bases[100:120], 'X']:
+            self.assertEqual(self._naive(pattern), self.index.locate(pattern))
+            self.assertEqual(len(self._naive(pattern)), self.index.count(pattern))
+
+    def test_is_unique(self):
+        self.assertTrue(self.index.is_unique(self.bases[200:230]))
+        self.assertTrue(self.index.is_unique(self.reverse[10:40]))
+        self.assertFalse(self.index.is_unique('A'))
+        self.assertFalse(self.index.is_unique('GGGGGGGGGGGG'))
+
+    def test_no_match_across_strands(self):
+        self.assertEqual(0, self.index.count(self.bases[-3:] + self.reverse[:3]))
+
+    def test_find_once(self):
+        self.assertEqual(200, self.index.find_once(self.bases[200:230]))
+        self.assertEqual(-1, self.index.find_once(self.reverse[10:40]))
+        self.assertEqual(10, self.index.find_once(self.reverse[10:40], is_sense=False))
+        self.assertEqual(None, self.index.find_once('A'))
+
+    def test_save_and_load(self):
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        self.paths.append(path)
+        self.index.save(path)
+        loaded = FMIndex.load(path)
+        self.assertEqual(len(self.bases), len(loaded))
+        for pattern in ['ACG', 'NN', self.bases[50:70]]:
+            self.assertEqual(self.index.locate(pattern), loaded.locate(pattern))
+
+    def test_load_or_build(self):
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        self.paths.append(path)
+        self.assertRaises(ValueError, FMIndex.load, path)
+        first = FMIndex.load_or_build(self.bases, path)
+        self.assertEqual(self.index.locate('ACGT'), first.locate('ACGT'))
+        # rebuilt, since the saved one is for different bases
+        other = FMIndex.load_or_build('ACGTTT', path)
+        self.assertEqual([(True, 2)], other.locate('GTT'))
+        self.assertEqual([(True, 2)], FMIndex.load_or_build('ACGTTT', path).locate('GTT'))
+
+
+
+testClasses = [SuffixArrayTest, FMIndexTest]
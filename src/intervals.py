@@ -0,0 +1,219 @@
+import model
+import sequence
+import unittest
+
+
+
+def orf_span(orf, length, with_stop=False):
+    '''Orf -> Int -> [(Int, Int)]
+
+    The forward-strand bases [lo, hi) covered by an Orf, as one piece,
+    or two pieces if it wraps around the end of the circular genome.
+    Works for either strand:  antisense Orfs have start > stop
+    (see Sequence._get_norm_index).
+    '''
+    if orf.is_sense:
+        lo, hi = orf.start, orf.stop + (3 if with_stop else 0)
+    else:
+        lo, hi = orf.stop + 1 - (3 if with_stop else 0), orf.start + 1
+    lo, hi = lo % length, hi % length
+    if hi > lo:
+        return [(lo, hi)]
+    return [piece for piece in [(lo, length), (0, hi)] if piece[1] > piece[0]]
+
+
+
+class _Node(object):
+
+    __slots__ = ('center', 'by_lo', 'by_hi', 'left', 'right')
+
+    def __init__(self, center, intervals, left, right):
+        self.center = center
+        self.by_lo = sorted(intervals)
+        self.by_hi = sorted(intervals, key=lambda i: i[1], reverse=True)
+        self.left = left
+        self.right = right
+
+
+def _build(intervals):
+    '''centered interval tree over (lo, hi, ix) triples'''
+    if not intervals:
+        return None
+    centers = sorted((lo + hi - 1) // 2 for (lo, hi, _) in intervals)
+    center = centers[len(centers) // 2]
+    here, left, right = [], [], []
+    for interval in intervals:
+        lo, hi, _ = interval
+        if hi <= center:
+            left.append(interval)
+        elif lo > center:
+            right.append(interval)
+        else:
+            here.append(interval)
+    return _Node(center, here, _build(left), _build(right))
+
+
+
+class IntervalIndex(object):
+
+    '''Index over the forward-strand footprints of a set of Orfs on a
+       circular genome of length `length`, for point, range and overlap
+       queries in O(log n + k).
+
+       Query coordinates are forward-strand base indices (the same
+       numbering as Orf.start and Orf.stop);  a range [lo, hi) with
+       hi <= lo wraps around the end of the genome.
+
+       public methods:
+        - at(position)
+        - overlapping(lo, hi)
+        - within(lo, hi)
+        - overlapping_orf(orf)
+    '''
+
+    def __init__(self, orfs, length, with_stop=False):
+        self._orfs = list(orfs)
+        self._length = length
+        self._with_stop = with_stop
+        intervals = []
+        for (ix, orf) in enumerate(self._orfs):
+            for (lo, hi) in orf_span(orf, length, with_stop):
+                intervals.append((lo, hi, ix))
+        self._root = _build(intervals)
+
+    @staticmethod
+    def from_collection(collection, length, with_stop=False):
+        '''model.OrfCollection -> Int -> IntervalIndex'''
+        return IntervalIndex(collection.get_orfs(), length, with_stop)
+
+    ##############################
+
+    def _query(self, qlo, qhi, found):
+        '''adds the indices of intervals overlapping linear [qlo, qhi) to `found`'''
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            if qhi <= node.center:
+                for (lo, _, ix) in node.by_lo:
+                    if lo >= qhi:
+                        break
+                    found.add(ix)
+                stack.append(node.left)
+            elif qlo > node.center:
+                for (_, hi, ix) in node.by_hi:
+                    if hi <= qlo:
+                        break
+                    found.add(ix)
+                stack.append(node.right)
+            else:
+                found.update(ix for (_, _, ix) in node.by_lo)
+                stack.append(node.left)
+                stack.append(node.right)
+
+    def _pieces(self, lo, hi):
+        lo, hi = lo % self._length, hi % self._length
+        if hi > lo:
+            return [(lo, hi)]
+        return [piece for piece in [(lo, self._length), (0, hi)] if piece[1] > piece[0]]
+
+    def _overlapping_ixs(self, lo, hi, is_sense):
+        found = set()
+        for (qlo, qhi) in self._pieces(lo, hi):
+            self._query(qlo, qhi, found)
+        ixs = sorted(found)
+        if is_sense is not None:
+            ixs = [ix for ix in ixs if self._orfs[ix].is_sense == is_sense]
+        return ixs
+
+    ##############################
+
+    def __len__(self):
+        return len(self._orfs)
+
+    def at(self, position, is_sense=None):
+        '''Orfs covering base `position`'''
+        return self.overlapping(position, position + 1, is_sense)
+
+    def overlapping(self, lo, hi, is_sense=None):
+        '''Orfs sharing at least one base with [lo, hi)'''
+        return [self._orfs[ix] for ix in self._overlapping_ixs(lo, hi, is_sense)]
+
+    def within(self, lo, hi, is_sense=None):
+        '''Orfs lying entirely inside [lo, hi)'''
+        query = self._pieces(lo, hi)
+        def inside(orf):
+            for (olo, ohi) in orf_span(orf, self._length, self._with_stop):
+                if not any(qlo <= olo and ohi <= qhi for (qlo, qhi) in query):
+                    return False
+            return True
+        return [self._orfs[ix] for ix in self._overlapping_ixs(lo, hi, is_sense) if inside(self._orfs[ix])]
+
+    def overlapping_orf(self, orf, is_sense=None):
+        '''Orfs sharing at least one base with `orf` (including itself, if indexed)'''
+        found = set()
+        for (qlo, qhi) in orf_span(orf, self._length, self._with_stop):
+            self._query(qlo, qhi, found)
+        return [self._orfs[ix] for ix in sorted(found)
+                if is_sense is None or self._orfs[ix].is_sense == is_sense]
+
+
+
+########################################################
+# unit tests
+########################################################
+
+class IntervalIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.length = 30
+        self.orfs = [
+            model.Orf(2, 14, 'A' * 12, '', '', True),      # [2, 14)
+            model.Orf(24, 3, 'A' * 9, '', '', True),       # [24, 30) + [0, 3)
+            model.Orf(13, 4, 'A' * 9, '', '', False),      # [5, 14)
+            model.Orf(4, 25, 'A' * 9, '', '', False),      # [26, 30) + [0, 5)
+            model.Orf(18, 21, 'AAA', '', '', True)         # [18, 21)
+        ]
+        self.index = IntervalIndex.from_collection(model.OrfCollection(self.orfs), self.length)
+
+    def _naive(self, lo, hi):
+        query = set(range(lo, hi) if hi > lo else list(range(lo, self.length)) + list(range(0, hi)))
+        return [o for o in self.orfs
+                if any(query.intersection(range(a, b)) for (a, b) in orf_span(o, self.length))]
+
+    def test_orf_span(self):
+        self.assertEqual([[(2, 14)], [(24, 30), (0, 3)], [(5, 14)], [(26, 30), (0, 5)], [(18, 21)]],
+                         [orf_span(o, self.length) for o in self.orfs])
+        self.assertEqual([(2, 17)], orf_span(self.orfs[0], self.length, with_stop=True))
+        self.assertEqual([(2, 14)], orf_span(self.orfs[2], self.length, with_stop=True))
+
+    def test_orf_span_from_sequence(self):
+        seq = model.Sequence('GAGC' + 'TAGCATCGA' + 'TCGAT', False)
+        orf = seq.build_orf(4, 13, 2)
+        (lo, hi), = orf_span(orf, 18)
+        self.assertEqual(orf.bases, sequence.reverseComplement(seq.get_reverse_complement().get_bases()[lo:hi]))
+
+    def test_at(self):
+        self.assertEqual([self.orfs[1], self.orfs[3]], self.index.at(0))
+        self.assertEqual([self.orfs[0], self.orfs[2]], self.index.at(13))
+        self.assertEqual([], self.index.at(15))
+        self.assertEqual([self.orfs[2]], self.index.at(13, is_sense=False))
+
+    def test_overlapping(self):
+        for lo in range(self.length):
+            for hi in range(self.length):
+                if lo != hi:
+                    self.assertEqual(self._naive(lo, hi), self.index.overlapping(lo, hi))
+
+    def test_within(self):
+        self.assertEqual([self.orfs[2], self.orfs[4]], self.index.within(4, 22))
+        self.assertEqual([self.orfs[1], self.orfs[3]], self.index.within(24, 6))
+
+    def test_overlapping_orf(self):
+        self.assertEqual([self.orfs[0], self.orfs[2]], self.index.overlapping_orf(self.orfs[2]))
+        self.assertEqual([self.orfs[0], self.orfs[1], self.orfs[3]], self.index.overlapping_orf(self.orfs[1]))
+
+
+
+testClasses = [IntervalIndexTest]
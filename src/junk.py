@@ -1,23 +1,109 @@
 import finder
 import model
+import orflines
+import orfstore
 import json
+import os
+import re
+import sys
+import tempfile
 import unittest
 
 
 
+def _is_json_lines(path):
+    return path.endswith('.jsonl') or path.endswith('.jsonl.gz')
+
+
+_BLANKS = re.compile(r'\s*')
+
+
+def _iter_json_array(infile, chunk_size=1 << 16):
+    '''File -> Generator a
+
+    The items of the JSON array in `infile`, each decoded as soon as it's
+    been read, so the whole file is never held.
+    '''
+    decoder = json.JSONDecoder()
+    buf, pos, eof = '', 0, False
+    expecting = '['         # then 'first' (an item or ']'), ',' (or ']'), 'item'
+    while True:
+        pos = _BLANKS.match(buf, pos).end()
+        if pos == len(buf):
+            if eof:
+                raise ValueError("JSON array isn't closed")
+            buf, pos = infile.read(chunk_size), 0
+            eof = not buf
+            continue
+        char = buf[pos]
+        if expecting in ['[', ','] or (char == ']' and expecting == 'first'):
+            if char == ']' and expecting != '[':
+                return
+            if char != expecting:
+                raise ValueError("expected '%s' in JSON array, at <%s>" % (expecting, buf[pos:pos + 20]))
+            pos += 1
+            expecting = 'first' if char == '[' else 'item'
+            continue
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except ValueError:
+            if eof:
+                raise
+            end = None
+        if end is None or (end == len(buf) and not eof):
+            # cut off by the end of the chunk (a number might be):  read more
+            chunk = infile.read(chunk_size)
+            eof = not chunk
+            buf, pos = buf[pos:] + chunk, 0
+            continue
+        yield item
+        pos, expecting = end, ','
+
+
+def iter_orfs(path):
+    '''Path -> Generator Orf
+
+    Reads any format, yielding each Orf as it's read:  a binary Orf store
+    (see orfstore) is memory-mapped, and closed once the generator is done;
+    JSON Lines (see orflines, .jsonl or .jsonl.gz) is read a line at a time;
+    JSON is decoded an Orf at a time.
+    '''
+    if orfstore.is_orf_store(path):
+        with orfstore.OrfStore(path) as store:
+            for orf in store:
+                yield orf
+    elif _is_json_lines(path):
+        for orf in orflines.read_orfs(path):
+            yield orf
+    else:
+        with open(path, 'r') as infile:
+            for obj in _iter_json_array(infile):
+                yield model.Orf.from_JSON_object(obj)
+
+
 def load_orfs(path):
-    infile = open(path, 'r')
-    orfs = json.loads(infile.read())
-    infile.close()
-    return model.OrfCollection([model.Orf.from_JSON_object(o) for o in orfs])
+    '''Path -> OrfCollection:  all of iter_orfs(path)'''
+    return model.OrfCollection(list(iter_orfs(path)))
     
     
 def find_all_medium_orfs():
     return [x.to_JSON_object() for x in finder.get_all_medium_orfs(100)]
 
 
+def save_medium_orfs(path):
+    '''writes the medium Orfs as JSON Lines if `path` ends in .jsonl or
+    .jsonl.gz (streamed straight from the scanner), otherwise as a binary
+    Orf store;  returns how many'''
+    if _is_json_lines(path):
+        return orflines.write_orfs(path, finder.iter_all_medium_orfs(100))
+    return orfstore.write_orfs(path, finder.iter_all_medium_orfs(100))
+
+
 if __name__ == "__main__":
-    print json.dumps(find_all_medium_orfs())
+    if len(sys.argv) > 1:
+        print save_medium_orfs(sys.argv[1])
+    else:
+        print json.dumps(find_all_medium_orfs())
     
     
     
@@ -33,6 +119,27 @@ class JunkTest(unittest.TestCase):
         path = '../allmediumorfs.txt'
         orfColl = load_orfs(path)
         self.assertEqual(len(orfColl.get_orfs()), 42302)
+
+    def test_iter_orfs(self):
+        orfs = [model.Orf(14, 27, 'ACGGGGTTTCCC', 'CCC', 'ATT', True), model.Orf(21, 3, 'CGAGAATAG', 'GGG', '', False)]
+        handle, path = tempfile.mkstemp()
+        try:
+            with os.fdopen(handle, 'w') as outfile:
+                json.dump([o.to_JSON_object() for o in orfs], outfile, indent=1)
+            expected = [o.to_JSON_object() for o in orfs]
+            self.assertEqual(expected, [o.to_JSON_object() for o in iter_orfs(path)])
+            self.assertEqual(expected, [o.to_JSON_object() for o in load_orfs(path).get_orfs()])
+        finally:
+            os.remove(path)
+
+    def test_iter_json_array(self):
+        import io
+        for items in [[], [1], [{'a': [1, 2]}, 'x]', 12345, None, [], {}]]:
+            text = json.dumps(items)
+            for size in [1, 2, 3, 100]:
+                self.assertEqual(items, list(_iter_json_array(io.StringIO(type(u'')(text)), size)))
+        self.assertRaises(ValueError, list, _iter_json_array(io.StringIO(u'[1, 2'), 2))
+        self.assertRaises(ValueError, list, _iter_json_array(io.StringIO(u'{}'), 2))
         
         
         
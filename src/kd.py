@@ -1,5 +1,11 @@
+import itertools
 import unittest
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 kdIndex = { 
   'A':  1.8,
@@ -25,6 +31,17 @@ kdIndex = {
 }
 
 
+def _makeScoreTable():
+    '''numpy array:  kdIndex by byte, NaN for non-residues'''
+    table = numpy.empty(256)
+    table.fill(numpy.nan)
+    for (residue, score) in kdIndex.items():
+        table[ord(residue)] = score
+    return table
+
+_SCORE_TABLE = None if numpy is None else _makeScoreTable()
+
+
 def getResidueScore(residue):
     '''Residue -> Float'''
     if kdIndex.has_key(residue):
@@ -32,8 +49,75 @@ def getResidueScore(residue):
     raise KeyError("missing Kyte-Doolittle index for residue <%s>" % str(residue))
 
 
+def _prefixSums(values):
+    '''[Float] -> [Float]:  sums[i] is the total of the first i values'''
+    sums, total = [0.0], 0.0
+    for v in values:
+        total += v
+        sums.append(total)
+    return sums
+
+
+def _windowAverages(sums, offset, length, windowRadius):
+    '''averages of the full windows of values[offset:offset + length],
+    given the prefix sums of values'''
+    span = 2 * windowRadius + 1
+    width = float(span)
+    return [(sums[i + span] - sums[i]) / width for i in range(offset, offset + length - span + 1)]
+
+
 def smooth(values, windowRadius):
-    '''[Float] -> Int -> [Float]'''
+    '''[Float] -> Int -> [Float]
+    
+    Sliding-window average, in O(n) using prefix sums.
+    '''
+    return _windowAverages(_prefixSums(values), 0, len(values), windowRadius)
+
+
+def smoothBatch(valueLists, windowRadius):
+    '''[[Float]] -> Int -> [[Float]]
+    
+    `smooth` for many lists at once, off of a single prefix-sum pass:
+    vectorized if numpy is installed, in Python otherwise.
+    '''
+    if numpy is not None:
+        return _numpySmoothBatch(valueLists, windowRadius)
+    return _pythonSmoothBatch(valueLists, windowRadius)
+
+
+def _pythonSmoothBatch(valueLists, windowRadius):
+    sums = _prefixSums(itertools.chain.from_iterable(valueLists))
+    smoothed, offset = [], 0
+    for values in valueLists:
+        smoothed.append(_windowAverages(sums, offset, len(values), windowRadius))
+        offset += len(values)
+    return smoothed
+
+
+def _numpySmoothBatch(valueLists, windowRadius):
+    lengths = [len(values) for values in valueLists]
+    values = numpy.fromiter(itertools.chain.from_iterable(valueLists), dtype=float, count=sum(lengths))
+    return _numpyWindowAverages(values, lengths, windowRadius)
+
+
+def _numpyWindowAverages(values, lengths, windowRadius):
+    '''averages of the full windows of each of the `lengths`-long pieces of `values`'''
+    span = 2 * windowRadius + 1
+    sums = numpy.concatenate(([0.0], numpy.cumsum(values)))
+    # every window of the concatenation, including those straddling two pieces
+    averages = (sums[span:] - sums[:-span]) / float(span)
+    smoothed, offset = [], 0
+    for length in lengths:
+        smoothed.append(averages[offset: offset + length - span + 1].tolist() if length >= span else [])
+        offset += length
+    return smoothed
+
+
+def directSmooth(values, windowRadius):
+    '''[Float] -> Int -> [Float]
+    
+    Sliding-window average, summing each window:  O(n * windowRadius).
+    '''
     i = windowRadius
     smoothed = []
     width = float(2 * windowRadius + 1)
@@ -52,8 +136,60 @@ def kyteDoolittle(residues, windowRadius):
     return smoothed
 
 
+def kyteDoolittleBatch(residueLists, windowRadius):
+    '''[[Residue]] -> Int -> [[Float]]
+
+    Residues are scored with a lookup table if numpy is installed.
+    '''
+    if numpy is None:
+        scored = [[getResidueScore(r) for r in residues] for residues in residueLists]
+        return _pythonSmoothBatch(scored, windowRadius)
+    joined = ''.join(''.join(residues) for residues in residueLists)
+    codes = numpy.frombuffer(joined.encode('ascii') if not isinstance(joined, bytes) else joined, dtype=numpy.uint8)
+    scores = _SCORE_TABLE[codes]
+    unscored = numpy.flatnonzero(numpy.isnan(scores))
+    if len(unscored):
+        getResidueScore(joined[unscored[0]])
+    return _numpyWindowAverages(scores, [len(residues) for residues in residueLists], windowRadius)
+
+
 def triangleSmooth(values, windowRadius):
-    '''[Float] -> Int -> [Float]'''
+    '''[Float] -> Int -> [Float]
+    
+    Triangle-weighted sliding-window average, in O(n).  The triangle 
+    (weights 1, 2, ..., r + 1, ..., 2, 1) is two box filters of width r + 1
+    run back to back, so moving the window one step adds the box to the
+    right of the center and drops the box ending at the center.
+    '''
+    r, length = windowRadius, len(values)
+    if length < 2 * r + 1:
+        return []
+
+    weights = list(range(1, r + 2)) + list(range(r, 0, -1))
+    totalWeight = float((r + 1) * (r + 1))
+
+    # first window is weighted directly;  after that, only the boxes are updated
+    total = sum([v * w for (v, w) in zip(values[:2 * r + 1], weights)])
+    left, right = sum(values[:r + 1]), sum(values[r + 1:2 * r + 2])
+    smoothed = [total / totalWeight]
+    
+    i = r + 1
+    while i < length - r:
+        total += right - left
+        smoothed.append(total / totalWeight)
+        left += values[i] - values[i - r - 1]
+        if i + r + 1 < length:
+            right += values[i + r + 1] - values[i]
+        i += 1
+    return smoothed
+
+
+def directTriangleSmooth(values, windowRadius):
+    '''[Float] -> Int -> [Float]
+    
+    Triangle-weighted sliding-window average, weighting each
+    window separately:  O(n * windowRadius).
+    '''
     i = windowRadius
 
     fWs, rWs = range(1, windowRadius + 1), range(windowRadius, 0, -1)
@@ -117,6 +253,56 @@ class KdTest(unittest.TestCase):
         calced = kyteDoolittle(rs, 2)
         self.assertEqual(len(calced), len(rs) - 4)
 
+    def testSmoothSameAsDirect(self):
+        import random
+        rand = random.Random(3)
+        for _ in range(20):
+            values = [rand.uniform(-4.5, 4.5) for _ in range(rand.randint(0, 200))]
+            for radius in [0, 1, 4, 9]:
+                fast, direct = smooth(values, radius), directSmooth(values, radius)
+                self.assertEqual(len(direct), len(fast))
+                for (f, d) in zip(fast, direct):
+                    self.assertAlmostEqual(d, f)
+
+    def testSmoothShort(self):
+        self.assertEqual([], smooth([1, 2, 3], 2))
+
+    def testSmoothBatch(self):
+        valueLists = [range(10), [], [4.5, -1.0, 2.0], range(100, 0, -3)]
+        batch = smoothBatch(valueLists, 1)
+        self.assertEqual(len(valueLists), len(batch))
+        for (values, smoothed) in zip(valueLists, batch):
+            self.assertEqual(len(smooth(values, 1)), len(smoothed))
+            for (s, b) in zip(smooth(values, 1), smoothed):
+                self.assertAlmostEqual(s, b)
+
+    def testSmoothBatchWithoutNumpy(self):
+        global numpy
+        valueLists = [range(10), [], [4.5, -1.0, 2.0], range(100, 0, -3)]
+        vectorized = smoothBatch(valueLists, 2)
+        previous, numpy = numpy, None
+        try:
+            self.assertEqual([smooth(values, 2) for values in valueLists], smoothBatch(valueLists, 2))
+            self.assertEqual(kyteDoolittleBatch(['MATTCVGH', 'MA'], 1), [kyteDoolittle('MATTCVGH', 1), []])
+            self.assertRaises(KeyError, kyteDoolittleBatch, ['MAX'], 1)
+        finally:
+            numpy = previous
+        for (expected, smoothed) in zip(smoothBatch(valueLists, 2), vectorized):
+            self.assertEqual(len(expected), len(smoothed))
+            for (e, v) in zip(expected, smoothed):
+                self.assertAlmostEqual(e, v)
+
+    def testAlgorithmBatchBadResidue(self):
+        self.assertRaises(KeyError, kyteDoolittleBatch, ['MATT', 'CX'], 1)
+
+    def testAlgorithmBatch(self):
+        rss = ['MATTCV', 'MATTCVGHKWERTY', 'M']
+        batch = kyteDoolittleBatch(rss, 2)
+        for (rs, smoothed) in zip(rss, batch):
+            self.assertEqual(len(kyteDoolittle(rs, 2)), len(smoothed))
+            for (s, b) in zip(kyteDoolittle(rs, 2), smoothed):
+                self.assertAlmostEqual(s, b)
+
     def testTriangleKD(self):
         rs = 'MATTCV'
         c1, c2 = triangleKyteDoolittle(rs, 1), triangleKyteDoolittle(rs, 2)
@@ -124,6 +310,17 @@ class KdTest(unittest.TestCase):
         self.assertEqual(1.2, c1[0])
         self.assertAlmostEqual(-0.075, c1[1])
 
+    def testTriangleSmoothSameAsDirect(self):
+        import random
+        rand = random.Random(5)
+        for _ in range(50):
+            values = [rand.uniform(-4.5, 4.5) for _ in range(rand.randint(0, 300))]
+            for radius in [0, 1, 2, 5, 9, 15]:
+                fast, direct = triangleSmooth(values, radius), directTriangleSmooth(values, radius)
+                self.assertEqual(len(direct), len(fast))
+                for (f, d) in zip(fast, direct):
+                    self.assertAlmostEqual(d, f)
+
     def testTriangleSmooth(self):
         calced = triangleSmooth([1,-1,3,4,5], 1)
         self.assertEqual(len(calced), 5 - 2)
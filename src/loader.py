@@ -0,0 +1,309 @@
+import model
+import mmap
+import os
+import sys
+import tempfile
+import unittest
+
+
+
+# where the B. subtilis 168 genome is expected, relative to src/
+BACILLUS_SUBTILIS_168 = '../bacillussubtilis168.fasta'
+
+# the older form of the same genome:  a module whose `bases` are the genome,
+# read if the FASTA file isn't there (`python loader.py` converts it)
+GENOME_MODULE = 'bacillussubtilis168'
+
+_MISSING_GENOME = ("B. subtilis 168 genome not found:  expected a FASTA file at <%s>, "
+                   "or the %s module (with `bases`) on the path")
+
+_CHUNK_SIZE = 1 << 20
+
+_WHITESPACE = b' \t\r\n\x0b\x0c'
+_DIGITS = b'0123456789'
+
+
+def _to_str(data):
+    '''bytes from the mmap -> str (a no-op on Python 2)'''
+    if isinstance(data, str):
+        return data
+    return data.decode('ascii')
+
+
+def _iter_normalized(mapped, start, stop, delete):
+    '''Reads bases out of mapped[start:stop] a chunk at a time, dropping
+    line breaks (and anything else in `delete`) and upper-casing them.'''
+    while start < stop:
+        end = min(start + _CHUNK_SIZE, stop)
+        yield _to_str(mapped[start:end].translate(None, delete).upper())
+        start = end
+
+
+def _normalize(mapped, start, stop, delete, chunks=False):
+    '''the bases of mapped[start:stop]:  a string, or a generator of pieces if `chunks` is set'''
+    pieces = _iter_normalized(mapped, start, stop, delete)
+    return pieces if chunks else ''.join(pieces)
+
+
+def _open(path):
+    '''mmap of the file, or None if it's empty'''
+    with open(path, 'rb') as infile:
+        if os.fstat(infile.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _line_end(mapped, start):
+    end = mapped.find(b'\n', start)
+    return len(mapped) if end < 0 else end
+
+
+def read_fasta(path, chunks=False):
+    '''Path -> Generator (String, [Base])
+
+    Yields (name, bases) for each record of a FASTA file.  With `chunks`
+    set, bases are a generator of pieces (see read_records).
+    '''
+    mapped = _open(path)
+    if mapped is None:
+        return
+    try:
+        start = mapped.find(b'>')
+        while start >= 0:
+            header_end = _line_end(mapped, start)
+            name = (_to_str(mapped[start + 1:header_end]).split() or [''])[0]
+
+            stop = mapped.find(b'\n>', header_end)
+            seq_stop = len(mapped) if stop < 0 else stop
+            yield name, _normalize(mapped, header_end, seq_stop, _WHITESPACE, chunks)
+
+            start = stop + 1 if stop >= 0 else -1
+    finally:
+        mapped.close()
+
+
+def read_genbank(path, chunks=False):
+    '''Path -> Generator (String, [Base])
+
+    Yields (name, bases) for each record of a GenBank file,
+    taking the bases from its ORIGIN section.  With `chunks` set,
+    bases are a generator of pieces (see read_records).
+    '''
+    mapped = _open(path)
+    if mapped is None:
+        return
+    try:
+        start = mapped.find(b'LOCUS')
+        while start >= 0:
+            fields = _to_str(mapped[start:_line_end(mapped, start)]).split()
+            name = fields[1] if len(fields) > 1 else ''
+
+            end = mapped.find(b'\n//', start)
+            end = len(mapped) if end < 0 else end
+            origin = mapped.find(b'\nORIGIN', start, end)
+            bases = iter([]) if chunks else ''
+            if origin >= 0:
+                bases = _normalize(mapped, _line_end(mapped, origin + 1), end, _WHITESPACE + _DIGITS, chunks)
+            yield name, bases
+
+            start = mapped.find(b'\nLOCUS', end)
+            start = start + 1 if start >= 0 else -1
+    finally:
+        mapped.close()
+
+
+def read_records(path, chunks=False):
+    '''Path -> Generator (String, [Base])
+
+    Reads FASTA or GenBank, depending on how the file starts.
+
+    With `chunks` set, each record's bases are a generator of pieces of
+    the record (at most _CHUNK_SIZE bytes of the file each), read out of
+    the mapping only as they're asked for, so a record is never held
+    whole.  Use them up before asking for the next record.
+    '''
+    with open(path, 'rb') as infile:
+        head = infile.read(1024).lstrip()
+    if head.startswith(b'LOCUS'):
+        return read_genbank(path, chunks)
+    return read_fasta(path, chunks)
+
+
+def load_sequences(path, pack=False):
+    '''Path -> Generator Sequence
+
+    Yields a forward-strand Sequence for each record (contig) in the file,
+    with packed bases if `pack` is set.
+    '''
+    for (_, bases) in read_records(path):
+        seq = model.Sequence(bases, True)
+        yield seq.pack() if pack else seq
+
+
+def write_fasta(path, name, bases, width=70):
+    with open(path, 'w') as outfile:
+        outfile.write('>%s\n' % name)
+        for i in range(0, len(bases), width):
+            outfile.write(bases[i:i + width] + '\n')
+
+
+def _read_genome_module():
+    '''bases of GENOME_MODULE, or None if it can't be imported'''
+    try:
+        module = __import__(GENOME_MODULE)
+    except ImportError:
+        return None
+    return module.bases.upper()
+
+
+_genomes = {}
+
+def get_genome(path=None):
+    '''Path -> [Base]
+
+    Bases of the first record in the file; read once per path.
+    By default, the B. subtilis 168 genome:  BACILLUS_SUBTILIS_168,
+    or else GENOME_MODULE (IOError if there's neither).
+    '''
+    default = path is None
+    if default:
+        path = BACILLUS_SUBTILIS_168
+    if path not in _genomes:
+        if default and not os.path.exists(path):
+            bases = _read_genome_module()
+            if bases is None:
+                raise IOError(_MISSING_GENOME % (path, GENOME_MODULE))
+            _genomes[path] = bases
+            return bases
+        for (_, bases) in read_records(path):
+            _genomes[path] = bases
+            break
+        else:
+            raise ValueError("no sequence records in <%s>" % str(path))
+    return _genomes[path]
+
+
+if __name__ == "__main__":
+    # converts the genome module into the FASTA file that's read instead
+    bases = _read_genome_module()
+    if bases is None:
+        sys.exit("can't import the %s module" % GENOME_MODULE)
+    write_fasta(BACILLUS_SUBTILIS_168, GENOME_MODULE, bases)
+
+
+
+########################################################
+# unit tests
+########################################################
+
+_FASTA = b'''>contig1 some description
+acgtAACC
+GGTT
+>contig2
+ATG\r
+CCC\r
+TAA\r
+'''
+
+_GENBANK = b'''LOCUS       SEQ1      12 bp    DNA     circular BCT 01-JAN-2000
+DEFINITION  first.
+ORIGIN
+        1 acgtaacc gg
+       11 tt
+//
+LOCUS       SEQ2      9 bp    DNA     circular BCT 01-JAN-2000
+FEATURES             Location/Qualifiers
+ORIGIN
+        1 atgcccTAA
+//
+'''
+
+
+class LoaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.paths = []
+
+    def tearDown(self):
+        for path in self.paths:
+            os.remove(path)
+
+    def _write(self, data):
+        handle, path = tempfile.mkstemp()
+        os.write(handle, data)
+        os.close(handle)
+        self.paths.append(path)
+        return path
+
+    def test_read_fasta(self):
+        records = list(read_fasta(self._write(_FASTA)))
+        self.assertEqual([('contig1', 'ACGTAACCGGTT'), ('contig2', 'ATGCCCTAA')], records)
+
+    def test_read_genbank(self):
+        records = list(read_genbank(self._write(_GENBANK)))
+        self.assertEqual([('SEQ1', 'ACGTAACCGGTT'), ('SEQ2', 'ATGCCCTAA')], records)
+
+    def test_read_records(self):
+        fasta, genbank = self._write(_FASTA), self._write(_GENBANK)
+        self.assertEqual(list(read_fasta(fasta)), list(read_records(fasta)))
+        self.assertEqual(list(read_genbank(genbank)), list(read_records(genbank)))
+
+    def test_read_records_in_chunks(self):
+        global _CHUNK_SIZE
+        path = self._write(b'>one\nACGTN\nacg\n>two\n\n>three\nTTTTT\nAAA')
+        previous, _CHUNK_SIZE = _CHUNK_SIZE, 4
+        try:
+            records = [(name, list(pieces)) for (name, pieces) in read_records(path, chunks=True)]
+        finally:
+            _CHUNK_SIZE = previous
+        self.assertEqual(list(read_records(path)), [(name, ''.join(pieces)) for (name, pieces) in records])
+        self.assertEqual(['ACG', 'TNA', 'CG'], records[0][1])
+        genbank = self._write(_GENBANK)
+        self.assertEqual(list(read_records(genbank)), [(name, ''.join(pieces)) for (name, pieces) in read_records(genbank, chunks=True)])
+
+    def test_empty(self):
+        self.assertEqual([], list(read_records(self._write(b''))))
+
+    def test_load_sequences(self):
+        seqs = list(load_sequences(self._write(_GENBANK), pack=True))
+        self.assertEqual(2, len(seqs))
+        self.assertTrue(seqs[0].is_packed() and seqs[0].is_sense())
+        self.assertEqual('TTAGGGCAT', seqs[1].get_reverse_complement().get_bases())
+
+    def test_get_genome(self):
+        path = self._write(_FASTA)
+        self.assertEqual('ACGTAACCGGTT', get_genome(path))
+        self.assertTrue(get_genome(path) is get_genome(path))
+        self.assertRaises(ValueError, get_genome, self._write(b''))
+
+    def test_write_fasta(self):
+        path = self._write(b'')
+        write_fasta(path, 'one', 'ACGT' * 5, width=8)
+        self.assertEqual([('one', 'ACGT' * 5)], list(read_fasta(path)))
+
+    def test_genome_fallback(self):
+        global BACILLUS_SUBTILIS_168
+        import types
+        missing, module = self._write(b''), types.ModuleType(GENOME_MODULE)
+        os.remove(missing)
+        self.paths.remove(missing)
+        module.bases = 'acgtTTAA'
+        previous, BACILLUS_SUBTILIS_168 = BACILLUS_SUBTILIS_168, missing
+        installed = sys.modules.get(GENOME_MODULE)
+        try:
+            # None in sys.modules makes the import fail, even if the module is installed
+            sys.modules[GENOME_MODULE] = None
+            self.assertRaises(IOError, get_genome)
+            sys.modules[GENOME_MODULE] = module
+            self.assertEqual('ACGTTTAA', get_genome())
+        finally:
+            BACILLUS_SUBTILIS_168 = previous
+            if installed is None:
+                sys.modules.pop(GENOME_MODULE, None)
+            else:
+                sys.modules[GENOME_MODULE] = installed
+            _genomes.pop(missing, None)
+
+
+
+testClasses = [LoaderTest]
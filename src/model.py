@@ -1,6 +1,13 @@
 import sequence
-import translate
 import peaks
+import vectorized
+import packed
+import profiles
+import collections
+import hashlib
+import heapq
+import itertools
+import sys
 import unittest
 
 
@@ -10,7 +17,116 @@ import unittest
 # for finding Orfs
 
 
-class Orf(object):
+class DerivedCache(object):
+
+    '''Bounded memo of data derived from Orfs (codons, residues, phobicity,
+       peaks), least-recently-used entries evicted first once the values
+       add up to more than `max_bytes` (as estimated by _get_size).
+
+       Keys name the Orf without holding its bases:  an Orf by a digest of
+       its bases, so equal Orfs share entries (and an Orf rebuilt from a
+       file or a store still hits);  a LazyOrf by its parent Sequence and
+       coordinates, so a hit doesn't read its bases out of the Sequence.
+       Values are tuples and strings, so they can be shared.
+
+       public methods:
+        - get(key, compute)
+        - clear
+        - hits, misses (counters)
+        - size (estimated bytes held)
+    '''
+
+    def __init__(self, max_bytes=64 << 20):
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, compute):
+        '''the value stored under `key`, or `compute()` (then stored)'''
+        entries = self._entries
+        if key in entries:
+            entry = entries.pop(key)
+            entries[key] = entry
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        value = compute()
+        size = _get_size(value)
+        entries[key] = (value, size)
+        self.size += size
+        while self.size > self.max_bytes and entries:
+            _, (_, evicted) = entries.popitem(last=False)
+            self.size -= evicted
+        return value
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+
+def _get_size(value):
+    '''rough bytes held by a cached value:  the value, plus its items if it's a tuple'''
+    size = sys.getsizeof(value)
+    if isinstance(value, tuple):
+        size += sum(sys.getsizeof(item) for item in value)
+    return size
+
+
+# shared by all Orfs for the session;  replace it to change the bound
+derived = DerivedCache()
+
+
+class _OrfMethods(object):
+
+    '''methods shared by Orf and LazyOrf; subclasses provide
+       start, stop, bases, upstream, downstream and is_sense,
+       and _get_key (what names the Orf in `derived`)
+
+       derived data goes through the module's DerivedCache, `derived`'''
+
+    __slots__ = ()
+
+    def to_JSON_object(self):
+        return {
+            'start'       : self.start,
+            'stop'        : self.stop,
+            'bases'       : self.bases,
+            'upstream'    : self.upstream,
+            'downstream'  : self.downstream,
+            'is_sense'    : self.is_sense
+        }
+        
+    ##############################
+
+    def get_codons(self):
+        return derived.get(('codons', self._get_key()),
+                           lambda: tuple(sequence.makeCodons(self.bases)))
+
+    def get_residues(self):
+        ''''X' for codons with unknown bases, as in profiles.FrameProfiles'''
+        return derived.get(('residues', self._get_key()),
+                           lambda: profiles.translate(self.get_codons()))
+
+    def get_phobicity(self, algorithm, windowRadius):
+        '''NaN for windows over unknown residues, as in profiles.FrameProfiles'''
+        return derived.get(('phobicity', self._get_key(), algorithm, windowRadius),
+                           lambda: tuple(profiles.get_phobicity(self.get_residues(), algorithm, windowRadius)))
+                              
+    def get_phobicity_peaks(self, algorithm, windowRadius, peakRadius):          
+        '''copies of the cached peaks, so callers can't change them'''
+        pks = derived.get(('peaks', self._get_key(), algorithm, windowRadius, peakRadius),
+                          lambda: tuple(peaks.find1DPeaks(self.get_phobicity(algorithm, windowRadius), peakRadius)))
+        return tuple(dict(p) for p in pks)
+
+
+class Orf(_OrfMethods):
     
     '''public (read-only) properties:
         - start (normalized by direction)
@@ -41,17 +157,13 @@ class Orf(object):
         self.upstream = upstream
         self.downstream = downstream
         self.is_sense = is_sense
+        self._digest = None
 
-
-    def to_JSON_object(self):
-        return {
-            'start'       : self.start,
-            'stop'        : self.stop,
-            'bases'       : self.bases,
-            'upstream'    : self.upstream,
-            'downstream'  : self.downstream,
-            'is_sense'    : self.is_sense
-        }
+    def _get_key(self):
+        if self._digest is None:
+            bases = self.bases
+            self._digest = hashlib.sha1(bases if isinstance(bases, bytes) else bases.encode('ascii')).digest()
+        return self._digest
         
     @staticmethod
     def from_JSON_object(obj):
@@ -63,63 +175,187 @@ class Orf(object):
             obj['downstream'],
             obj['is_sense']       
         )
-        
-    ##############################
 
-    def get_codons(self):
-        return sequence.makeCodons(self.bases)
+
+class LazyOrf(_OrfMethods):
+
+    '''An Orf that only stores its coordinates and its parent Sequence.
+       `bases`, `upstream` and `downstream` are read out of the Sequence
+       when they're asked for (and kept, if `memoize` is set).
+
+       public (read-only) properties:
+        - frame (0, 1, or 2:  codon alignment in the parent Sequence)
+        - start (normalized by direction)
+        - stop (normalized by direction)
+        - bases
+        - upstream
+        - downstream
+        - is_sense
+        - sequence
+    '''
+
+    __slots__ = ('frame', 'start', 'stop', 'is_sense', 'sequence', '_width', '_memo')
+
+    def __init__(self, sequence, frame, start, stop, width, memoize=False):
+        self.sequence = sequence
+        self.frame = frame
+        self.start = start
+        self.stop = stop
+        self.is_sense = sequence.is_sense()
+        self._width = width
+        self._memo = {} if memoize else None
+
+    def _get(self, key):
+        if self._memo is not None and key in self._memo:
+            return self._memo[key]
+        bstart, bstop = [self.sequence._get_norm_index(ix) for ix in [self.start, self.stop]]
+        value = self.sequence._get_orf_part(bstart, bstop, self._width, key)
+        if self._memo is not None:
+            self._memo[key] = value
+        return value
+
+    @property
+    def bases(self):
+        return self._get(0)
+
+    @property
+    def upstream(self):
+        return self._get(1)
+
+    @property
+    def downstream(self):
+        return self._get(2)
+
+    def _get_key(self):
+        return (self.sequence._token, self.start, self.stop, self.is_sense)
+
+    def _get_codon_ends(self):
+        bstart, bstop = [self.sequence._get_norm_index(ix) for ix in [self.start, self.stop]]
+        return bstart // 3, bstop // 3
 
     def get_residues(self):
-        return ''.join(translate.codonsToResidues(self.get_codons()))     
+        '''a slice of the parent Sequence's translation of this frame'''
+        cstart, cstop = self._get_codon_ends()
+        return self.sequence.get_frame_profiles().get_orf_residues(self.frame, cstart, cstop)
 
     def get_phobicity(self, algorithm, windowRadius):
-        residues = self.get_residues()
-        return algorithm(residues, windowRadius)          
-                              
-    def get_phobicity_peaks(self, algorithm, windowRadius, peakRadius):          
-        return peaks.find1DPeaks(self.get_phobicity(algorithm, windowRadius), peakRadius)
-        
+        '''a slice of the parent Sequence's phobicity profile of this frame'''
+        cstart, cstop = self._get_codon_ends()
+        frames = self.sequence.get_frame_profiles()
+        return tuple(frames.get_orf_phobicity(self.frame, cstart, cstop, algorithm, windowRadius))
+
+    def to_orf(self):
+        '''a plain Orf holding copies of the bases'''
+        return Orf(self.start, self.stop, self.bases, self.upstream, self.downstream, self.is_sense)
+
 
 
 
 _START_STOP_ERROR = "start and stop must be between 0 and sequence length"
 
+# never reused (unlike id()), so a Sequence's LazyOrfs can't hit a dead one's entries in `derived`
+_sequence_tokens = itertools.count()
+
 class Sequence(object):
     
     '''public (read-only) properties:
         
        public methods:
         - get_bases
+        - get_length
         - is_sense
         - get_reverse_complement
         - get_orfs
         - get_all_orfs
+        - iter_orfs
         - build_orf(start, stop)
+        - pack
+        - get_frame_profiles
+        - get_orf_ends
+        - get_frame_orf_ends
+
+       `bases` may be a string or a packed.PackedBases.
+
+       Orf scanning engines (the `engine` parameter):
+        - 'python':  codon strings, pure Python scanners in `sequence`
+        - 'numpy':  integer codon codes, vectorized scanners in `vectorized`
+        - 'table':  codon strings, with a precomputed next-stop table for get_all_orfs
+        - 'view':  codons are read straight out of the bases, without rotated
+                   copies, codon lists or a next-stop table, and get_all_orfs
+                   is a single pass with a list of pending starts (low memory)
+        - 'chunked':  codons are streamed out of the bases a chunk at a time,
+                      and each alignment is scanned in one forward pass (see
+                      sequence.ChunkedCodons;  memory bounded by the chunk size)
     '''
 
     def __init__(self, bases, is_sense):
         self._bases = bases
         self._is_sense = is_sense
+        self._token = next(_sequence_tokens)
         self._codons = [None, None, None]
+        self._codon_codes = [None, None, None]
+        self._encoded = None
         self._reverse = None
+        self._reverse_sequence = None
+        self._frame_profiles = None
         
     ########################
     
     def _get_reverse_bases(self):
         if self._reverse is None:
-            self._reverse = sequence.reverseComplement(self.get_bases())
+            if self.is_packed():
+                self._reverse = self._bases.reverse_complement()
+            else:
+                self._reverse = sequence.reverseComplement(self.get_bases())
         return self._reverse
 
 
     def _get_codons(self, n):
         assert n in [0, 1, 2], "codon alignment must be 0, 1, or 2"
-        
+
+        # codons are read straight out of the packed data, never unpacked
+        if self.is_packed():
+            return sequence.CodonView(self._bases, n)
+
         bases = self.get_bases()
         if self._codons[n] is None:
             self._codons[n] = sequence.makeCodons(bases[n:] + bases[:n])
         return self._codons[n]
+
+
+    def _get_codon_codes(self, n):
+        assert n in [0, 1, 2], "codon alignment must be 0, 1, or 2"
+
+        if self._encoded is None:
+            if self.is_packed():
+                self._encoded = vectorized.fromBaseCodes(self._bases.get_base_codes())
+            else:
+                self._encoded = vectorized.encodeBases(self.get_bases())
+        if self._codon_codes[n] is None:
+            self._codon_codes[n] = vectorized.getCodonCodes(self._encoded, n)
+        return self._codon_codes[n]
+
+
+    def _get_codon_view(self, n):
+        assert n in [0, 1, 2], "codon alignment must be 0, 1, or 2"
+        return sequence.CodonView(self._bases, n)
     
     
+    def _get_orf_part(self, bstart, bstop, n, part):
+        '''one of (bases, upstream, downstream) of an Orf:  part 0, 1 or 2'''
+        if part == 0:
+            return self.get_bases(bstart, bstop)
+        length = len(self._bases)
+        if part == 1:
+            return self.get_bases((bstart - n) % length, bstart)
+        return self.get_bases(bstop, (bstop + n) % length)
+
+
+    def _get_orf_bases(self, bstart, bstop, n):
+        '''(bases, upstream, downstream) of an Orf'''
+        return tuple(self._get_orf_part(bstart, bstop, n, part) for part in range(3))
+
+
     def build_orf(self, bstart, bstop, n):
         '''Build an Orf given the start and stop indices.
         
@@ -127,27 +363,42 @@ class Sequence(object):
          - bstart:  base-pair start index
          - bstop:  base-pair stop index
         '''
-        length = len(self.get_bases())
         nstart, nstop = [self._get_norm_index(ix) for ix in [bstart, bstop]]
-        bases = self.get_bases(bstart, bstop)
-        up = self.get_bases((bstart - n) % length, bstart)
-        down = self.get_bases(bstop, (bstop + n) % length)
+        bases, up, down = self._get_orf_bases(bstart, bstop, n)
         return Orf(nstart, nstop, bases, up, down, self.is_sense())
+
+
+    def build_lazy_orf(self, bstart, bstop, n, memoize=False):
+        '''Build a LazyOrf given the start and stop indices.'''
+        assert (bstop - bstart) % len(self._bases) % 3 == 0, "Orf length must be multiple of 3"
+        nstart, nstop = [self._get_norm_index(ix) for ix in [bstart, bstop]]
+        return LazyOrf(self, bstart % 3, nstart, nstop, n, memoize)
   
     
-    def _get_orfs(self, algorithm, width):
-        orfs = []
+    def _get_frame_orf_ends(self, algorithm, get_codons, n):
+        return [(cstart * 3 + n, cstop * 3 + n) for (cstart, cstop) in algorithm(get_codons(n))]
+
+
+    def _get_orf_ends(self, algorithm, get_codons):
+        ends = []
         for n in range(3): # [0, 1, 2]
-            orfEnds = algorithm(self._get_codons(n))
-            for ends in orfEnds:
-                bstart, bstop = [cix * 3 + n for cix in ends]
-                new_orf = self.build_orf(bstart, bstop, width)
-                orfs.append(new_orf)
-        return orfs
+            for (bstart, bstop) in self._get_frame_orf_ends(algorithm, get_codons, n):
+                ends.append((n, bstart, bstop))
+        return ends
+
+
+    def _iter_orfs(self, algorithm, get_codons, width, lazy=False):
+        build = self.build_lazy_orf if lazy else self.build_orf
+        for (_, bstart, bstop) in self._get_orf_ends(algorithm, get_codons):
+            yield build(bstart, bstop, width)
+
+
+    def _get_orfs(self, algorithm, get_codons, width, lazy=False):
+        return list(self._iter_orfs(algorithm, get_codons, width, lazy))
  
     
     def _get_norm_index(self, index):
-        length = len(self.get_bases())
+        length = len(self._bases)
         assert 0 <= index < length
 
         if self.is_sense():
@@ -159,6 +410,8 @@ class Sequence(object):
 
     def get_bases(self, start=None, stop=None):
         if start is None or stop is None:
+            if self.is_packed():
+                return self._bases.get_bases()
             return self._bases
         
         assert None not in [start, stop], "start and stop can not be None"
@@ -181,21 +434,97 @@ class Sequence(object):
     
     def is_sense(self):
         return self._is_sense
+
+
+    def get_length(self):
+        return len(self._bases)
+
+
+    def is_packed(self):
+        return isinstance(self._bases, packed.PackedBases)
+
+
+    def pack(self):
+        '''a Sequence holding the same bases at 2 bits per base'''
+        if self.is_packed():
+            return self
+        return Sequence(packed.PackedBases(self.get_bases()), self.is_sense())
  
         
-    def get_orfs(self, n):
-        '''finds *only leftmost, longest* Orfs in all 3 alignments'''
-        return self._get_orfs(sequence.getOrfEndsCircular, n)
+    def _get_engine(self, engine):
+        '''returns (longest-Orf scanner, all-Orf scanner, codon getter)'''
+        if engine == 'python':
+            return sequence.getOrfEndsCircular, sequence.getAllOrfEndsCircular, self._get_codons
+        elif engine == 'numpy':
+            return vectorized.getOrfEndsCircular, vectorized.getAllOrfEndsCircular, self._get_codon_codes
+        elif engine == 'table':
+            return sequence.getOrfEndsCircular, sequence.getAllOrfEndsCircularTable, self._get_codons
+        elif engine == 'view':
+            return sequence.getOrfEndsCircular, sequence.getAllOrfEndsCircularStreaming, self._get_codon_view
+        elif engine == 'chunked':
+            chunks = lambda n: sequence.ChunkedCodons(self._bases, n)
+            return sequence.getOrfEndsCircularStreaming, sequence.getAllOrfEndsCircularStreaming, chunks
+        raise ValueError("unknown Orf scanning engine <%s>" % str(engine))
+
+        
+    def get_orfs(self, n, engine='python', lazy=False):
+        '''finds *only leftmost, longest* Orfs in all 3 alignments
+        (as LazyOrfs if `lazy` is set)'''
+        longest, _, get_codons = self._get_engine(engine)
+        return self._get_orfs(longest, get_codons, n, lazy)
+
+    
+    def get_all_orfs(self, n, engine='python', lazy=False):
+        '''finds Orfs of all sizes (including overlapping) in all 3 alignments
+        (as LazyOrfs if `lazy` is set)'''
+        _, every, get_codons = self._get_engine(engine)
+        return self._get_orfs(every, get_codons, n, lazy)
+
+    
+    def iter_orfs(self, n, all_orfs=False, lazy=False, chunk_size=sequence.CHUNK_SIZE):
+        '''same Orfs, in the same order, as get_orfs (or get_all_orfs, if
+        `all_orfs` is set), each yielded as soon as the scan reads its stop:
+        codons are streamed out of the bases `chunk_size` at a time (see
+        sequence.ChunkedCodons), and neither the codon caches nor any list
+        of Orfs or Orf ends is built'''
+        if all_orfs:
+            scan = sequence.iterAllOrfEndsCircularStreaming
+        else:
+            scan = sequence.iterOrfEndsCircularStreaming
+        build = self.build_lazy_orf if lazy else self.build_orf
+        for frame in range(3):
+            for (cstart, cstop) in scan(sequence.ChunkedCodons(self._bases, frame, chunk_size)):
+                yield build(cstart * 3 + frame, cstop * 3 + frame, n)
+
+    
+    def get_orf_ends(self, engine='python', all_orfs=False):
+        '''(alignment, start index, stop index) of each Orf, without building
+        any Orfs;  indices are into this Sequence's bases, not normalized'''
+        longest, every, get_codons = self._get_engine(engine)
+        return self._get_orf_ends(every if all_orfs else longest, get_codons)
 
     
-    def get_all_orfs(self, n):
-        '''finds Orfs of all sizes (including overlapping) in all 3 alignments'''
-        return self._get_orfs(sequence.getAllOrfEndsCircular, n)
+    def get_frame_orf_ends(self, n, engine='python', all_orfs=False):
+        '''(start index, stop index) of each Orf in codon alignment `n` only'''
+        assert n in [0, 1, 2], "codon alignment must be 0, 1, or 2"
+        longest, every, get_codons = self._get_engine(engine)
+        return self._get_frame_orf_ends(every if all_orfs else longest, get_codons, n)
 
     
     def get_reverse_complement(self):
-        rSeq = Sequence(self._get_reverse_bases(), not self.is_sense())
-        return rSeq
+        '''the same Sequence object every time, so that its caches are kept'''
+        if self._reverse_sequence is None:
+            rSeq = Sequence(self._get_reverse_bases(), not self.is_sense())
+            rSeq._reverse_sequence = self
+            self._reverse_sequence = rSeq
+        return self._reverse_sequence
+
+
+    def get_frame_profiles(self):
+        '''profiles.FrameProfiles:  translations and phobicity of all 3 alignments'''
+        if self._frame_profiles is None:
+            self._frame_profiles = profiles.FrameProfiles(self._bases)
+        return self._frame_profiles
 
 
 
@@ -213,8 +542,70 @@ class OrfCollection(object):
         return self._orfs
     
     def filter(self, f):
-        orfs = filter(f, self.get_orfs())
+        # a list, not filter(...):  on Python 3 that's a one-shot iterator
+        orfs = [orf for orf in self.get_orfs() if f(orf)]
         return OrfCollection(orfs)
+
+    def query(self):
+        '''OrfQuery over this collection's Orfs'''
+        return OrfQuery(self.get_orfs())
+
+
+
+class OrfQuery(object):
+
+    '''A lazy chain of steps over a source of Orfs (or anything iterable).
+
+       Each step returns a new OrfQuery;  nothing runs until the query is
+       iterated, and then every item flows through the whole chain one
+       at a time, without intermediate lists -- so `limit` stops reading
+       the source as soon as it has enough.
+
+       A query over a list can be run again;  over a generator (such as
+       Sequence.iter_orfs), only once.
+
+       public methods:
+        - filter(f)
+        - map(f)
+        - limit(n)
+        - top(k, key)  (the k largest by `key`;  reads the whole source,
+                        but holds only k items)
+        - iteration / to_list / to_collection / count
+    '''
+
+    def __init__(self, source, steps=()):
+        self._source = source
+        self._steps = tuple(steps)
+
+    def _then(self, step):
+        return OrfQuery(self._source, self._steps + (step,))
+
+    def filter(self, f):
+        return self._then(lambda items: (item for item in items if f(item)))
+
+    def map(self, f):
+        return self._then(lambda items: (f(item) for item in items))
+
+    def limit(self, n):
+        return self._then(lambda items: itertools.islice(items, n))
+
+    def top(self, k, key):
+        return self._then(lambda items: iter(heapq.nlargest(k, items, key=key)))
+
+    def __iter__(self):
+        items = iter(self._source)
+        for step in self._steps:
+            items = step(items)
+        return items
+
+    def to_list(self):
+        return list(self)
+
+    def to_collection(self):
+        return OrfCollection(self.to_list())
+
+    def count(self):
+        return sum(1 for _ in self)
         
      
             
@@ -279,6 +670,161 @@ class OrfTest(unittest.TestCase):
         self.assertTrue(False)
 
 
+class DerivedCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        global derived
+        self.previous = derived
+        derived = DerivedCache()
+        self.orf = Orf(2, 14, 'ATGGCTATTCTGTGG', 'TAATAA', 'CTCA', True)
+
+    def tearDown(self):
+        global derived
+        derived = self.previous
+
+    def test_counts(self):
+        residues = self.orf.get_residues()
+        self.assertEqual('MAILW', residues)
+        self.assertEqual((0, 2), (derived.hits, derived.misses))
+        self.assertTrue(residues is self.orf.get_residues())
+        self.assertEqual((1, 2), (derived.hits, derived.misses))
+
+    def test_shared_by_equal_orfs(self):
+        other = Orf(5, 20, 'ATGGCTATTCTGTGG', '', '', False)
+        self.assertTrue(self.orf.get_codons() is other.get_codons())
+
+    def test_immutable(self):
+        import kd
+        self.assertEqual(('ATG', 'GCT', 'ATT', 'CTG', 'TGG'), self.orf.get_codons())
+        self.assertTrue(isinstance(self.orf.get_phobicity(kd.kyteDoolittle, 1), tuple))
+        pks = self.orf.get_phobicity_peaks(kd.kyteDoolittle, 1, 1)
+        self.assertTrue(isinstance(pks, tuple))
+        pks[0]['height'] = None
+        self.assertNotEqual(None, self.orf.get_phobicity_peaks(kd.kyteDoolittle, 1, 1)[0]['height'])
+
+    def test_keyed_by_algorithm_and_radius(self):
+        import kd
+        a = self.orf.get_phobicity(kd.kyteDoolittle, 1)
+        self.assertEqual(tuple(kd.kyteDoolittle('MAILW', 1)), a)
+        self.assertEqual(tuple(kd.kyteDoolittle('MAILW', 2)), self.orf.get_phobicity(kd.kyteDoolittle, 2))
+        self.assertEqual(tuple(kd.triangleKyteDoolittle('MAILW', 1)), self.orf.get_phobicity(kd.triangleKyteDoolittle, 1))
+
+    def test_lazy_hits_dont_read_bases(self):
+        seq = Sequence('CCC' + 'ATGGCTATTCTGTGG' + 'TAACCC', True)
+        lazy = LazyOrf(seq, 0, 3, 18, 3)
+        codons = lazy.get_codons()
+        self.assertEqual(('ATG', 'GCT', 'ATT', 'CTG', 'TGG'), codons)
+        reads = []
+        seq.get_bases = lambda *args: reads.append(args)
+        self.assertTrue(codons is lazy.get_codons())
+        self.assertTrue(codons is LazyOrf(seq, 0, 3, 18, 3).get_codons())
+        self.assertEqual([], reads)
+        # another Sequence, even with the same bases, has its own entries
+        other = Sequence('CCC' + 'ATGGCTATTCTGTGG' + 'TAACCC', True)
+        self.assertFalse(codons is LazyOrf(other, 0, 3, 18, 3).get_codons())
+
+    def test_bounded_by_size(self):
+        orfs = [Orf(0, 300, base * 300, '', '', True) for base in 'ACGT']
+        size = _get_size(orfs[0].get_codons())
+        derived.clear()
+        derived.max_bytes = 3 * size
+        for orf in orfs:
+            orf.get_codons()
+        self.assertEqual(3, len(derived))
+        self.assertEqual(3 * size, derived.size)
+        orfs[0].get_codons()
+        self.assertEqual((0, 5), (derived.hits, derived.misses))
+        orfs[3].get_codons()
+        self.assertEqual(1, derived.hits)
+        # a value bigger than the bound is returned, but not kept
+        derived.max_bytes = size - 1
+        self.assertEqual(100, len(Orf(0, 300, 'ACG' * 100, '', '', True).get_codons()))
+        self.assertEqual((0, 0), (len(derived), derived.size))
+
+    def test_clear(self):
+        self.orf.get_residues()
+        derived.clear()
+        self.assertEqual((0, 0, 0, 0), (len(derived), derived.size, derived.hits, derived.misses))
+
+
+class LazyOrfTest(unittest.TestCase):
+
+    def setUp(self):
+        self.seqs = [
+            Sequence('GA' + 'GCTAGCATCGAT' + 'TCGAT', True),
+            Sequence('CTA' + 'GCGAG' + 'CTAGCATCGATCGAA', True),
+            Sequence('GAGC' + 'TAGCATCGA' + 'TCGAT', False),
+            Sequence('GAGCTA' + 'GCATC' + 'GATCGA',  False)
+        ]
+        self.ends = [(2, 14), (8, 3), (4, 13), (11, 6)]
+
+    def test_same_as_orf(self):
+        for (seq, (bstart, bstop)) in zip(self.seqs, self.ends):
+            orf, lazy = seq.build_orf(bstart, bstop, 12), seq.build_lazy_orf(bstart, bstop, 12)
+            self.assertEqual(orf.to_JSON_object(), lazy.to_JSON_object())
+            self.assertEqual(orf.get_codons(), lazy.get_codons())
+            self.assertEqual(bstart % 3, lazy.frame)
+
+    def test_no_dict(self):
+        lazy = self.seqs[0].build_lazy_orf(2, 14, 12)
+        self.assertFalse(hasattr(lazy, '__dict__'))
+        self.assertRaises(AttributeError, setattr, lazy, 'bases', 'ACG')
+
+    def test_memoize(self):
+        lazy = self.seqs[1].build_lazy_orf(8, 3, 12, memoize=True)
+        self.assertEqual('CTAGCATCGATCGAACTA', lazy.bases)
+        self.assertEqual({0: 'CTAGCATCGATCGAACTA'}, lazy._memo)
+        self.assertTrue(lazy.bases is lazy.bases)
+
+    def test_residues_and_phobicity(self):
+        import kd
+        seq = Sequence('CCC' + 'ATGGCTATTCTGTGGATCGCAGTGTAA' + 'TTAGTTAGTTAG' + 'CCG', False)
+        for s in [seq, seq.get_reverse_complement()]:
+            for lazy in s.get_all_orfs(5, lazy=True):
+                orf = lazy.to_orf()
+                self.assertEqual(orf.get_residues(), lazy.get_residues())
+                for (o, l) in zip(orf.get_phobicity(kd.kyteDoolittle, 2), lazy.get_phobicity(kd.kyteDoolittle, 2)):
+                    self.assertAlmostEqual(o, l)
+                self.assertEqual(len(orf.get_phobicity(kd.triangleKyteDoolittle, 1)),
+                                 len(lazy.get_phobicity(kd.triangleKyteDoolittle, 1)))
+
+    def test_reads_only_the_part_asked_for(self):
+        seq = self.seqs[0]
+        lazy = seq.build_lazy_orf(2, 14, 12)
+        reads = []
+        original = seq.get_bases
+        seq.get_bases = lambda start=None, stop=None: reads.append((start, stop)) or original(start, stop)
+        self.assertEqual('GCTAGCATCGAT', lazy.bases)
+        self.assertEqual([(2, 14)], reads)
+
+    def test_unknown_bases_same_as_orf(self):
+        import kd
+        seq = Sequence('CCC' + 'ATGGCTATTNTGTGGATCGCAGTGCTGATTNNNCTGGCTTAA' + 'CCG', True)
+        lazy = [o for o in seq.get_orfs(5, lazy=True) if o.start == 3][0]
+        orf = lazy.to_orf()
+        self.assertEqual('MAIXWIAVLIXLA', orf.get_residues())
+        self.assertEqual(orf.get_residues(), lazy.get_residues())
+        for algorithm in [kd.kyteDoolittle, kd.triangleKyteDoolittle]:
+            o, l = orf.get_phobicity(algorithm, 1), lazy.get_phobicity(algorithm, 1)
+            self.assertEqual([x != x for x in o], [x != x for x in l])
+            for (a, b) in zip(o, l):
+                if a == a:
+                    self.assertAlmostEqual(a, b)
+            self.assertEqual(len(orf.get_phobicity_peaks(algorithm, 1, 1)), len(lazy.get_phobicity_peaks(algorithm, 1, 1)))
+
+    def test_to_orf(self):
+        orf = self.seqs[2].build_lazy_orf(4, 13, 12).to_orf()
+        self.assertTrue(isinstance(orf, Orf))
+        self.assertEqual('TAGCATCGA', orf.bases)
+
+    def test_get_orfs(self):
+        seq = Sequence('AATTAAAATAGA' + 'ATGGTGTGCTGC', False)
+        for s in [seq, seq.get_reverse_complement()]:
+            orfs, lazies = s.get_all_orfs(5), s.get_all_orfs(5, lazy=True)
+            self.assertEqual([o.to_JSON_object() for o in orfs], [o.to_JSON_object() for o in lazies])
+            self.assertTrue(all(isinstance(o, LazyOrf) for o in lazies))
+
+
 class SequenceTest(unittest.TestCase):
 
     ''' need to test: 1) forward, normal; 2) forward wrap; 3) reverse normal; 4) reverse wrap'''
@@ -303,6 +849,11 @@ class SequenceTest(unittest.TestCase):
         self.assertTrue(self.seq.is_sense())
         self.assertFalse(self.seq.get_reverse_complement().is_sense())
 
+    def test_reverse_complement_is_kept(self):
+        rev = self.seq.get_reverse_complement()
+        self.assertTrue(rev is self.seq.get_reverse_complement())
+        self.assertTrue(self.seq is rev.get_reverse_complement())
+
     def test_get_reverse_complement(self):
         self.assertEqual("GTAA" + "AACATCTACCCTTTCAGGGGTTAC" + "GT", self.seq.get_reverse_complement().get_bases())
 
@@ -330,6 +881,114 @@ class SequenceTest(unittest.TestCase):
         
         myRs = set([(11, 20), (8, 20), (6, 15), (3, 15)])
         self.assertEqual(myRs, set([(r.start, r.stop) for r in rs]))
+
+    @unittest.skipIf(vectorized.numpy is None, "numpy is not installed")
+    def test_numpy_engine(self):
+        ends = lambda orfs: [(o.start, o.stop, o.bases, o.upstream, o.downstream) for o in orfs]
+        for seq in [self.seq, self.seq.get_reverse_complement(), Sequence('AATTAAAATAGA' + 'ATGGTGTGCTGC', False)]:
+            self.assertEqual(ends(seq.get_orfs(5)), ends(seq.get_orfs(5, engine='numpy')))
+            self.assertEqual(ends(seq.get_all_orfs(5)), ends(seq.get_all_orfs(5, engine='numpy')))
+
+    def test_table_engine(self):
+        ends = lambda orfs: [(o.start, o.stop, o.bases) for o in orfs]
+        seq = Sequence('AATTAAAATAGA' + 'ATGGTGTGCTGC', False)
+        for s in [seq, seq.get_reverse_complement()]:
+            self.assertEqual(ends(s.get_all_orfs(5)), ends(s.get_all_orfs(5, engine='table')))
+
+    def test_view_engine(self):
+        ends = lambda orfs: [(o.start, o.stop, o.bases, o.upstream) for o in orfs]
+        seq = Sequence('AATTAAAATAGA' + 'ATGGTGTGCTGC', False)
+        for s in [self.seq, seq, seq.get_reverse_complement()]:
+            self.assertEqual(ends(s.get_orfs(5)), ends(s.get_orfs(5, engine='view')))
+            self.assertEqual(ends(s.get_all_orfs(5)), ends(s.get_all_orfs(5, engine='view')))
+        fresh = Sequence('AATTAAAATAGA' + 'ATGGTGTGCTGC', True)
+        fresh.get_all_orfs(5, engine='view')
+        self.assertEqual([None, None, None], fresh._codons)
+
+    def test_view_engine_has_no_stop_table(self):
+        original, sequence.getNextStops = sequence.getNextStops, None
+        try:
+            seq = Sequence('AATTAAAATAGA' + 'ATGGTGTGCTGC', False)
+            self.assertEqual(4, len(seq.get_all_orfs(5, engine='view')))
+        finally:
+            sequence.getNextStops = original
+
+    def test_iter_orfs(self):
+        ends = lambda orfs: [(o.start, o.stop, o.bases, o.upstream, o.downstream) for o in orfs]
+        orfs = self.seq.iter_orfs(5, all_orfs=True)
+        self.assertFalse(isinstance(orfs, list))
+        self.assertEqual(ends(self.seq.get_all_orfs(5)), ends(orfs))
+        self.assertEqual(ends(self.seq.get_orfs(5)), ends(self.seq.iter_orfs(5, lazy=True)))
+        fresh = Sequence(self.seq.get_bases(), True)
+        self.assertEqual(2, len(list(fresh.iter_orfs(5))))
+        self.assertEqual([None, None, None], fresh._codons)
+
+    def test_iter_orfs_streams(self):
+        import random
+        rand = random.Random(18)
+        bases = ''.join(rand.choice('ACGT') for _ in range(3000))
+        seq, read = Sequence(bases, True), []
+        class Bases(str):
+            def __getitem__(self, index):
+                read.append(index)
+                return str.__getitem__(self, index)
+            def __getslice__(self, start, stop):
+                # Python 2 slices str subclasses through here
+                return self[slice(start, stop)]
+        seq._bases = Bases(bases)
+        orfs = seq.iter_orfs(5, all_orfs=True, chunk_size=30)
+        first = next(orfs)
+        before = len(read)
+        count = 1 + sum(1 for _ in orfs)
+        # the first Orf came out long before the scan was done
+        self.assertTrue(before < len(read) / 10)
+        self.assertEqual([None, None, None], seq._codons)
+        self.assertEqual(seq.get_all_orfs(5)[0].to_JSON_object(), first.to_JSON_object())
+        self.assertEqual(len(seq.get_all_orfs(5)), count)
+
+    def test_chunked_engine(self):
+        ends = lambda orfs: [(o.start, o.stop, o.bases, o.upstream, o.downstream) for o in orfs]
+        seq = Sequence('AATTAAAATAGA' + 'ATGGTGTGCTGC', False)
+        for s in [self.seq, seq, seq.get_reverse_complement(), self.seq.pack()]:
+            self.assertEqual(ends(s.get_orfs(5)), ends(s.get_orfs(5, engine='chunked')))
+            self.assertEqual(ends(s.get_all_orfs(5)), ends(s.get_all_orfs(5, engine='chunked')))
+
+    def test_packed(self):
+        ends = lambda orfs: [(o.start, o.stop, o.bases, o.upstream, o.downstream) for o in orfs]
+        p = self.seq.pack()
+        self.assertTrue(p.is_packed())
+        self.assertEqual(self.seq.get_bases(), p.get_bases())
+        self.assertEqual('TGTTTTACACG', p.get_bases(22, 3))
+        self.assertEqual(self.seq.get_reverse_complement().get_bases(), p.get_reverse_complement().get_bases())
+        self.assertTrue(p.get_reverse_complement().is_packed())
+        for engine in ['python', 'view']:
+            self.assertEqual(ends(self.orfs), ends(p.get_orfs(5, engine=engine)))
+            self.assertEqual(ends(self.seq.get_reverse_complement().get_all_orfs(5)), 
+                             ends(p.get_reverse_complement().get_all_orfs(5, engine=engine)))
+
+    def test_packed_is_not_unpacked(self):
+        p = self.seq.pack()
+        def unpack(*args):
+            raise AssertionError("the whole genome was unpacked")
+        p._bases.get_bases = unpack
+        self.assertEqual([(o.start, o.stop) for o in self.orfs], [(o.start, o.stop) for o in p.get_orfs(5)])
+        self.assertEqual(len(self.seq.get_all_orfs(5)), len(p.get_all_orfs(5)))
+        self.assertEqual([None, None, None], p._codons)
+
+    @unittest.skipIf(vectorized.numpy is None, "numpy is not installed")
+    def test_packed_numpy_engine(self):
+        ends = lambda orfs: [(o.start, o.stop, o.bases) for o in orfs]
+        p = self.seq.pack().get_reverse_complement()
+        self.assertEqual(ends(self.seq.get_reverse_complement().get_all_orfs(5)), ends(p.get_all_orfs(5, engine='numpy')))
+
+    def test_get_orf_ends(self):
+        ends = self.seq.get_orf_ends()
+        self.assertEqual([(o.start, o.stop) for o in self.orfs], [(b, c) for (_, b, c) in ends])
+        self.assertEqual([b % 3 for (_, b, _) in ends], [n for (n, _, _) in ends])
+        self.assertEqual(len(self.seq.get_all_orfs(5)), len(self.seq.get_orf_ends(all_orfs=True)))
+
+    def test_unknown_engine(self):
+        self.assertRaises(ValueError, self.seq.get_orfs, 5, 'fortran')
         
     ### from Orf
 
@@ -376,8 +1035,49 @@ class OrfCollectionTest(unittest.TestCase):
         c = self.oc.filter
         cs = c(lambda o: o.start < 20), c(lambda o: o.bases == 'CGAGAATAG'), c(lambda o: o.is_sense)
         self.assertEqual([2, 1, 2], map(lambda oc: len(oc.get_orfs()), cs))
+
+    def test_filter_twice(self):
+        sense = self.oc.filter(lambda o: o.is_sense)
+        self.assertEqual(2, len(sense.get_orfs()))
+        self.assertEqual(2, len(list(sense.get_orfs())))
+
+
+class OrfQueryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.orfs = [Orf(i, i + 3 * (i % 7), 'ATG' * (i % 7), '', '', i % 2 == 0) for i in range(50)]
+        self.oc = OrfCollection(self.orfs)
+
+    def test_filter_map(self):
+        q = self.oc.query().filter(lambda o: o.is_sense).map(lambda o: o.start)
+        self.assertEqual(list(range(0, 50, 2)), q.to_list())
+        self.assertEqual(25, q.count())
+
+    def test_limit_stops_early(self):
+        read = []
+        def source():
+            for orf in self.orfs:
+                read.append(orf)
+                yield orf
+        q = OrfQuery(source()).filter(lambda o: not o.is_sense).limit(3)
+        self.assertEqual([1, 3, 5], [o.start for o in q])
+        self.assertEqual(6, len(read))
+
+    def test_top(self):
+        q = self.oc.query().top(3, key=lambda o: (len(o.bases), o.start))
+        self.assertEqual([48, 41, 34], [o.start for o in q])
+        q = self.oc.query().filter(lambda o: o.is_sense).top(2, key=lambda o: len(o.bases)).map(lambda o: o.start)
+        self.assertEqual([6, 20], q.to_list())
+
+    def test_lazy_and_rerunnable(self):
+        calls = []
+        q = self.oc.query().filter(lambda o: calls.append(o) or True)
+        self.assertEqual([], calls)
+        self.assertEqual(50, len(q.to_collection().get_orfs()))
+        self.assertEqual(50, q.count())
+        self.assertEqual(100, len(calls))
         
 
 
 
-testClasses = [OrfTest, SequenceTest, OrfCollectionTest]
+testClasses = [OrfTest, DerivedCacheTest, LazyOrfTest, SequenceTest, OrfCollectionTest, OrfQueryTest]
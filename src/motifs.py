@@ -0,0 +1,176 @@
+import filterer
+import model
+import bisect
+import collections
+import unittest
+
+
+
+class AhoCorasick(object):
+
+    '''Automaton that finds every occurrence of any of a set of patterns
+       in a single left-to-right pass over a text.
+
+       public methods:
+        - search(text)
+    '''
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        if any(len(p) == 0 for p in self.patterns):
+            raise ValueError("patterns must not be empty")
+
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+        for (pix, pattern) in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+            self._out[state].append(pix)
+
+        # breadth-first, so that every state's fail state is already done
+        queue = collections.deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for (char, child) in self._goto[state].items():
+                queue.append(child)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def search(self, text, start=0, stop=None):
+        '''[(Int, Int)]:  (position, pattern index) of every match that
+        lies in text[start:stop], in order of where the match ends'''
+        goto, fail, out, patterns = self._goto, self._fail, self._out, self.patterns
+        stop = len(text) if stop is None else stop
+        hits, state, i = [], 0, start
+        while i < stop:
+            char = text[i]
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for pix in out[state]:
+                hits.append((i + 1 - len(patterns[pix]), pix))
+            i += 1
+        return hits
+
+
+
+def scan_upstream(orfs, patterns, window=(-15, -5)):
+    '''[Orf] -> [Pattern] -> [[(Pattern, Int)]]
+
+    For each Orf, the motifs found in its upstream region, with offsets
+    relative to the start codon (-1 is the base right before it).
+    `window` is the region searched, like filterer.hasUpstreamSequence:
+    (-15, -5) means upstream[-15:-5].
+
+    All the windows are joined into one text (separated by a character
+    that's never in a motif) and scanned in a single pass.
+    '''
+    automaton = AhoCorasick(patterns)
+    lo, hi = window
+    pieces, starts, offsets, position = [], [], [], 0
+    for orf in orfs:
+        upstream = orf.upstream
+        region = upstream[lo:hi]
+        # where upstream[lo:hi] begins, relative to the start codon
+        skipped = len(upstream[:lo]) if lo is not None else 0
+        offsets.append(skipped - len(upstream))
+        starts.append(position)
+        pieces.append(region)
+        position += len(region) + 1
+    text = '|'.join(pieces)
+
+    found = [[] for _ in starts]
+    for (position, pix) in automaton.search(text):
+        k = bisect.bisect_right(starts, position) - 1
+        found[k].append((patterns[pix], offsets[k] + position - starts[k]))
+    for hits in found:
+        hits.sort(key=lambda hit: hit[1])
+    return found
+
+
+def scan_genome(bases, patterns):
+    '''[Base] -> [Pattern] -> [(Int, Pattern)]
+
+    Every occurrence of any motif in a circular genome, as (position, motif),
+    sorted by position;  matches may wrap around the end of the genome.
+    '''
+    automaton = AhoCorasick(patterns)
+    longest = max(len(p) for p in patterns)
+    text = bases + bases[:longest - 1]
+    hits = [(position, patterns[pix]) for (position, pix) in automaton.search(text)
+            if position < len(bases)]
+    hits.sort()
+    return hits
+
+
+
+########################################################
+# unit tests
+########################################################
+
+class AhoCorasickTest(unittest.TestCase):
+
+    def _naive(self, text, patterns):
+        hits = [(i, pix) for (pix, p) in enumerate(patterns) for i in range(len(text)) if text.startswith(p, i)]
+        return sorted(hits)
+
+    def test_search(self):
+        patterns = ['he', 'she', 'his', 'hers']
+        self.assertEqual([(1, 1), (2, 0), (2, 3)], sorted(AhoCorasick(patterns).search('ushers')))
+
+    def test_overlapping_patterns(self):
+        import random
+        rand = random.Random(7)
+        for _ in range(30):
+            patterns = list(set(''.join(rand.choice('ACGT') for _ in range(rand.randint(1, 4))) for _ in range(6)))
+            text = ''.join(rand.choice('ACGT') for _ in range(100))
+            self.assertEqual(self._naive(text, patterns), sorted(AhoCorasick(patterns).search(text)))
+
+    def test_empty_pattern(self):
+        self.assertRaises(ValueError, AhoCorasick, ['GG', ''])
+
+
+class ScanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.orfs = [
+            model.Orf(1, 10, 'ATG', 'TTAGGAGGTTTCCAAATTTTT', '', True),
+            model.Orf(2, 11, 'ATG', 'AAAAAAAAAAAAAAAAAAAAA', '', True),
+            model.Orf(3, 12, 'ATG', 'GGAGG', '', False),
+            model.Orf(4, 13, 'ATG', 'CCCCCCAGGAGGCCCCCCCCC', '', True)
+        ]
+
+    def test_scan_upstream(self):
+        hits = scan_upstream(self.orfs, ['GGAGG', 'AGG', 'TTT'])
+        self.assertEqual([[('TTT', -13)], [], [], [('AGG', -15), ('GGAGG', -14), ('AGG', -12)]], hits)
+
+    def test_scan_upstream_window(self):
+        hits = scan_upstream(self.orfs[:1], ['GGAGG', 'AGG', 'TTT'], window=(-21, None))[0]
+        self.assertEqual([('AGG', -19), ('GGAGG', -18), ('AGG', -16), ('TTT', -13),
+                          ('TTT', -5), ('TTT', -4), ('TTT', -3)], hits)
+
+    def test_same_as_has_upstream_sequence(self):
+        patterns = ['GG', 'AGG', 'TTTCC', 'CCCC']
+        hits = scan_upstream(self.orfs, patterns)
+        for (orf, orfHits) in zip(self.orfs, hits):
+            for p in patterns:
+                self.assertEqual(filterer.hasUpstreamSequence(orf, p), p in [h[0] for h in orfHits])
+
+    def test_scan_genome(self):
+        self.assertEqual([(0, 'ATG'), (6, 'GAT'), (7, 'ATG'), (9, 'GAT')], scan_genome('ATGCCCGATG', ['ATG', 'GAT']))
+        self.assertEqual([(8, 'TGA')], scan_genome('ACCCCCCCTG', ['TGA']))
+
+
+
+testClasses = [AhoCorasickTest, ScanTest]
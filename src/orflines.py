@@ -0,0 +1,167 @@
+import model
+import gzip
+import json
+import os
+import tempfile
+import unittest
+
+
+
+# Orfs as JSON Lines:  one Orf.to_JSON_object per line, so that files can be
+# written and read one Orf at a time.  Gzip is used when asked for or when
+# the path ends in .gz;  readers recognize it by its magic number.
+
+_GZIP_MAGIC = b'\x1f\x8b'
+
+
+def _to_bytes(text):
+    if isinstance(text, bytes):
+        return text
+    return text.encode('ascii')
+
+
+def _open_write(path, compress):
+    if compress is None:
+        compress = path.endswith('.gz')
+    return gzip.open(path, 'wb') if compress else open(path, 'wb')
+
+
+def _open_read(path):
+    with open(path, 'rb') as infile:
+        is_gzip = infile.read(len(_GZIP_MAGIC)) == _GZIP_MAGIC
+    return gzip.open(path, 'rb') if is_gzip else open(path, 'rb')
+
+
+def dump_orf(orf):
+    '''Orf -> String:  one line, newline included'''
+    return json.dumps(orf.to_JSON_object(), separators=(',', ':')) + '\n'
+
+
+def load_orf(line):
+    '''String -> Orf'''
+    return model.Orf.from_JSON_object(json.loads(line))
+
+
+def write_orfs(path, orfs, compress=None):
+    '''Path -> [Orf] -> Int
+
+    Writes each Orf as soon as the iterable yields it, so a scanner's
+    generator can be written out without ever holding all of its Orfs.
+    Returns how many were written.
+    '''
+    count = 0
+    outfile = _open_write(path, compress)
+    try:
+        for orf in orfs:
+            outfile.write(_to_bytes(dump_orf(orf)))
+            count += 1
+    finally:
+        outfile.close()
+    return count
+
+
+def read_orfs(path):
+    '''Path -> Generator Orf
+
+    Reads one line at a time, so the caller can start using Orfs before
+    the file is read (or even finished being written).
+    '''
+    infile = _open_read(path)
+    try:
+        for line in infile:
+            if line.strip():
+                yield load_orf(line)
+    finally:
+        infile.close()
+
+
+
+########################################################
+# unit tests
+########################################################
+
+class OrfLinesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.orfs = [
+            model.Orf(14, 27, 'ACGGGGTTTCCC', 'CCC', 'ATT', True),
+            model.Orf(21, 3, 'CGAGAATAG', 'GGG', '', False)
+        ]
+        self.paths = []
+
+    def tearDown(self):
+        for path in self.paths:
+            os.remove(path)
+
+    def _path(self, suffix=''):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        os.close(handle)
+        self.paths.append(path)
+        return path
+
+    def _check(self, orfs):
+        self.assertEqual([o.to_JSON_object() for o in self.orfs], [o.to_JSON_object() for o in orfs])
+
+    def test_round_trip(self):
+        path = self._path('.jsonl')
+        self.assertEqual(2, write_orfs(path, iter(self.orfs)))
+        with open(path, 'rb') as infile:
+            self.assertEqual(2, len(infile.read().splitlines()))
+        self._check(read_orfs(path))
+
+    def test_gzip(self):
+        path = self._path('.jsonl.gz')
+        write_orfs(path, self.orfs)
+        with open(path, 'rb') as infile:
+            self.assertEqual(_GZIP_MAGIC, infile.read(2))
+        self._check(read_orfs(path))
+        plain = self._path('.gz')
+        write_orfs(plain, self.orfs, compress=False)
+        self._check(read_orfs(plain))
+
+    def test_streams(self):
+        path = self._path()
+        seen = []
+        def orfs():
+            for orf in self.orfs:
+                seen.append(orf)
+                yield orf
+        write_orfs(path, orfs())
+        self.assertEqual(2, len(seen))
+        reader = read_orfs(path)
+        self.assertEqual(14, next(reader).start)
+        self.assertEqual(21, next(reader).start)
+        self.assertRaises(StopIteration, next, reader)
+
+    def test_written_while_scanning(self):
+        import random
+        rand = random.Random(18)
+        bases = ''.join(rand.choice('ACGT') for _ in range(3000))
+        reads = []
+        class Bases(str):
+            def __getitem__(self, index):
+                reads.append(index)
+                return str.__getitem__(self, index)
+            def __getslice__(self, start, stop):
+                # Python 2 slices str subclasses through here
+                return self[slice(start, stop)]
+        seq = model.Sequence(Bases(bases), True)
+        progress = []
+        def scanning():
+            for orf in seq.iter_orfs(5, all_orfs=True, chunk_size=30):
+                progress.append(len(reads))
+                yield orf
+        path = self._path()
+        count = write_orfs(path, scanning())
+        # the first Orfs were written long before the scan was done
+        self.assertTrue(progress[0] < progress[-1] / 10)
+        expected = model.Sequence(bases, True).get_all_orfs(5)
+        self.assertEqual(len(expected), count)
+        self.assertEqual([o.to_JSON_object() for o in expected], [o.to_JSON_object() for o in read_orfs(path)])
+
+    def test_dump_orf(self):
+        self.assertEqual(self.orfs[1].to_JSON_object(), load_orf(dump_orf(self.orfs[1])).to_JSON_object())
+
+
+
+testClasses = [OrfLinesTest]
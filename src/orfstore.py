@@ -0,0 +1,290 @@
+import model
+import array
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+
+# file layout (all little-endian):
+#   _MAGIC
+#   _HEADER:  number of Orfs, byte offset of the columns
+#   blob:     bases + upstream + downstream of each Orf, back to back
+#   columns:  start (int64 x n), stop (int64 x n),
+#             blob offsets (uint64 x 3n+1), is_sense (uint8 x n)
+_MAGIC = b'ORFSTOR1'
+_HEADER = struct.Struct('<QQ')
+_DATA_START = len(_MAGIC) + _HEADER.size
+
+
+def _typecode(candidates, itemsize):
+    '''the array typecode with this itemsize ('q' doesn't exist on Python 2)'''
+    for code in candidates:
+        try:
+            if array.array(code).itemsize == itemsize:
+                return code
+        except ValueError:
+            pass
+    raise ValueError("no %d-byte array typecode in %s" % (itemsize, candidates))
+
+_INT64 = _typecode('qli', 8)
+_UINT64 = _typecode('QLI', 8)
+
+
+def _to_str(data):
+    '''bytes from the mmap -> str (a no-op on Python 2)'''
+    if isinstance(data, str):
+        return data
+    return data.decode('ascii')
+
+
+def _to_bytes(text):
+    if isinstance(text, bytes):
+        return text
+    return text.encode('ascii')
+
+
+def is_orf_store(path):
+    '''Bool:  was `path` written by write_orfs?'''
+    with open(path, 'rb') as infile:
+        return infile.read(len(_MAGIC)) == _MAGIC
+
+
+def write_orfs(path, orfs):
+    '''Path -> [Orf] -> Int
+
+    Writes the Orfs (any iterable, consumed once) to `path` in one pass;
+    returns how many were written.
+    '''
+    starts, stops, senses = array.array(_INT64), array.array(_INT64), array.array('B')
+    offsets = array.array(_UINT64, [0])
+    size = 0
+    handle, temp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+    with os.fdopen(handle, 'wb') as outfile:
+        outfile.write(_MAGIC)
+        outfile.write(_HEADER.pack(0, 0))
+        for orf in orfs:
+            starts.append(orf.start)
+            stops.append(orf.stop)
+            senses.append(1 if orf.is_sense else 0)
+            for part in [orf.bases, orf.upstream, orf.downstream]:
+                data = _to_bytes(part)
+                outfile.write(data)
+                size += len(data)
+                offsets.append(size)
+        columns = _DATA_START + size
+        for column in [starts, stops, offsets, senses]:
+            if sys.byteorder == 'big':
+                column.byteswap()
+            column.tofile(outfile)
+        outfile.seek(len(_MAGIC))
+        outfile.write(_HEADER.pack(len(starts), columns))
+    os.rename(temp, path)
+    return len(starts)
+
+
+
+class OrfStore(object):
+
+    '''Read-only, memory-mapped view of a file written by write_orfs.
+
+       Opening one only reads the header;  an Orf is only built when it's
+       asked for.  With numpy installed, columns are zero-copy views into
+       the mapping:  closing the store while any are still alive leaves the
+       mapping to be released when the last of them is freed, so they stay
+       valid.  Anything else raises ValueError once the store is closed.
+
+       Close it when done, or use it as a context manager:
+           with OrfStore(path) as store: ...
+
+       public methods:
+        - len / iteration / indexing (each yields a fresh model.Orf)
+        - get_starts, get_stops, get_is_sense  (whole columns)
+        - get_orfs
+        - to_collection
+        - close / closed
+    '''
+
+    def __init__(self, path):
+        with open(path, 'rb') as infile:
+            if infile.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError("<%s> is not an Orf store" % str(path))
+            self._count, columns = _HEADER.unpack(infile.read(_HEADER.size))
+            self._map = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        self.closed = False
+        self._exported = False
+        n = self._count
+        self._starts_at = columns
+        self._stops_at = columns + 8 * n
+        self._offsets_at = columns + 16 * n
+        self._senses_at = columns + 16 * n + 8 * (3 * n + 1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        if not self.closed:
+            # views (and slices of them) hold the mapping, which is
+            # unmapped when the last of them is freed
+            if not self._exported:
+                self._map.close()
+            self._map = None
+            self.closed = True
+
+    ##############################
+
+    def _check_open(self):
+        if self.closed:
+            raise ValueError("Orf store is closed")
+
+    def _column(self, at, dtype, typecode):
+        self._check_open()
+        if numpy is not None:
+            self._exported = True
+            return numpy.frombuffer(self._map, dtype=dtype, count=self._count, offset=at)
+        column = array.array(typecode)
+        data = self._map[at:at + column.itemsize * self._count]
+        if hasattr(column, 'frombytes'):
+            column.frombytes(data)
+        else:
+            column.fromstring(data)
+        if sys.byteorder == 'big':
+            column.byteswap()
+        return column
+
+    def get_starts(self):
+        return self._column(self._starts_at, '<i8', _INT64)
+
+    def get_stops(self):
+        return self._column(self._stops_at, '<i8', _INT64)
+
+    def get_is_sense(self):
+        return self._column(self._senses_at, 'u1', 'B')
+
+    ##############################
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._count))]
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError("Orf index out of range")
+        self._check_open()
+        m = self._map
+        start, = struct.unpack_from('<q', m, self._starts_at + 8 * i)
+        stop, = struct.unpack_from('<q', m, self._stops_at + 8 * i)
+        ends = struct.unpack_from('<4Q', m, self._offsets_at + 24 * i)
+        parts = [_to_str(m[_DATA_START + lo:_DATA_START + hi]) for (lo, hi) in zip(ends, ends[1:])]
+        is_sense = m[self._senses_at + i:self._senses_at + i + 1] == b'\x01'
+        return model.Orf(start, stop, parts[0], parts[1], parts[2], is_sense)
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self[i]
+
+    def get_orfs(self):
+        return list(self)
+
+    def to_collection(self):
+        '''model.OrfCollection over this store;  Orfs are still built on demand,
+        so it can only be used while the store is open'''
+        return model.OrfCollection(self)
+
+
+
+########################################################
+# unit tests
+########################################################
+
+class OrfStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.orfs = [
+            model.Orf(14, 27, 'ACGGGGTTTCCC', 'CCC', 'ATT', True),
+            model.Orf(21, 3, 'CGAGAATAG', 'GGG', '', False),
+            model.Orf(2 ** 40, 0, '', '', '', True)
+        ]
+        handle, self.path = tempfile.mkstemp()
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_round_trip(self):
+        self.assertEqual(3, write_orfs(self.path, iter(self.orfs)))
+        with OrfStore(self.path) as store:
+            self.assertEqual(3, len(store))
+            self.assertEqual([o.to_JSON_object() for o in self.orfs], [o.to_JSON_object() for o in store])
+            self.assertEqual(self.orfs[1].to_JSON_object(), store[-2].to_JSON_object())
+            self.assertEqual(2, len(store[1:]))
+            self.assertRaises(IndexError, store.__getitem__, 3)
+
+    def test_columns(self):
+        write_orfs(self.path, self.orfs)
+        with OrfStore(self.path) as store:
+            self.assertEqual([14, 21, 2 ** 40], list(store.get_starts()))
+            self.assertEqual([27, 3, 0], list(store.get_stops()))
+            self.assertEqual([1, 0, 1], list(store.get_is_sense()))
+
+    def test_columns_outlive_close(self):
+        write_orfs(self.path, self.orfs)
+        with OrfStore(self.path) as store:
+            starts, senses = store.get_starts(), store.get_is_sense()
+        self.assertTrue(store.closed)
+        self.assertEqual([14, 21, 2 ** 40], list(starts))
+        self.assertEqual([1, 0, 1], list(senses))
+        self.assertRaises(ValueError, store.get_stops)
+        self.assertRaises(ValueError, store.__getitem__, 0)
+
+    @unittest.skipIf(numpy is None, "numpy isn't installed")
+    def test_columns_are_views(self):
+        write_orfs(self.path, self.orfs)
+        store = OrfStore(self.path)
+        starts = store.get_starts()[1:]
+        self.assertFalse(starts.flags.owndata)
+        store.close()
+        # still mapped:  the view holds it
+        self.assertEqual([21, 2 ** 40], list(starts))
+        store = OrfStore(self.path)
+        mapping = store._map
+        store[0]
+        store.close()
+        # no columns were handed out:  unmapped right away
+        self.assertRaises(ValueError, mapping.read, 1)
+
+    def test_empty(self):
+        write_orfs(self.path, [])
+        with OrfStore(self.path) as store:
+            self.assertEqual([], store.get_orfs())
+            self.assertEqual(0, len(store.get_starts()))
+
+    def test_collection(self):
+        write_orfs(self.path, self.orfs)
+        with OrfStore(self.path) as store:
+            coll = store.to_collection().filter(lambda o: o.is_sense)
+        self.assertEqual([14, 2 ** 40], [o.start for o in coll.get_orfs()])
+
+    def test_not_a_store(self):
+        with open(self.path, 'w') as outfile:
+            outfile.write('[]')
+        self.assertFalse(is_orf_store(self.path))
+        self.assertRaises(ValueError, OrfStore, self.path)
+
+
+
+testClasses = [OrfStoreTest]
@@ -0,0 +1,336 @@
+import sequence
+import vectorized
+import array
+import binascii
+import bisect
+import re
+import unittest
+
+
+
+_BASES = 'ACGT'
+
+# a byte holds 4 bases, first base in the high bits
+_UNPACK = [''.join(_BASES[(byte >> shift) & 3] for shift in (6, 4, 2, 0)) for byte in range(256)]
+_UNPACK_CODES = [bytes(bytearray((byte >> shift) & 3 for shift in (6, 4, 2, 0))) for byte in range(256)]
+_PACK = dict((bases, byte) for (byte, bases) in enumerate(_UNPACK))
+
+# reverses the order of the 4 bases in a byte, and complements each one
+_REVCOMP_BYTE = bytearray(
+    sum((3 - ((byte >> (6 - 2 * k)) & 3)) << (2 * k) for k in range(4)) for byte in range(256)
+)
+
+# a run of the same character, other than 'ACGT' (after case is normalized)
+_RUN = re.compile(r'([^ACGT])\1*')
+
+# a run of lowercase (soft-masked) bases
+_LOWER = re.compile(r'[a-z]+')
+
+_INVALID = 4
+
+_START_STOP_ERROR = "start and stop must be between 0 and sequence length"
+
+
+def _find_runs(bases):
+    '''[Base] -> [(Int, Int, Base)]:  runs of anything that isn't 'ACGT' '''
+    return [(m.start(), m.end(), m.group(1)) for m in _RUN.finditer(bases)]
+
+
+def _extend_runs(runs, more):
+    '''appends `more` to `runs`, joining a run that carries straight on from the last one'''
+    if runs and more and runs[-1][1] == more[0][0] and runs[-1][2:] == more[0][2:]:
+        runs[-1] = (runs[-1][0],) + more.pop(0)[1:]
+    runs.extend(more)
+
+
+def _clip(starts, stops, start, stop):
+    '''indices of the runs overlapping [start, stop)'''
+    i = bisect.bisect_right(stops, start)
+    while i < len(starts) and starts[i] < stop:
+        yield i
+        i += 1
+
+
+
+class PackedBases(object):
+
+    '''A nucleotide sequence stored at 2 bits per base.
+
+       Case is kept apart, as runs of lowercase (soft-masked) bases, so
+       a masked region costs one entry however long it is.  Anything else
+       other than 'ACGT' (N, IUPAC codes) is kept in a side table of runs
+       of the same character, and is packed as 'A'.  Supports `len` and
+       slicing (without step), so it can stand in for the bases string
+       of a model.Sequence.
+
+       public methods:
+        - get_bases(start, stop)
+        - reverse_complement()
+        - get_base_codes()
+        - get_codon_codes(n)
+    '''
+
+    def __init__(self, bases):
+        self._length = len(bases)
+
+        lower = [(m.start(), m.end()) for m in _LOWER.finditer(bases)]
+        self._lower_starts = [r[0] for r in lower]
+        self._lower_stops = [r[1] for r in lower]
+        if lower:
+            bases = bases.upper()
+
+        runs = _find_runs(bases)
+        self._run_starts = [r[0] for r in runs]
+        self._run_stops = [r[1] for r in runs]
+        self._run_bases = [r[2] for r in runs]
+
+        if runs:
+            # the side table has the run's base;  'A' is a placeholder in the packed data
+            bases = _RUN.sub(lambda m: 'A' * len(m.group()), bases)
+        padded = bases + 'A' * (-len(bases) % 4)
+        self._data = bytearray(_PACK[padded[i:i + 4]] for i in range(0, len(padded), 4))
+
+
+    @staticmethod
+    def from_chunks(chunks):
+        '''PackedBases of the concatenation of `chunks` (an iterable of
+        strings), each packed as it comes, so that the bases are never
+        all held unpacked'''
+        length, data, runs, lower, carry = 0, bytearray(), [], [], ''
+        chunks = iter(chunks)
+        while True:
+            chunk = next(chunks, None)
+            bases = carry + chunk if chunk is not None else carry
+            # pack whole bytes, until the last chunk
+            cut = len(bases) - len(bases) % 4 if chunk is not None else len(bases)
+            piece, carry = PackedBases(bases[:cut]), bases[cut:]
+            data.extend(piece._data)
+            _extend_runs(runs, [(start + length, stop + length, base) for (start, stop, base)
+                                in zip(piece._run_starts, piece._run_stops, piece._run_bases)])
+            _extend_runs(lower, [(start + length, stop + length) for (start, stop)
+                                 in zip(piece._lower_starts, piece._lower_stops)])
+            length += cut
+            if chunk is None:
+                return PackedBases._from_parts(length, data, runs, lower)
+
+    @staticmethod
+    def _from_parts(length, data, runs, lower):
+        packed = PackedBases('')
+        packed._length = length
+        packed._data = data
+        packed._run_starts = [r[0] for r in runs]
+        packed._run_stops = [r[1] for r in runs]
+        packed._run_bases = [r[2] for r in runs]
+        packed._lower_starts = [r[0] for r in lower]
+        packed._lower_stops = [r[1] for r in lower]
+        return packed
+
+    ########################
+
+    def _get_runs(self, start, stop):
+        '''runs overlapping [start, stop), clipped to it'''
+        return [(max(start, self._run_starts[i]), min(stop, self._run_stops[i]), self._run_bases[i])
+                for i in _clip(self._run_starts, self._run_stops, start, stop)]
+
+
+    def _get_lower(self, start, stop):
+        '''lowercase runs overlapping [start, stop), clipped to it'''
+        return [(max(start, self._lower_starts[i]), min(stop, self._lower_stops[i]))
+                for i in _clip(self._lower_starts, self._lower_stops, start, stop)]
+
+
+    def _slice(self, start, stop):
+        '''linear slice, 0 <= start <= stop <= length'''
+        first, last = start // 4, (stop + 3) // 4
+        bases = ''.join([_UNPACK[b] for b in self._data[first:last]])[start - 4 * first: stop - 4 * first]
+
+        runs = self._get_runs(start, stop)
+        if runs:
+            pieces, prev = [], start
+            for (rstart, rstop, base) in runs:
+                pieces.append(bases[prev - start: rstart - start])
+                pieces.append(base * (rstop - rstart))
+                prev = rstop
+            pieces.append(bases[prev - start:])
+            bases = ''.join(pieces)
+
+        lower = self._get_lower(start, stop)
+        if lower:
+            pieces, prev = [], start
+            for (rstart, rstop) in lower:
+                pieces.append(bases[prev - start: rstart - start])
+                pieces.append(bases[rstart - start: rstop - start].lower())
+                prev = rstop
+            pieces.append(bases[prev - start:])
+            bases = ''.join(pieces)
+        return bases
+
+    ##############################
+
+    def __len__(self):
+        return self._length
+
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._length)
+            if step != 1:
+                raise ValueError("packed bases can't be sliced with a step")
+            return self._slice(start, max(start, stop))
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("base index out of range")
+        return self._slice(index, index + 1)
+
+
+    def __str__(self):
+        return self.get_bases()
+
+
+    def get_bases(self, start=None, stop=None):
+        '''same semantics as model.Sequence.get_bases:  wraps around if stop <= start'''
+        if start is None or stop is None:
+            return self._slice(0, self._length)
+
+        assert 0 <= start < self._length, _START_STOP_ERROR
+        assert 0 <= stop < self._length, _START_STOP_ERROR
+
+        if stop > start:
+            return self._slice(start, stop)
+        return self._slice(start, self._length) + self._slice(0, stop)
+
+
+    def reverse_complement(self):
+        '''PackedBases, without unpacking the bases'''
+        data = self._data.translate(_REVCOMP_BYTE)
+        data.reverse()
+
+        # the padding of the last byte is now at the front:  shift it out
+        pad = 2 * (-self._length % 4)
+        if pad and data:
+            bits = 8 * len(data)
+            value = (int(binascii.hexlify(bytes(data)), 16) << pad) & ((1 << bits) - 1)
+            data = bytearray(binascii.unhexlify('%0*x' % (2 * len(data), value)))
+
+        length = self._length
+        runs = [(length - stop, length - start, sequence.COMPLEMENTS[base])
+                for (start, stop, base) in zip(self._run_starts, self._run_stops, self._run_bases)]
+        runs.reverse()
+        lower = [(length - stop, length - start) for (start, stop) in zip(self._lower_starts, self._lower_stops)]
+        lower.reverse()
+        return PackedBases._from_parts(length, data, runs, lower)
+
+
+    def get_base_codes(self):
+        '''bytearray of base codes:  0-3 for 'ACGT', 4 for anything else
+        (lowercase included, as in vectorized.encodeBases)'''
+        codes = bytearray(b''.join([_UNPACK_CODES[b] for b in self._data]))
+        del codes[self._length:]
+        for (start, stop) in zip(self._run_starts + self._lower_starts, self._run_stops + self._lower_stops):
+            codes[start:stop] = bytearray([_INVALID]) * (stop - start)
+        return codes
+
+
+    def get_codon_codes(self, n):
+        '''array('B'):  6-bit codon codes of the circular sequence read from
+        base `n` (vectorized.NO_CODON for codons with an ambiguous base)'''
+        if self._length % 3 != 0:
+            raise ValueError("number of bases must be divisible by 3")
+        codes = self.get_base_codes()
+        n %= max(self._length, 1)
+        rotated = codes[n:] + codes[:n]
+        return array.array('B', (vectorized.NO_CODON if (a | b | c) & _INVALID else a * 16 + b * 4 + c
+                                 for (a, b, c) in zip(rotated[0::3], rotated[1::3], rotated[2::3])))
+
+
+
+########################################################
+# unit tests
+########################################################
+
+class PackedBasesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.plain = 'ACGTAACCCCTGAAAGGGTAGATGTTTTAC'
+        self.ambiguous = 'ACGNNNTAACCRCCTGAAAGGGTAGATGTTTTAn'
+        self.all = [self.plain, self.ambiguous, 'A', 'ACG', 'TTGCA', 'NNNN', '']
+
+    def testRoundTrip(self):
+        for bases in self.all:
+            packed = PackedBases(bases)
+            self.assertEqual(len(bases), len(packed))
+            self.assertEqual(bases, packed.get_bases())
+
+    def testSlicing(self):
+        packed = PackedBases(self.ambiguous)
+        for start in range(len(self.ambiguous)):
+            for stop in range(start, len(self.ambiguous) + 1):
+                self.assertEqual(self.ambiguous[start:stop], packed[start:stop])
+        self.assertEqual('R', packed[11])
+        self.assertEqual('n', packed[-1])
+
+    def testGetBasesWrap(self):
+        packed = PackedBases(self.plain)
+        self.assertEqual('AACCC', packed.get_bases(4, 9))
+        self.assertEqual('TGTTTTACACG', packed.get_bases(22, 3))
+
+    def testReverseComplement(self):
+        for bases in ['ACGTCCTGA', 'ACGT', 'AC', 'ACGTA', 'ACGTAC']:
+            self.assertEqual(sequence.reverseComplement(bases), PackedBases(bases).reverse_complement().get_bases())
+
+    def testReverseComplementAmbiguous(self):
+        rc = PackedBases('ACNNRGTa').reverse_complement()
+        self.assertEqual('tACYNNGT', rc.get_bases())
+        self.assertEqual('ACNNRGTa', rc.reverse_complement().get_bases())
+
+    def testBaseCodes(self):
+        self.assertEqual(bytearray([0, 1, 4, 4, 2, 3]), PackedBases('ACNNGT').get_base_codes())
+
+    def testCodonCodes(self):
+        bases = 'ATGAAACNNGTT'
+        for n in range(3):
+            rotated = bases[n:] + bases[:n]
+            expected = [vectorized.codonCode(rotated[i:i + 3]) for i in range(0, len(rotated), 3)]
+            codes = PackedBases(bases).get_codon_codes(n)
+            self.assertEqual(array.array('B', expected), codes)
+
+    def testSoftMasked(self):
+        bases = 'ACGTacgtacgtNNnnACGTaAcgtR'
+        packed = PackedBases(bases)
+        self.assertEqual(bases, packed.get_bases())
+        self.assertEqual([(4, 12), (14, 16), (20, 21), (22, 25)], list(zip(packed._lower_starts, packed._lower_stops)))
+        self.assertEqual(['N', 'R'], packed._run_bases)
+        for start in range(len(bases)):
+            self.assertEqual(bases[start:], packed[start:])
+            self.assertEqual(bases[:start], packed[:start])
+        self.assertEqual(sequence.reverseComplement(bases), packed.reverse_complement().get_bases())
+        self.assertEqual(bytearray([0, 1, 2, 3, 4, 4]), PackedBases('ACGTca').get_base_codes())
+
+    def testSoftMaskedSideTable(self):
+        import random
+        rand = random.Random(4)
+        bases = ''.join(rand.choice('ACGT') for _ in range(3000))
+        masked = bases[:1000] + bases[1000:2500].lower() + bases[2500:]
+        packed = PackedBases(masked)
+        self.assertEqual(1, len(packed._lower_starts))
+        self.assertEqual(0, len(packed._run_starts))
+        self.assertEqual(masked, packed.get_bases())
+
+    def testFromChunks(self):
+        import random
+        rand = random.Random(20)
+        for _ in range(50):
+            bases = ''.join(rand.choice('ACGTNNacgtnR') for _ in range(rand.randint(0, 60)))
+            cuts = sorted(rand.randint(0, len(bases)) for _ in range(rand.randint(0, 6)))
+            chunks = [bases[i:j] for (i, j) in zip([0] + cuts, cuts + [len(bases)])]
+            whole, packed = PackedBases(bases), PackedBases.from_chunks(iter(chunks))
+            self.assertEqual(bases, packed.get_bases())
+            self.assertEqual(whole._data, packed._data)
+            self.assertEqual((whole._run_starts, whole._run_stops, whole._run_bases),
+                             (packed._run_starts, packed._run_stops, packed._run_bases))
+            self.assertEqual((whole._lower_starts, whole._lower_stops), (packed._lower_starts, packed._lower_stops))
+
+
+
+testClasses = [PackedBasesTest]
@@ -0,0 +1,232 @@
+import loader
+import model
+import multiprocessing
+import os
+import unittest
+
+
+
+# Each task scans one codon alignment of one strand of one genome.
+# The bases of every strand are put in shared memory once, before the
+# workers start;  a task only sends its coordinates, and a worker only
+# sends back Orf ends, which the parent turns into Orfs in task order
+# (or hands back as they are:  see scan_genome_ends).
+#
+# With the engines in _SLICING_ENGINES, a worker reads the bases straight
+# out of shared memory a slice at a time, so no process holds a copy of a
+# strand;  any other engine needs the whole strand as a string, and each
+# worker copies each strand it scans once (genome size x workers, on top
+# of the shared memory).
+
+_SLICING_ENGINES = ['chunked', 'view']
+
+_shared = None
+_sequences = {}
+
+
+def _to_bytes(text):
+    if isinstance(text, bytes):
+        return text
+    return text.encode('ascii')
+
+
+def _to_str(data):
+    if isinstance(data, str):
+        return data
+    return data.decode('ascii')
+
+
+class _SharedBases(object):
+
+    '''the bases of a strand in shared memory, copied out a slice at a time'''
+
+    def __init__(self, raw):
+        self._raw = raw
+
+    def __len__(self):
+        return len(self._raw)
+
+    def __getitem__(self, index):
+        return _to_str(self._raw[index])
+
+
+def _init_worker(shared):
+    global _shared
+    _shared = shared
+    _sequences.clear()
+
+
+def _get_sequence(genome, is_sense, engine):
+    '''this worker's Sequence for a strand:  over the shared memory itself
+    for _SLICING_ENGINES, otherwise over a copy read out of it once'''
+    copy = engine not in _SLICING_ENGINES
+    key = (genome, is_sense, copy)
+    if key not in _sequences:
+        raw = _shared[genome][0 if is_sense else 1]
+        bases = _to_str(raw.raw) if copy else _SharedBases(raw)
+        _sequences[key] = model.Sequence(bases, is_sense)
+    return _sequences[key]
+
+
+def _scan(task):
+    genome, is_sense, frame, engine, all_orfs = task
+    return _get_sequence(genome, is_sense, engine).get_frame_orf_ends(frame, engine, all_orfs)
+
+
+def _get_tasks(count, engine, all_orfs):
+    '''in the same order as a serial scan:  genome, then strand, then alignment'''
+    return [(genome, is_sense, frame, engine, all_orfs)
+            for genome in range(count)
+            for is_sense in [True, False]
+            for frame in range(3)]
+
+
+def _scan_strands(seqs, all_orfs, engine, processes):
+    '''[(Sequence, Sequence)] -> [([(Int, Int, Int)], [(Int, Int, Int)])]'''
+    shared = [tuple(multiprocessing.RawArray('c', _to_bytes(s.get_bases())) for s in pair) for pair in seqs]
+
+    tasks = _get_tasks(len(seqs), engine, all_orfs)
+    pool = multiprocessing.Pool(processes, _init_worker, (shared,))
+    try:
+        results = pool.map(_scan, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    found = [([], []) for _ in seqs]
+    for ((genome, is_sense, frame, _, _), ends) in zip(tasks, results):
+        found[genome][0 if is_sense else 1].extend((frame, bstart, bstop) for (bstart, bstop) in ends)
+    return found
+
+
+def _strands(genomes):
+    seqs = []
+    for bases in genomes:
+        forward = model.Sequence(bases, True)
+        seqs.append((forward, forward.get_reverse_complement()))
+    return seqs
+
+
+def scan_genome_ends(genomes, all_orfs=False, engine='chunked', processes=None):
+    '''[[Base]] -> [([(Int, Int, Int)], [(Int, Int, Int)])]
+
+    For each genome, the (alignment, start index, stop index) of the Orfs
+    of its forward and reverse strands -- the same as Sequence.get_orf_ends
+    on each strand -- without building any Orfs.
+    '''
+    return _scan_strands(_strands(genomes), all_orfs, engine, processes)
+
+
+def scan_genomes(genomes, n, all_orfs=False, engine='chunked', processes=None, lazy=False):
+    '''[[Base]] -> Int -> [([Orf], [Orf])]
+
+    For each genome, (forward Orfs, reverse Orfs) -- the same as
+    get_orfs (or get_all_orfs) on each strand -- scanning the 6
+    alignments of every genome in a pool of `processes` workers
+    (default:  one per CPU).  Only the ends are found in the workers;
+    the Orfs are built here (use `lazy` to only build LazyOrfs, or
+    scan_genome_ends to build none).
+    '''
+    seqs = _strands(genomes)
+    found = []
+    for (pair, strands) in zip(seqs, _scan_strands(seqs, all_orfs, engine, processes)):
+        orfs = []
+        for (seq, ends) in zip(pair, strands):
+            build = seq.build_lazy_orf if lazy else seq.build_orf
+            orfs.append([build(bstart, bstop, n) for (_, bstart, bstop) in ends])
+        found.append(tuple(orfs))
+    return found
+
+
+def scan_directory(directory, n, all_orfs=False, engine='chunked', processes=None):
+    '''Path -> Int -> [(Path, String, [Orf])]
+
+    (file, record name, forward + reverse Orfs) for every record of every
+    FASTA or GenBank file in `directory`, in file name order.
+    '''
+    names, genomes = [], []
+    for filename in sorted(os.listdir(directory)):
+        path = os.path.join(directory, filename)
+        if not os.path.isfile(path):
+            continue
+        for (name, bases) in loader.read_records(path):
+            names.append((path, name))
+            genomes.append(bases)
+    found = scan_genomes(genomes, n, all_orfs, engine, processes)
+    return [(path, name, forward + reverse) for ((path, name), (forward, reverse)) in zip(names, found)]
+
+
+
+########################################################
+# unit tests
+########################################################
+
+class ParallelTest(unittest.TestCase):
+
+    def setUp(self):
+        import random
+        rand = random.Random(5)
+        self.genomes = [''.join(rand.choice('ACGT') for _ in range(length)) for length in [300, 210, 330]]
+
+    def _serial(self, bases, all_orfs):
+        fwd = model.Sequence(bases, True)
+        return [s.get_all_orfs(5) if all_orfs else s.get_orfs(5) for s in [fwd, fwd.get_reverse_complement()]]
+
+    def _ends(self, orfs):
+        return [o.to_JSON_object() for o in orfs]
+
+    def test_same_as_serial(self):
+        for all_orfs in [False, True]:
+            found = scan_genomes(self.genomes, 5, all_orfs, processes=2)
+            self.assertEqual(len(self.genomes), len(found))
+            for (bases, strands) in zip(self.genomes, found):
+                expected = self._serial(bases, all_orfs)
+                self.assertEqual([self._ends(o) for o in expected], [self._ends(o) for o in strands])
+
+    def test_engines(self):
+        expected = [self._ends(o) for o in self._serial(self.genomes[1], True)]
+        for engine in ['python', 'view']:
+            (forward, reverse), = scan_genomes(self.genomes[1:2], 5, True, engine, processes=2)
+            self.assertEqual(expected, [self._ends(forward), self._ends(reverse)])
+
+    def test_scan_genome_ends(self):
+        found = scan_genome_ends(self.genomes, all_orfs=True, processes=2)
+        for (bases, (forward, reverse)) in zip(self.genomes, found):
+            seq = model.Sequence(bases, True)
+            self.assertEqual(seq.get_orf_ends(all_orfs=True), forward)
+            self.assertEqual(seq.get_reverse_complement().get_orf_ends(all_orfs=True), reverse)
+
+    def test_workers_share_the_bases(self):
+        shared = [tuple(multiprocessing.RawArray('c', _to_bytes(b)) for b in [self.genomes[0], 'ACGT'])]
+        _init_worker(shared)
+        try:
+            self.assertTrue(isinstance(_get_sequence(0, True, 'chunked')._bases, _SharedBases))
+            self.assertEqual(self.genomes[0][3:9], _get_sequence(0, True, 'view')._bases[3:9])
+            self.assertEqual(self.genomes[0], _get_sequence(0, True, 'python')._bases)
+        finally:
+            _init_worker(None)
+
+    def test_lazy(self):
+        (forward, reverse), = scan_genomes(self.genomes[:1], 5, True, processes=2, lazy=True)
+        self.assertTrue(all(isinstance(o, model.LazyOrf) for o in forward + reverse))
+        self.assertEqual(self._ends(self._serial(self.genomes[0], True)[1]), self._ends(reverse))
+
+    def test_scan_directory(self):
+        import shutil
+        import tempfile
+        directory = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(directory, 'b.fasta'), 'w') as outfile:
+                outfile.write('>two\n%s\n>three\n%s\n' % (self.genomes[1], self.genomes[2]))
+            with open(os.path.join(directory, 'a.fasta'), 'w') as outfile:
+                outfile.write('>one\n%s\n' % self.genomes[0])
+            found = scan_directory(directory, 5, all_orfs=True, processes=2)
+            self.assertEqual(['one', 'two', 'three'], [name for (_, name, _) in found])
+            for (bases, (_, _, orfs)) in zip(self.genomes, found):
+                self.assertEqual(self._ends(sum(self._serial(bases, True), [])), self._ends(orfs))
+        finally:
+            shutil.rmtree(directory)
+
+
+
+testClasses = [ParallelTest]
@@ -1,10 +1,84 @@
+import collections
 import unittest
 
 
 
 
+_NAN = float('nan')
+
+
+def _windowMaxima(data, start, stop, radius):
+    '''maxima of the windows data[i - radius : i + radius + 1], for each 
+    i in [start + radius, stop - radius), using a monotonic deque:  O(n)
+
+    The maximum of a window holding a NaN is NaN, so that (as in
+    directFind1DPeaks) nothing within `radius` of a NaN is a peak.'''
+    width = 2 * radius + 1
+    maxima, window = [], collections.deque()   # indices of decreasing values
+    lastNan = start - width
+    j = start
+    while j < stop:
+        value = data[j]
+        if value != value:
+            lastNan = j
+        else:
+            while window and data[window[-1]] <= value:
+                window.pop()
+            window.append(j)
+        if window and window[0] <= j - width:
+            window.popleft()
+        if j >= start + width - 1:
+            maxima.append(_NAN if lastNan > j - width else data[window[0]])
+        j += 1
+    return maxima
+
+
+def _findPeaks(data, start, stop, radius):
+    maxima = _windowMaxima(data, start, stop, radius)
+    peaks = []
+    i = radius
+    while i < len(maxima) + radius:
+        pt = data[start + i]
+        if pt >= maxima[i - radius]:
+            peaks.append({'index': i, 'height': pt})
+            i += radius     # same skip-ahead as directFind1DPeaks
+        i += 1
+    return peaks
+
+
 def find1DPeaks(data, radius):
-    '''[Float] -> Int -> [Peak]'''
+    '''[Float] -> Int -> [Peak]
+    
+    A point is a peak if nothing within `radius` of it is higher.
+    Runs in O(n), off of sliding-window maxima.
+    '''
+    return _findPeaks(data, 0, len(data), radius)
+
+
+def find1DPeaksBatch(data, offsets, radius):
+    '''[Float] -> [Int] -> Int -> [[Peak]]
+    
+    find1DPeaks for many profiles stored back to back in `data`;
+    profile k is data[offsets[k]:offsets[k + 1]].  Peak indices are
+    relative to the start of each profile.
+    '''
+    return [_findPeaks(data, offsets[k], offsets[k + 1], radius) for k in range(len(offsets) - 1)]
+
+
+def raggedArray(profiles):
+    '''[[Float]] -> ([Float], [Int]):  data and offsets for find1DPeaksBatch'''
+    data, offsets = [], [0]
+    for profile in profiles:
+        data.extend(profile)
+        offsets.append(len(data))
+    return data, offsets
+
+
+def directFind1DPeaks(data, radius):
+    '''[Float] -> Int -> [Peak]
+    
+    Checks every point's neighbors:  O(n * radius).
+    '''
     peaks = []
     i = radius
     while i < len(data) - radius:
@@ -27,6 +101,39 @@ class PeaksTest(unittest.TestCase):
 
     def testNoPeaks(self):
         self.assertEqual(0, len(find1DPeaks(range(20), 5)))
+
+    def testPeaks(self):
+        data = [0, 1, 3, 1, 0, 2, 2, 2, 0, 5, 0]
+        self.assertEqual([2, 5, 7, 9], [p['index'] for p in find1DPeaks(data, 1)])
+        self.assertEqual([3, 2, 2, 5], [p['height'] for p in find1DPeaks(data, 1)])
+
+    def testSameAsDirect(self):
+        import random
+        rand = random.Random(11)
+        for _ in range(100):
+            data = [rand.choice([rand.uniform(-3, 3), rand.randint(-2, 2)]) for _ in range(rand.randint(0, 80))]
+            for radius in [0, 1, 2, 3, 9]:
+                self.assertEqual(directFind1DPeaks(data, radius), find1DPeaks(data, radius))
+        # NaN (unknown residues) in the profile
+        nan = float('nan')
+        for _ in range(200):
+            data = [rand.choice([rand.uniform(-3, 3), rand.randint(-2, 2), nan]) for _ in range(rand.randint(0, 80))]
+            for radius in [0, 1, 2, 3, 9]:
+                self.assertEqual(directFind1DPeaks(data, radius), find1DPeaks(data, radius))
+
+    def testNans(self):
+        nan = float('nan')
+        self.assertEqual([], find1DPeaks([0, 1, nan], 1))
+        self.assertEqual([], find1DPeaks([0, nan, 0], 1))
+        self.assertEqual([3], [p['index'] for p in find1DPeaks([nan, 0, 0, 2, 0], 1)])
+        data, offsets = raggedArray([[0, 1, nan], [nan, 0, 0, 2, 0]])
+        self.assertEqual([[], [{'index': 3, 'height': 2}]], find1DPeaksBatch(data, offsets, 1))
+
+    def testBatch(self):
+        profiles = [[0, 1, 3, 1, 0, 2, 2, 2, 0, 5, 0], [], [1], range(20), [2, 2, 2, 2, 2]]
+        data, offsets = raggedArray(profiles)
+        self.assertEqual([0, 11, 11, 12, 32, 37], offsets)
+        self.assertEqual([find1DPeaks(p, 1) for p in profiles], find1DPeaksBatch(data, offsets, 1))
     
 
 
@@ -1,15 +1,21 @@
-import bacillussubtilis168 as bs
+import fmindex
+import loader
 import sequence
 import unittest
 
 
 
-forward = bs.bases
+forward = loader.get_genome()
 reverse = sequence.reverseComplement(forward)
 
 
 
-def find_once(sear, seq):
+def find_once(sear, seq, index=None):
+    '''`index`, if given, is an fmindex.FMIndex built over `seq`:
+    then the lookup doesn't scan `seq` at all'''
+    if index is not None:
+        f = index.find_once(sear)
+        return 'No!' if f is None else f
     f, r = seq.find(sear), seq.rfind(sear)
     if f == r:
         return f
@@ -28,6 +34,12 @@ class PetersTest(unittest.TestCase):
         
     def test_find_once(self):
         self.assertEqual('No!', find_once('A', forward))
+
+    def test_find_once_indexed(self):
+        bases = 'GATTACATTGCAGGG'
+        index = fmindex.FMIndex(bases)
+        for sear in ['A', 'TTAC', 'GGG', 'CCC', 'TTGCA']:
+            self.assertEqual(find_once(sear, bases), find_once(sear, bases, index))
     
     
         
@@ -0,0 +1,269 @@
+import filterer
+import model
+import inspect
+import timeit
+import unittest
+
+
+
+class _Scratch(object):
+
+    '''what the stages of a pipeline derive from one Orf, each computed
+    at most once while that Orf goes through the pipeline
+
+    phobicity and peaks come from the Orf's own methods, so they go through
+    model.derived (and, for LazyOrfs, their Sequence's FrameProfiles)'''
+
+    __slots__ = ('orf', '_phobicity', '_peaks')
+
+    def __init__(self, orf):
+        self.orf = orf
+        self._phobicity = {}
+        self._peaks = {}
+
+    def phobicity(self, algorithm, windowRadius):
+        key = (algorithm, windowRadius)
+        if key not in self._phobicity:
+            self._phobicity[key] = self.orf.get_phobicity(algorithm, windowRadius)
+        return self._phobicity[key]
+
+    def peaks(self, algorithm, windowRadius, peakRadius):
+        key = (algorithm, windowRadius, peakRadius)
+        if key not in self._peaks:
+            self._peaks[key] = self.orf.get_phobicity_peaks(algorithm, windowRadius, peakRadius)
+        return self._peaks[key]
+
+
+
+def _arguments(predicate, args, kwargs):
+    '''{name: value} for all of predicate's parameters after the Orf,
+    filling in its defaults'''
+    spec = getattr(inspect, 'getfullargspec', None) or inspect.getargspec
+    spec = spec(predicate)
+    names, defaults = spec.args[1:], spec.defaults or ()
+    values = dict(zip(names[len(names) - len(defaults):], defaults))
+    values.update(zip(names, args))
+    values.update(kwargs)
+    return values
+
+
+def _upstream(args):
+    upstreamSequence = args['upstreamSequence']
+    return 1, lambda scratch: filterer.hasUpstreamSequence(scratch.orf, upstreamSequence)
+
+
+def _highPeak(args):
+    algorithm, windowRadius, minHeight = args['algorithm'], args['windowRadius'], args['minHeight']
+    def test(scratch):
+        return any(x > minHeight for x in scratch.phobicity(algorithm, windowRadius))
+    return 10, test
+
+
+def _nPeaks(args):
+    algorithm, kdRadius, peakRadius = args['algorithm'], args['kdRadius'], args['peakRadius']
+    numPeaks, minHeight = args['numPeaks'], args['minHeight']
+    def test(scratch):
+        pks = scratch.peaks(algorithm, kdRadius, peakRadius)
+        return len([p for p in pks if p['height'] >= minHeight]) == numPeaks
+    return 20, test
+
+
+# filterer predicates the pipeline knows how to fuse:  each is compiled into
+# (relative cost, test on a _Scratch), so that intermediates get shared
+_COMPILERS = {
+    filterer.hasUpstreamSequence: _upstream,
+    filterer.hasHighPhobicPeak: _highPeak,
+    filterer.hasNPhobicPeaks: _nPeaks
+}
+
+# cost of any other predicate, which is just called on the Orf
+UNKNOWN_COST = 5
+
+
+class Stage(object):
+
+    '''One predicate of a FilterPipeline, with its counters.
+
+       public (read-only) properties:
+        - name
+        - cost (relative;  stages are run cheapest first)
+        - seen, passed (Orfs tested by / accepted by this stage)
+        - seconds (time spent in this stage)
+    '''
+
+    def __init__(self, name, cost, test):
+        self.name = name
+        self.cost = cost
+        self._test = test
+        self.seen = 0
+        self.passed = 0
+        self.seconds = 0.0
+
+    def get_selectivity(self):
+        '''Float:  fraction of the Orfs it saw that passed (None if it saw none)'''
+        return float(self.passed) / self.seen if self.seen else None
+
+
+def stage(predicate, *args, **kwargs):
+    '''a Stage testing `predicate(orf, *args, **kwargs)`
+
+    filterer.matchBases is given its (seq, up, down) here, instead of being
+    called first:  stage(filterer.matchBases, 'ATG', '', '')
+    '''
+    name = getattr(predicate, '__name__', repr(predicate))
+    if predicate is filterer.matchBases:
+        isMatch = filterer.matchBases(*args, **kwargs)
+        return Stage(name, 1, lambda scratch: isMatch(scratch.orf))
+    if predicate in _COMPILERS:
+        cost, test = _COMPILERS[predicate](_arguments(predicate, args, kwargs))
+        return Stage(name, cost, test)
+    return Stage(name, getattr(predicate, 'cost', UNKNOWN_COST), lambda scratch: predicate(scratch.orf, *args, **kwargs))
+
+
+
+class FilterPipeline(object):
+
+    '''All of a list of filters, run in a single pass:  each Orf goes
+       through the stages cheapest first, stopping at the first one it
+       fails, and what the stages derive from it (phobicity profiles,
+       peaks) is computed once and shared between them.
+
+       Accepts the same Orfs as applying each filter in turn.
+
+       public methods:
+        - accepts(orf)
+        - filter(orfs)  (generator)
+        - run(orfs) / run_collection(collection)
+        - get_stages / report
+    '''
+
+    def __init__(self, filters):
+        stages = [f if isinstance(f, Stage) else stage(f) for f in filters]
+        # stable:  stages of equal cost keep the order they were given in
+        self._stages = sorted(stages, key=lambda s: s.cost)
+        self._timer = timeit.default_timer
+
+    def get_stages(self):
+        '''[Stage], in the order they're run'''
+        return list(self._stages)
+
+    def accepts(self, orf):
+        scratch, timer = _Scratch(orf), self._timer
+        for s in self._stages:
+            s.seen += 1
+            began = timer()
+            ok = s._test(scratch)
+            s.seconds += timer() - began
+            if not ok:
+                return False
+            s.passed += 1
+        return True
+
+    def filter(self, orfs):
+        for orf in orfs:
+            if self.accepts(orf):
+                yield orf
+
+    def run(self, orfs):
+        return list(self.filter(orfs))
+
+    def run_collection(self, collection):
+        '''model.OrfCollection -> model.OrfCollection'''
+        return model.OrfCollection(self.run(collection.get_orfs()))
+
+    def report(self):
+        '''String:  one line per stage -- Orfs seen and passed, selectivity, time'''
+        lines = ['%-24s %10s %10s %12s %10s' % ('stage', 'seen', 'passed', 'selectivity', 'seconds')]
+        for s in self._stages:
+            selectivity = s.get_selectivity()
+            lines.append('%-24s %10d %10d %12s %10.4f' % (
+                s.name, s.seen, s.passed, '-' if selectivity is None else '%.4f' % selectivity, s.seconds))
+        return '\n'.join(lines)
+
+
+
+########################################################
+# unit tests
+########################################################
+
+class FilterPipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        import random
+        import translate
+        rand = random.Random(4)
+        residues = 'ACDEFGHIKLMNPQRSTVWY'
+        codons = dict((r, c) for (c, r) in translate.codonToResidue.items())
+        self.orfs = []
+        for i in range(60):
+            bases = 'ATG' + ''.join(codons[rand.choice(residues)] for _ in range(rand.randint(5, 40)))
+            upstream = ''.join(rand.choice('ACGT') for _ in range(20))
+            self.orfs.append(model.Orf(i, i + len(bases), bases, upstream, 'TAA', True))
+
+    def _filters(self):
+        return [
+            (filterer.hasNPhobicPeaks, (), {'numPeaks': 1, 'minHeight': 1.0, 'peakRadius': 3, 'kdRadius': 2}),
+            (filterer.hasHighPhobicPeak, (), {'windowRadius': 2, 'minHeight': 1.0}),
+            (filterer.hasUpstreamSequence, ('GG',), {})
+        ]
+
+    def test_same_as_separate_filters(self):
+        expected = self.orfs
+        for (f, args, kwargs) in self._filters():
+            expected = [o for o in expected if f(o, *args, **kwargs)]
+        pipeline = FilterPipeline([stage(f, *args, **kwargs) for (f, args, kwargs) in self._filters()])
+        self.assertEqual(expected, pipeline.run(self.orfs))
+        self.assertTrue(0 < len(expected) < len(self.orfs))
+
+    def test_cheapest_first(self):
+        pipeline = FilterPipeline([stage(f, *args, **kwargs) for (f, args, kwargs) in self._filters()] +
+                                  [lambda orf: orf.start % 2 == 0])
+        names = [s.name for s in pipeline.get_stages()]
+        self.assertEqual(['hasUpstreamSequence', '<lambda>', 'hasHighPhobicPeak', 'hasNPhobicPeaks'], names)
+
+    def test_short_circuit_and_counts(self):
+        pipeline = FilterPipeline([stage(filterer.hasHighPhobicPeak, windowRadius=2),
+                                   stage(filterer.matchBases, 'ATGG', '', '')])
+        accepted = pipeline.run(self.orfs)
+        first, second = pipeline.get_stages()
+        self.assertEqual('matchBases', first.name)
+        self.assertEqual(len(self.orfs), first.seen)
+        self.assertEqual(first.passed, second.seen)
+        self.assertEqual(len(accepted), second.passed)
+        self.assertEqual(3, len(pipeline.report().splitlines()))
+
+    def test_shared_intermediates(self):
+        import kd
+        calls = []
+        def counting(residues, radius):
+            calls.append(radius)
+            return kd.kyteDoolittle(residues, radius)
+        pipeline = FilterPipeline([stage(filterer.hasHighPhobicPeak, windowRadius=2, minHeight=-10, algorithm=counting),
+                                   stage(filterer.hasNPhobicPeaks, numPeaks=0, minHeight=100, kdRadius=2, algorithm=counting)])
+        self.assertTrue(pipeline.accepts(self.orfs[0]))
+        self.assertEqual([2], calls)
+
+    def test_lazy_orfs_use_frame_profiles(self):
+        seq = model.Sequence('CCC' + 'ATGGCTATTCTGTGGATCGCAGTG' + 'TAACCC', True)
+        lazy = model.LazyOrf(seq, 0, 3, 27, 3)
+        import kd
+        lengths = []
+        def counting(residues, radius):
+            lengths.append(len(residues))
+            return kd.kyteDoolittle(residues, radius)
+        pipeline = FilterPipeline([stage(filterer.hasHighPhobicPeak, windowRadius=2, minHeight=-10, algorithm=counting)])
+        self.assertTrue(pipeline.accepts(lazy))
+        # the frame's runs of scorable residues ('PMAILWIAV*P'), not the Orf's own 'MAILWIAV'
+        self.assertEqual([9, 1], lengths)
+        pipeline.accepts(model.LazyOrf(seq, 0, 3, 27, 3))
+        self.assertEqual([9, 1], lengths)
+
+    def test_collection(self):
+        coll = model.OrfCollection(self.orfs)
+        pipeline = FilterPipeline([stage(filterer.hasUpstreamSequence, 'A')])
+        expected = [o for o in self.orfs if filterer.hasUpstreamSequence(o, 'A')]
+        self.assertEqual(expected, pipeline.run_collection(coll).get_orfs())
+
+
+
+testClasses = [FilterPipelineTest]
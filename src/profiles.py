@@ -0,0 +1,173 @@
+import kd
+import sequence
+import translate
+import array
+import re
+import unittest
+
+
+
+STOP_RESIDUE = '*'
+UNKNOWN_RESIDUE = 'X'
+
+NAN = float('nan')
+
+_codonToResidue = dict(translate.codonToResidue)
+_codonToResidue.update([(c, STOP_RESIDUE) for c in sequence.STOPS])
+
+# runs of residues that Kyte-Doolittle can score, and anything else
+_SCORABLE = re.compile('[%s]+' % ''.join(sorted(kd.kdIndex)))
+_UNSCORABLE = re.compile('[^%s]' % ''.join(sorted(kd.kdIndex)))
+
+
+def translate(codons):
+    '''[Codon] -> String:  one residue per codon, '*' for stops and 'X' for unknown'''
+    return ''.join([_codonToResidue.get(c, UNKNOWN_RESIDUE) for c in codons])
+
+
+def get_phobicity(residues, algorithm, windowRadius):
+    '''[Float]:  algorithm(residues, windowRadius), except that windows over
+    residues it can't score (stops, unknown) are NaN -- as in FrameProfiles'''
+    if _UNSCORABLE.search(residues) is None:
+        return algorithm(residues, windowRadius)
+    values = [NAN] * max(0, len(residues) - 2 * windowRadius)
+    for match in _SCORABLE.finditer(residues):
+        smoothed = algorithm(match.group(), windowRadius)
+        values[match.start():match.start() + len(smoothed)] = smoothed
+    return values
+
+
+class FrameProfiles(object):
+
+    '''Translations and hydrophobicity profiles of the 3 codon alignments
+       of a circular sequence, computed once per alignment and kept.
+
+       Every Orf in an alignment is a slice of that alignment's
+       translation, so its residues and phobicity are slice lookups.
+
+       Profiles are indexed by the *center* residue of each window, and are
+       NaN where the window doesn't fit between two stops (or unknown residues).
+
+       public methods:
+        - get_residues(n)
+        - get_scores(n)
+        - get_profile(n, algorithm, windowRadius)
+        - get_orf_residues(n, cstart, cstop)
+        - get_orf_phobicity(n, cstart, cstop, algorithm, windowRadius)
+    '''
+
+    def __init__(self, bases):
+        self._bases = bases
+        self._residues = [None, None, None]
+        self._scores = [None, None, None]
+        self._profiles = {}
+
+    ########################
+
+    def _slice(self, values, cstart, cstop):
+        '''codon indices [cstart, cstop), wrapping around if cstop < cstart'''
+        if cstop >= cstart:
+            return values[cstart:cstop]
+        return values[cstart:] + values[:cstop]
+
+    ##############################
+
+    def get_residues(self, n):
+        '''String:  one residue per codon, '*' for stops and 'X' for unknown'''
+        assert n in [0, 1, 2], "codon alignment must be 0, 1, or 2"
+        if self._residues[n] is None:
+            self._residues[n] = translate(sequence.CodonView(self._bases, n))
+        return self._residues[n]
+
+
+    def get_scores(self, n):
+        '''array of raw Kyte-Doolittle scores, NaN for stops and unknown residues'''
+        if self._scores[n] is None:
+            index = kd.kdIndex
+            self._scores[n] = array.array('d', [index.get(r, NAN) for r in self.get_residues(n)])
+        return self._scores[n]
+
+
+    def get_profile(self, n, algorithm, windowRadius):
+        '''array of `algorithm` (e.g. kd.kyteDoolittle) values, by center residue'''
+        key = (n, algorithm, windowRadius)
+        if key not in self._profiles:
+            residues = self.get_residues(n)
+            profile = array.array('d', [NAN]) * len(residues)
+            for match in _SCORABLE.finditer(residues):
+                smoothed = algorithm(match.group(), windowRadius)
+                center = match.start() + windowRadius
+                profile[center:center + len(smoothed)] = array.array('d', smoothed)
+            self._profiles[key] = profile
+        return self._profiles[key]
+
+
+    def get_orf_residues(self, n, cstart, cstop):
+        '''residues of the Orf from codon `cstart` up to (not including) `cstop`'''
+        return self._slice(self.get_residues(n), cstart, cstop)
+
+
+    def get_orf_phobicity(self, n, cstart, cstop, algorithm, windowRadius):
+        '''[Float]:  same as algorithm(orf residues, windowRadius)'''
+        if cstop < cstart:
+            # boundary condition:  Orf wraps around, so its windows aren't in the profile
+            return get_phobicity(self.get_orf_residues(n, cstart, cstop), algorithm, windowRadius)
+        profile = self.get_profile(n, algorithm, windowRadius)
+        return profile[cstart + windowRadius: max(cstart + windowRadius, cstop - windowRadius)].tolist()
+
+
+
+########################################################
+# unit tests
+########################################################
+
+class FrameProfilesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bases = 'ATGGCTATTCTGTGGTAA' + 'CCC' + 'ATGCTTGTTTTTATCGCACTGGGGTGA' + 'ACG'
+        self.profiles = FrameProfiles(self.bases)
+
+    def test_get_residues(self):
+        self.assertEqual('MAILW*PMLVFIALG*', self.profiles.get_residues(0)[:16])
+        self.assertEqual(len(self.bases) // 3, len(self.profiles.get_residues(1)))
+
+    def test_unknown_residues(self):
+        self.assertEqual('MX*', FrameProfiles('ATGANCTAG').get_residues(0))
+
+    def test_get_scores(self):
+        scores = self.profiles.get_scores(0)
+        self.assertEqual((1.9, 1.8), (scores[0], scores[1]))
+        self.assertTrue(scores[5] != scores[5])
+
+    def test_orf_phobicity(self):
+        residues = self.profiles.get_residues(0)
+        for algorithm in [kd.kyteDoolittle, kd.triangleKyteDoolittle]:
+            for radius in [0, 1, 2, 4]:
+                for (cstart, cstop) in [(0, 5), (7, 15), (8, 15), (1, 3)]:
+                    expected = algorithm(residues[cstart:cstop], radius)
+                    calced = self.profiles.get_orf_phobicity(0, cstart, cstop, algorithm, radius)
+                    self.assertEqual(len(expected), len(calced))
+                    for (e, c) in zip(expected, calced):
+                        self.assertAlmostEqual(e, c)
+
+    def test_orf_phobicity_wraps(self):
+        residues = self.profiles.get_residues(0)
+        expected = kd.kyteDoolittle(residues[16:] + residues[:5], 1)
+        self.assertEqual(expected, self.profiles.get_orf_phobicity(0, 16, 5, kd.kyteDoolittle, 1))
+
+    def test_get_phobicity(self):
+        self.assertEqual(kd.kyteDoolittle('MAILW', 1), get_phobicity('MAILW', kd.kyteDoolittle, 1))
+        phobicity = get_phobicity('MAXILWV', kd.kyteDoolittle, 1)
+        self.assertEqual(5, len(phobicity))
+        self.assertTrue(all(p != p for p in phobicity[:3]))
+        self.assertEqual(kd.kyteDoolittle('ILWV', 1), phobicity[3:])
+        self.assertEqual([], get_phobicity('MX', kd.kyteDoolittle, 1))
+
+    def test_profile_is_cached(self):
+        p = self.profiles
+        self.assertTrue(p.get_profile(0, kd.kyteDoolittle, 2) is p.get_profile(0, kd.kyteDoolittle, 2))
+        self.assertFalse(p.get_profile(0, kd.kyteDoolittle, 2) is p.get_profile(0, kd.kyteDoolittle, 3))
+
+
+
+testClasses = [FrameProfilesTest]
@@ -0,0 +1,386 @@
+import chunked
+import model
+import parallel
+import sequence
+import vectorized
+import array
+import hashlib
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+
+
+
+# the modules whose code decides which Orfs are found
+SCANNER_MODULES = [sequence, model, vectorized, chunked, parallel]
+
+
+def _source_path(module):
+    path = module.__file__
+    if path.endswith('.pyc') or path.endswith('.pyo'):
+        path = path[:-1]
+    return path
+
+
+def scanner_version(modules=SCANNER_MODULES):
+    '''String:  digest of the scanner modules' source, so that any change
+    to them gives cache entries a new version'''
+    digest = hashlib.sha1()
+    for module in modules:
+        with open(_source_path(module), 'rb') as infile:
+            digest.update(infile.read())
+    return digest.hexdigest()[:12]
+
+
+# entries written by any other version are never read, and are deleted
+SCANNER_VERSION = scanner_version()
+
+# where finder's cache lives by default, relative to src/
+CACHE_DIRECTORY = '../.orfcache'
+
+_SUFFIX = '.orfs'
+
+# entry file layout (little-endian):
+#   _MAGIC
+#   _HEADER:  SHA-1 of the genome (raw), flank width n, number of Orfs
+#   start (int64 x count), stop (int64 x count), is_sense (uint8 x count)
+_MAGIC = b'ORFENDS1'
+_HEADER = struct.Struct('<20sQQ')
+
+
+def _typecode(candidates, itemsize):
+    '''the array typecode with this itemsize ('q' doesn't exist on Python 2)'''
+    for code in candidates:
+        try:
+            if array.array(code).itemsize == itemsize:
+                return code
+        except ValueError:
+            pass
+    raise ValueError("no %d-byte array typecode in %s" % (itemsize, candidates))
+
+_INT64 = _typecode('qli', 8)
+
+
+def _to_bytes(text):
+    if isinstance(text, bytes):
+        return text
+    return text.encode('ascii')
+
+
+def genome_digest(bases):
+    '''[Base] -> String:  SHA-1 of the bases'''
+    return hashlib.sha1(_to_bytes(bases)).hexdigest()
+
+
+def _read_column(infile, typecode, count):
+    column = array.array(typecode)
+    column.fromfile(infile, count)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column
+
+
+def _write_column(outfile, column):
+    if sys.byteorder == 'big':
+        column.byteswap()
+    column.tofile(outfile)
+
+
+
+class CachedOrfs(object):
+
+    '''The Orfs of a cache entry, as columns of coordinates:  each Orf is
+       built (as a model.LazyOrf on `forward` or its reverse complement)
+       when it's asked for, so a hit doesn't build hundreds of thousands
+       of objects up front.
+
+       public methods:
+        - len / iteration / indexing (a slice gives a list)
+        - + (gives a list)
+    '''
+
+    def __init__(self, forward, n, starts, stops, senses):
+        self._forward = forward
+        self._n = n
+        self._starts = starts
+        self._stops = stops
+        self._senses = senses
+
+    def __len__(self):
+        return len(self._starts)
+
+    def _build(self, start, stop, is_sense):
+        if is_sense:
+            return model.LazyOrf(self._forward, start % 3, start, stop, self._n)
+        # antisense starts are normalized:  the frame comes from the strand's own index
+        last = self._forward.get_length() - 1
+        return model.LazyOrf(self._forward.get_reverse_complement(), (last - start) % 3, start, stop, self._n)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("Orf index out of range")
+        return self._build(self._starts[i], self._stops[i], self._senses[i])
+
+    def __iter__(self):
+        for (start, stop, is_sense) in zip(self._starts, self._stops, self._senses):
+            yield self._build(start, stop, is_sense)
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+
+
+class ResultCache(object):
+
+    '''Content-addressed, on-disk cache of scan results.
+
+       An entry is a list of Orf lists (e.g. forward and reverse Orfs),
+       keyed by the genome's digest, the scan mode and the flank width `n`.
+       Only the Orfs' coordinates are stored, with the genome's digest;  a
+       hit gives a CachedOrfs per list, which builds model.LazyOrfs on the
+       genome that's passed in as they're asked for.
+
+       Entries are evicted least-recently-used first whenever the cache
+       grows past `max_bytes`;  entries of other SCANNER_VERSIONs are
+       deleted when the cache is opened.
+
+       public methods:
+        - key(bases, mode, n)
+        - get(key, bases, parts)
+        - put(key, bases, n, results)
+        - get_or_compute(bases, mode, n, compute, parts)
+        - size / clear
+        - hits, misses (counters)
+    '''
+
+    def __init__(self, directory=CACHE_DIRECTORY, max_bytes=1 << 30):
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._prefix = 'v%s-' % SCANNER_VERSION
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for name in self._entries():
+            if not name.startswith(self._prefix):
+                self._remove(name)
+
+    ##############################
+
+    def _entries(self):
+        return [name for name in os.listdir(self._directory) if name.endswith(_SUFFIX)]
+
+    def _path(self, key, part):
+        return os.path.join(self._directory, '%s%s-%d%s' % (self._prefix, key, part, _SUFFIX))
+
+    def _remove(self, name):
+        try:
+            os.remove(os.path.join(self._directory, name))
+        except OSError:
+            pass
+
+    def _evict(self, keep):
+        '''removes least recently used entries (by mtime) until under max_bytes'''
+        entries = []
+        for name in self._entries():
+            try:
+                stat = os.stat(os.path.join(self._directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name, stat.st_size))
+        entries.sort()
+        total = sum(size for (_, _, size) in entries)
+        for (_, name, size) in entries:
+            if total <= self._max_bytes:
+                break
+            if os.path.join(self._directory, name) not in keep:
+                self._remove(name)
+                total -= size
+
+    ##############################
+
+    def key(self, bases, mode, n):
+        '''String:  identifies a scan of `bases` in `mode` with flank width `n`'''
+        return hashlib.sha1(_to_bytes('%s|%s|%d' % (genome_digest(bases), mode, n))).hexdigest()
+
+    def _read(self, path, digest, forward):
+        '''CachedOrfs of one entry file, or None if it's for another genome'''
+        with open(path, 'rb') as infile:
+            if infile.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError("<%s> is not a cache entry" % path)
+            stored, n, count = _HEADER.unpack(infile.read(_HEADER.size))
+            if stored != digest:
+                return None
+            starts, stops = _read_column(infile, _INT64, count), _read_column(infile, _INT64, count)
+            senses = _read_column(infile, 'B', count)
+        return CachedOrfs(forward, n, starts, stops, senses)
+
+    def get(self, key, bases, parts=1):
+        '''[CachedOrfs] on `bases`, or None if the entry isn't (all) there'''
+        paths = [self._path(key, part) for part in range(parts)]
+        digest = hashlib.sha1(_to_bytes(bases)).digest()
+        forward = model.Sequence(bases, True)
+        try:
+            results = [self._read(path, digest, forward) for path in paths]
+        except (IOError, OSError, ValueError, EOFError, struct.error):
+            results = None
+        if results is None or None in results:
+            self.misses += 1
+            return None
+        for path in paths:
+            os.utime(path, None)
+        self.hits += 1
+        return results
+
+    def put(self, key, bases, n, results):
+        '''[[Orf]] -> [[Orf]]:  stores the lists' coordinates, and returns them'''
+        results = [list(orfs) for orfs in results]
+        paths = [self._path(key, part) for part in range(len(results))]
+        digest = hashlib.sha1(_to_bytes(bases)).digest()
+        for (path, orfs) in zip(paths, results):
+            with open(path, 'wb') as outfile:
+                outfile.write(_MAGIC)
+                outfile.write(_HEADER.pack(digest, n, len(orfs)))
+                _write_column(outfile, array.array(_INT64, [o.start for o in orfs]))
+                _write_column(outfile, array.array(_INT64, [o.stop for o in orfs]))
+                _write_column(outfile, array.array('B', [1 if o.is_sense else 0 for o in orfs]))
+        self._evict(set(paths))
+        return results
+
+    def get_or_compute(self, bases, mode, n, compute, parts=1):
+        '''the cached entry, or `compute()` (a list of `parts` Orf lists) stored'''
+        key = self.key(bases, mode, n)
+        results = self.get(key, bases, parts)
+        if results is None:
+            results = self.put(key, bases, n, compute())
+        return results
+
+    def size(self):
+        '''Int:  bytes used by entries'''
+        return sum(os.path.getsize(os.path.join(self._directory, name)) for name in self._entries())
+
+    def clear(self):
+        for name in self._entries():
+            self._remove(name)
+
+
+
+########################################################
+# unit tests
+########################################################
+
+class ResultCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = ResultCache(self.directory)
+        import random
+        rand = random.Random(21)
+        self.bases = ''.join(rand.choice('ACGT') for _ in range(300))
+        seq = model.Sequence(self.bases, True)
+        self.results = [seq.get_orfs(3), seq.get_reverse_complement().get_orfs(3)]
+        self.orfs = self.results[0] + self.results[1]
+        self.calls = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _compute(self):
+        self.calls += 1
+        return self.results
+
+    def _json(self, results):
+        return [[o.to_JSON_object() for o in orfs] for orfs in results]
+
+    def test_get_or_compute(self):
+        first = self.cache.get_or_compute(self.bases, 'longest', 3, self._compute, parts=2)
+        second = self.cache.get_or_compute(self.bases, 'longest', 3, self._compute, parts=2)
+        self.assertEqual(1, self.calls)
+        self.assertEqual((1, 1), (self.cache.hits, self.cache.misses))
+        expected = self._json(self.results)
+        self.assertTrue(all(expected))
+        self.assertEqual(expected, self._json(first))
+        self.assertEqual(expected, self._json(second))
+        self.assertTrue(all(isinstance(orfs, list) for orfs in first))
+        self.assertTrue(all(isinstance(orfs, CachedOrfs) for orfs in second))
+
+    def test_hits_are_lazy(self):
+        key = self.cache.key(self.bases, 'longest', 3)
+        self.cache.put(key, self.bases, 3, self.results)
+        forward, reverse = self.cache.get(key, self.bases, parts=2)
+        self.assertEqual(self._json(self.results), self._json([forward[:], reverse[-len(reverse):]]))
+        self.assertEqual(self.orfs[-1].to_JSON_object(), reverse[-1].to_JSON_object())
+        self.assertRaises(IndexError, reverse.__getitem__, len(reverse))
+        self.assertTrue(all(isinstance(o, model.LazyOrf) for o in forward + reverse))
+        self.assertEqual(([True] * len(forward), [False] * len(reverse)),
+                         ([o.is_sense for o in forward], [o.is_sense for o in reverse]))
+        for (orf, lazy) in zip(self.orfs, forward + reverse):
+            self.assertEqual(orf.get_residues(), lazy.get_residues())
+        # only the coordinates are stored
+        self.assertEqual(len(_MAGIC) + _HEADER.size + 17 * len(forward), os.path.getsize(self.cache._path(key, 0)))
+
+    def test_other_genome(self):
+        key = self.cache.key(self.bases, 'longest', 3)
+        self.cache.put(key, self.bases, 3, self.results)
+        self.assertEqual(None, self.cache.get(key, self.bases[1:] + self.bases[0], parts=2))
+        self.assertEqual((0, 1), (self.cache.hits, self.cache.misses))
+
+    def test_keys(self):
+        key = self.cache.key('ACGT', 'longest', 5)
+        self.assertEqual(key, self.cache.key('ACGT', 'longest', 5))
+        self.assertNotEqual(key, self.cache.key('ACGA', 'longest', 5))
+        self.assertNotEqual(key, self.cache.key('ACGT', 'all', 5))
+        self.assertNotEqual(key, self.cache.key('ACGT', 'longest', 6))
+
+    def test_missing_part(self):
+        key = self.cache.key(self.bases, 'longest', 3)
+        self.cache.put(key, self.bases, 3, [self.orfs])
+        self.assertEqual(None, self.cache.get(key, self.bases, parts=2))
+        self.assertEqual(1, len(self.cache.get(key, self.bases)))
+
+    def test_eviction(self):
+        self.cache.put('one', self.bases, 3, [self.orfs])
+        size = self.cache.size()
+        small = ResultCache(self.directory, max_bytes=2 * size)
+        old = os.path.join(self.directory, os.listdir(self.directory)[0])
+        os.utime(old, (1, 1))
+        small.put('two', self.bases, 3, [self.orfs])
+        small.get('two', self.bases)
+        small.put('three', self.bases, 3, [self.orfs])
+        self.assertEqual(None, small.get('one', self.bases))
+        self.assertEqual(1, len(small.get('two', self.bases)))
+        self.assertEqual(2 * size, small.size())
+
+    def test_version(self):
+        global SCANNER_VERSION
+        self.cache.put('one', self.bases, 3, [self.orfs])
+        previous, SCANNER_VERSION = SCANNER_VERSION, scanner_version([sequence])
+        try:
+            newer = ResultCache(self.directory)
+        finally:
+            SCANNER_VERSION = previous
+        self.assertEqual(None, newer.get('one', self.bases))
+        self.assertEqual(0, newer.size())
+
+    def test_scanner_version(self):
+        self.assertEqual(SCANNER_VERSION, scanner_version())
+        self.assertNotEqual(scanner_version([sequence]), scanner_version([sequence, model]))
+
+    def test_clear(self):
+        self.cache.put('one', self.bases, 3, [self.orfs])
+        self.cache.clear()
+        self.assertEqual(0, self.cache.size())
+
+
+
+testClasses = [ResultCacheTest]
@@ -1,3 +1,5 @@
+import re
+import string
 import unittest
 
 
@@ -19,6 +21,46 @@ def makeCodons(bases):
     return codons
 
 
+class CodonView(object):
+    '''Read-only [Codon] view of a circular sequence, in the alignment
+    starting at base `offset`.
+    
+    Codons are sliced out of the original bases on demand, so neither a 
+    rotated copy of the bases nor a list of codons gets built.  Can be 
+    passed to any of the Orf scanners in place of a list of codons.
+    '''
+
+    def __init__(self, bases, offset):
+        if len(bases) % 3 != 0:
+            raise ValueError("number of bases must be divisible by 3")
+        self._bases = bases
+        self._offset = offset % len(bases) if bases else 0
+        self._length = len(bases) // 3
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("codon index out of range")
+        
+        bases, size = self._bases, len(self._bases)
+        b = (self._offset + 3 * index) % size
+        
+        # boundary condition:  circular genome, codon wraps around
+        if b + 3 > size:
+            return bases[b:] + bases[:b + 3 - size]
+        return bases[b:b + 3]
+
+    def __iter__(self):
+        i = 0
+        while i < self._length:
+            yield self[i]
+            i += 1
+
+
 
 STARTS = ["GTG", "ATG", "TTG", "CTG"]
 STOPS = ["TAA", "TAG", "TGA"]
@@ -136,6 +178,146 @@ def getAllOrfEndsCircular(codons):
             orfEnds.append(readToNextStop(codons, i))
         i += 1
     return orfEnds
+
+
+def getNextStops(codons):
+    '''[Codon] -> [Maybe Int]
+
+    For each codon index, the index of the first stop codon at or after
+    it, wrapping around the circular sequence.  Built in one backward pass
+    (twice around the circle, so that the wrap is handled), so it's O(n).
+    All entries are None if there are no stops.
+    
+    '''
+    length = len(codons)
+    nextStops, stop = [None] * length, None
+    i = 2 * length - 1
+    while i >= 0:
+        ix = i % length
+        if codons[ix] in STOPS:
+            stop = ix
+        nextStops[ix] = stop
+        i -= 1
+    return nextStops
+
+
+def getAllOrfEndsCircularTable(codons):
+    '''[Codon] -> [(Int, Int)]
+    
+    Same results as getAllOrfEndsCircular, but each start looks up its
+    stop in a precomputed next-stop table instead of reading forward,
+    so nested starts don't cost quadratic time.
+    
+    '''
+    starts = [i for (i, c) in enumerate(codons) if c in STARTS]
+    if not starts:
+        return []
+    nextStops = getNextStops(codons)
+    if nextStops[0] is None:
+        raise ValueError("no stop codon found")
+    return [(i, nextStops[i]) for i in starts]
+    
+
+
+CHUNK_SIZE = 3 << 16
+
+class ChunkedCodons(object):
+    '''[Codon] stream of a circular sequence, in the alignment starting
+    at base `offset`, read `chunkSize` bases at a time.
+
+    Only one chunk is held at once, so `bases` may be anything that can
+    be sliced into strings without holding them all (a PackedBases, an
+    mmap, a reverse complement view, ...).  Can be iterated many times,
+    but not indexed:  pass it to the streaming scanners below.
+    '''
+
+    def __init__(self, bases, offset, chunkSize=CHUNK_SIZE):
+        if len(bases) % 3 != 0:
+            raise ValueError("number of bases must be divisible by 3")
+        self._bases = bases
+        self._offset = offset % 3
+        self._chunkSize = max(3, chunkSize - chunkSize % 3)
+
+    def __len__(self):
+        return len(self._bases) // 3
+
+    def __iter__(self):
+        bases, length, pos = self._bases, len(self._bases), self._offset
+        while pos < length:
+            stop = min(pos + self._chunkSize, length)
+            chunk = bases[pos:stop]
+            # boundary condition:  circular genome, last codon wraps around
+            if stop == length and self._offset:
+                chunk += bases[:self._offset]
+            for k in range(0, len(chunk), 3):
+                yield chunk[k:k + 3]
+            pos = stop
+
+
+def iterOrfEndsCircularStreaming(codons):
+    '''[Codon] -> Generator (Int, Int)
+
+    Same results as getOrfEndsCircular, reading the codons once, in order,
+    without indexing, and yielding each Orf as soon as its stop is read:
+    the codons before the first stop are only needed for their first start,
+    which is kept until the end, where the Orf wrapping around the sequence
+    (if any) is closed by the first stop.
+    '''
+    firstStop, wrapStart, start = None, None, None
+    for (i, codon) in enumerate(codons):
+        if firstStop is None:
+            if codon in STOPS:
+                firstStop = i
+            elif codon in STARTS and wrapStart is None:
+                wrapStart = i
+        elif start is None:
+            if codon in STARTS:
+                start = i
+        elif codon in STOPS:
+            yield (start, i)
+            start = None
+
+    if firstStop is None:
+        return
+    if start is None:
+        start = wrapStart
+    if start is not None:
+        yield (start, firstStop)
+
+
+def getOrfEndsCircularStreaming(codons):
+    '''[Codon] -> [(Int, Int)]'''
+    return list(iterOrfEndsCircularStreaming(codons))
+
+
+def iterAllOrfEndsCircularStreaming(codons):
+    '''[Codon] -> Generator (Int, Int)
+
+    Same results as getAllOrfEndsCircular, reading the codons once, in order:
+    starts wait for the next stop, and are yielded when it's read;  those
+    after the last stop wrap around to the first one.
+    '''
+    firstStop, waiting = None, []
+    for (i, codon) in enumerate(codons):
+        if codon in STARTS:
+            waiting.append(i)
+        elif codon in STOPS:
+            if firstStop is None:
+                firstStop = i
+            for s in waiting:
+                yield (s, i)
+            waiting = []
+
+    if waiting:
+        if firstStop is None:
+            raise ValueError("no stop codon found")
+        for s in waiting:
+            yield (s, firstStop)
+
+
+def getAllOrfEndsCircularStreaming(codons):
+    '''[Codon] -> [(Int, Int)]'''
+    return list(iterAllOrfEndsCircularStreaming(codons))
     
 
 
@@ -144,16 +326,36 @@ COMPLEMENTS = {
     'A': 'T',
     'T': 'A',
     'C': 'G',
-    'G': 'C'
+    'G': 'C',
+    # IUPAC ambiguity codes
+    'N': 'N',
+    'R': 'Y',
+    'Y': 'R',
+    'S': 'S',
+    'W': 'W',
+    'K': 'M',
+    'M': 'K',
+    'B': 'V',
+    'V': 'B',
+    'D': 'H',
+    'H': 'D'
 }
+# soft-masked (lowercase) bases keep their case
+COMPLEMENTS.update([(b.lower(), c.lower()) for (b, c) in list(COMPLEMENTS.items())])
+
+_maketrans = getattr(string, 'maketrans', None) or str.maketrans
+_COMPLEMENT_TABLE = _maketrans(''.join(COMPLEMENTS.keys()), ''.join(COMPLEMENTS.values()))
+# for unicode bases (e.g. read from JSON) in Python 2, whose translate takes a dict
+_COMPLEMENT_CODES = dict((ord(b), type(u'')(c)) for (b, c) in COMPLEMENTS.items())
+_NOT_A_BASE = re.compile('[^%s]' % ''.join(COMPLEMENTS.keys()))
 
 def reverseComplement(bases):
-    i, length = 0, len(bases)
-    seq = [None] * length
-    while i < length:
-        seq[-i - 1] = COMPLEMENTS[bases[i]]
-        i += 1
-    return ''.join(seq)
+    '''[Base] -> [Base]'''
+    bad = _NOT_A_BASE.search(bases)
+    if bad is not None:
+        raise KeyError(bad.group())
+    table = _COMPLEMENT_TABLE if isinstance(bases, str) else _COMPLEMENT_CODES
+    return bases.translate(table)[::-1]
 
 
 ########################################################
@@ -177,6 +379,35 @@ class CodonsTest(unittest.TestCase):
         self.assertEqual(codons[2], "TGA")
 
 
+class CodonViewTest(unittest.TestCase):
+
+    def setUp(self):
+        self.bases = 'ACGTCCTGATTG'
+
+    def testSameAsRotatedCodons(self):
+        b = self.bases
+        for n in range(3):
+            self.assertEqual(makeCodons(b[n:] + b[:n]), list(CodonView(b, n)))
+
+    def testIndexing(self):
+        view = CodonView(self.bases, 2)
+        self.assertEqual(4, len(view))
+        self.assertEqual('GAC', view[3])
+        self.assertEqual('GAC', view[-1])
+        self.assertRaises(IndexError, lambda: view[4])
+
+    @unittest.expectedFailure
+    def testBadLength(self):
+        CodonView('ACGTCCTG', 0)
+
+    def testScanners(self):
+        b = 'AAATAAAATAGA' + 'ATGGTGTGCTGC'
+        for n in range(3):
+            codons, view = makeCodons(b[n:] + b[:n]), CodonView(b, n)
+            self.assertEqual(getOrfEndsCircular(codons), getOrfEndsCircular(view))
+            self.assertEqual(getAllOrfEndsCircular(codons), getAllOrfEndsCircular(view))
+
+
 class ComplementTest(unittest.TestCase):
 
     def setUp(self):
@@ -186,6 +417,25 @@ class ComplementTest(unittest.TestCase):
         bases = 'ACGTCCTGA'
         self.assertEqual('TCAGGACGT', reverseComplement(bases))
 
+    def testRCAmbiguous(self):
+        self.assertEqual('NNYRKMSWBVDH', reverseComplement('DHBVWSKMYRNN'))
+
+    def testRCLowercase(self):
+        self.assertEqual('TCAggacGT', reverseComplement('ACgtccTGA'))
+
+    def testRCInvolution(self):
+        bases = 'ACGTNRYSWKMBVDHacgtnryswkmbvdh'
+        self.assertEqual(bases, reverseComplement(reverseComplement(bases)))
+
+    def testRCBadBase(self):
+        self.assertRaises(KeyError, reverseComplement, 'ACGXT')
+        self.assertRaises(KeyError, reverseComplement, 'ACG T')
+        self.assertRaises(KeyError, reverseComplement, u'ACGXT')
+
+    def testRCUnicode(self):
+        self.assertEqual(u'TCAggNCGT', reverseComplement(u'ACGNccTGA'))
+        self.assertEqual(reverseComplement('ACGTNRYSWKMBVDHacgt'), reverseComplement(u'ACGTNRYSWKMBVDHacgt'))
+
 
 class LinearOrfsTest(unittest.TestCase):
 
@@ -290,6 +540,95 @@ class CircularAllOrfsTest(unittest.TestCase):
         self.assertEqual((4, 1), o1[0])
         self.assertEqual((5, 2), o3[0])
         self.assertEqual((6, 2), o3[1])
+
+
+class NextStopTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cases = [
+            'ACTGTGACCTTGTTTTGAACT',
+            'TAGATTATGGTGCTG',
+            'TAGATTCCCCTCTAT',
+            'AAATAAAATAGA' + 'ATGGTGTGCTGC',
+            'AATAAAATAGA' + 'ATGGTGTGCTGCA',
+            'ATAAAATAGA' + 'ATGGTGTGCTGCAA'
+        ]
+
+    def testGetNextStops(self):
+        self.assertEqual([2, 2, 2, 4, 4], getNextStops(makeCodons('ATGCCCTAAGTGTGA')))
+        self.assertEqual([None, None], getNextStops(makeCodons('ATGCCC')))
+
+    def testSameAsReadToNextStop(self):
+        for bases in self.cases:
+            codons = makeCodons(bases)
+            self.assertEqual(getAllOrfEndsCircular(codons), getAllOrfEndsCircularTable(codons))
+
+    def testWraparound(self):
+        codons = makeCodons('TAGATTATGGTGCTG')
+        self.assertEqual([(2, 0), (3, 0), (4, 0)], getAllOrfEndsCircularTable(codons))
+
+    def testNostop(self):
+        codons = makeCodons('ACTATGGTGCTG')
+        self.assertRaises(ValueError, getAllOrfEndsCircularTable, codons)
+
+    def testNostartNostop(self):
+        self.assertEqual([], getAllOrfEndsCircularTable(makeCodons('CCCCTCTAT')))
     
+class StreamingTest(unittest.TestCase):
+
+    def setUp(self):
+        import random
+        rand = random.Random(9)
+        self.cases = [
+            'ACTGTGACCTTGTTTTGAACT',
+            'TAGATTATGGTGCTG',
+            'TAGATTCCCCTCTAT',
+            'ACCTGA' + 'CCGCAC' + 'TTGTTT',
+            'AAATAAAATAGA' + 'ATGGTGTGCTGC'
+        ] + [''.join(rand.choice('ACGT') for _ in range(rand.choice([30, 60, 300]))) for _ in range(30)]
+
+    def _outcome(self, scanner, codons):
+        try:
+            return scanner(codons)
+        except ValueError:
+            return ValueError
+
+    def testChunkedCodons(self):
+        b = 'ACGTCCTGATTGACC'
+        for n in range(3):
+            for chunkSize in [3, 4, 6, 15, 100]:
+                self.assertEqual(makeCodons(b[n:] + b[:n]), list(ChunkedCodons(b, n, chunkSize)))
+
+    def testSameAsCircular(self):
+        for bases in self.cases:
+            for n in range(3):
+                codons = makeCodons(bases[n:] + bases[:n])
+                if codons[-1] in STOPS and not any(c in STOPS for c in codons[:-1]):
+                    # getOrfEndsCircular runs off the end of the codons here
+                    continue
+                chunked = ChunkedCodons(bases, n, 9)
+                self.assertEqual(getOrfEndsCircular(codons), getOrfEndsCircularStreaming(chunked))
+                self.assertEqual(self._outcome(getAllOrfEndsCircularTable, codons),
+                                 self._outcome(getAllOrfEndsCircularStreaming, chunked))
+
+    def testFirstStopIsLast(self):
+        self.assertEqual([(0, 2)], getOrfEndsCircularStreaming(makeCodons('ATGCCCTAA')))
+
+    def testYieldsAsItReads(self):
+        read = []
+        def codons():
+            for c in makeCodons('TAA' + 'ATGCCCTAA' + 'GTGTGA' + 'CCCCCC'):
+                read.append(c)
+                yield c
+        for scanner in [iterOrfEndsCircularStreaming, iterAllOrfEndsCircularStreaming]:
+            del read[:]
+            ends = scanner(codons())
+            self.assertEqual((1, 3), next(ends))
+            self.assertEqual(4, len(read))
+
+    def testNostop(self):
+        self.assertEqual([], getOrfEndsCircularStreaming(makeCodons('ACTATGGTGCTG')))
+        self.assertRaises(ValueError, getAllOrfEndsCircularStreaming, makeCodons('ACTATGGTGCTG'))
+
 
-testClasses = [CodonsTest, ComplementTest, LinearOrfsTest, CircularOrfsTest, CircularAllOrfsTest]
+testClasses = [CodonsTest, CodonViewTest, ComplementTest, LinearOrfsTest, CircularOrfsTest, CircularAllOrfsTest, NextStopTableTest, StreamingTest]
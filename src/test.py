@@ -4,7 +4,6 @@ import sys
 import model
 import finder
 import sequence
-import bacillussubtilis168 as bs
 import kd
 import translate as tr
 import peaks
@@ -12,12 +11,28 @@ import filterer
 import controls
 import peters
 import junk
-
-
-
-_SHORTS = [model, sequence, kd, tr, peaks, filterer, peters]
-
-_LONGS = [junk, controls, bs, finder]
+import vectorized
+import packed
+import loader
+import profiles
+import columnar
+import intervals
+import contexts
+import motifs
+import fmindex
+import orfstore
+import orflines
+import parallel
+import chunked
+import scancache
+import pipeline
+import bench
+
+
+
+_SHORTS = [model, sequence, kd, tr, peaks, filterer, peters, vectorized, packed, loader, profiles, columnar, intervals, contexts, motifs, fmindex, orfstore, orflines, parallel, chunked, scancache, pipeline, bench]
+
+_LONGS = [junk, controls, finder]
 
 
 
@@ -0,0 +1,219 @@
+import sequence
+import unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+
+# bases are encoded as 0-3; anything else (N, lowercase, IUPAC) gets bit 2 set
+_BASE_CODES = {'A': 0, 'C': 1, 'G': 2, 'T': 3}
+_INVALID = 4
+
+# codons containing an invalid base are mapped to this code
+NO_CODON = 64
+
+
+def _require_numpy():
+    if numpy is None:
+        raise ImportError("the 'numpy' engine requires numpy to be installed")
+
+
+def codonCode(codon):
+    '''Codon -> Int'''
+    if len(codon) != 3 or any(b not in _BASE_CODES for b in codon):
+        return NO_CODON
+    b0, b1, b2 = [_BASE_CODES[b] for b in codon]
+    return b0 * 16 + b1 * 4 + b2
+
+
+def _codonMask(codons):
+    _require_numpy()
+    mask = numpy.zeros(NO_CODON + 1, dtype=bool)
+    mask[[codonCode(c) for c in codons]] = True
+    return mask
+
+
+def encodeBases(bases):
+    '''[Base] -> Array UInt8
+
+    Encodes each base as an integer 0-3, or 4 if it is not one of 'ACGT'.
+
+    '''
+    _require_numpy()
+    if not isinstance(bases, bytes):
+        bases = bases.encode('ascii')
+    table = numpy.empty(256, dtype=numpy.uint8)
+    table.fill(_INVALID)
+    for (b, code) in _BASE_CODES.items():
+        table[ord(b)] = code
+    return table[numpy.frombuffer(bases, dtype=numpy.uint8)]
+
+
+def fromBaseCodes(codes):
+    '''bytearray -> Array UInt8
+
+    Wraps base codes that are already encoded (i.e. from 
+    packed.PackedBases.get_base_codes) without copying them.
+
+    '''
+    _require_numpy()
+    return numpy.frombuffer(codes, dtype=numpy.uint8)
+
+
+def getCodonCodes(encoded, n):
+    '''Array UInt8 -> Int -> Array Int
+
+    Codon codes (0-63, or NO_CODON) of the circular sequence read
+    from base `n`, without building the rotated sequence.
+
+    '''
+    _require_numpy()
+    length = len(encoded)
+    if length % 3 != 0:
+        raise ValueError("number of bases must be divisible by 3")
+
+    positions = numpy.arange(n, n + length, 3)
+    b0 = encoded[positions % length].astype(numpy.int32)
+    b1 = encoded[(positions + 1) % length].astype(numpy.int32)
+    b2 = encoded[(positions + 2) % length].astype(numpy.int32)
+    codes = b0 * 16 + b1 * 4 + b2
+    codes[((b0 | b1 | b2) & _INVALID) != 0] = NO_CODON
+    return codes
+
+
+def _startsAndStops(codes):
+    codes = numpy.asarray(codes)
+    starts = numpy.flatnonzero(_codonMask(sequence.STARTS)[codes])
+    stops = numpy.flatnonzero(_codonMask(sequence.STOPS)[codes])
+    return starts, stops
+
+
+def getOrfEndsCircular(codes):
+    '''Array Int -> [(Int, Int)]
+
+    Same as sequence.getOrfEndsCircular, but works on codon codes.
+    Each stop closes the ORF opened by the first start following the
+    previous stop (circularly).
+
+    '''
+    _require_numpy()
+    length = len(codes)
+    starts, stops = _startsAndStops(codes)
+    if len(stops) == 0:
+        return []
+
+    # the last stop's ORF wraps around to the first stop
+    prevStops = stops
+    nextStops = numpy.append(stops[1:], stops[0] + length)
+    wrappedStarts = numpy.append(starts, starts + length)
+
+    ixs = numpy.searchsorted(wrappedStarts, prevStops, side='right')
+    firstStarts = numpy.append(wrappedStarts, length * 3)[ixs]
+    found = firstStarts < nextStops
+
+    ends = zip((firstStarts[found] % length).tolist(), (nextStops[found] % length).tolist())
+    return list(ends)
+
+
+def getAllOrfEndsCircular(codes):
+    '''Array Int -> [(Int, Int)]
+
+    Same as sequence.getAllOrfEndsCircular, but works on codon codes.
+
+    '''
+    _require_numpy()
+    starts, stops = _startsAndStops(codes)
+    if len(starts) == 0:
+        return []
+    if len(stops) == 0:
+        raise ValueError("no stop codon found")
+
+    ixs = numpy.searchsorted(stops, starts, side='right')
+    nextStops = numpy.append(stops, stops[0])[ixs]
+    return list(zip(starts.tolist(), nextStops.tolist()))
+
+
+
+########################################################
+# unit tests
+########################################################
+
+def _codesFor(bases, n=0):
+    return getCodonCodes(encodeBases(bases), n)
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class CodonCodesTest(unittest.TestCase):
+
+    def testCodonCode(self):
+        self.assertEqual((0, 63, 14, NO_CODON), tuple(map(codonCode, ['AAA', 'TTT', 'ATG', 'ANG'])))
+
+    def testGetCodonCodes(self):
+        self.assertEqual([14, 0, NO_CODON], _codesFor('ATGAAACNN').tolist())
+
+    def testGetCodonCodesOffset(self):
+        bases = 'ATGAAACCCGTT'
+        for n in range(3):
+            rotated = bases[n:] + bases[:n]
+            expected = [codonCode(c) for c in sequence.makeCodons(rotated)]
+            self.assertEqual(expected, _codesFor(bases, n).tolist())
+
+    @unittest.expectedFailure
+    def testGetCodonCodesBadLength(self):
+        _codesFor('ACGTCCTG')
+
+
+@unittest.skipIf(numpy is None, "numpy is not installed")
+class VectorizedOrfsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cases = [
+            'ACT' + 'GTGACCTCATATTAG' + 'GGGTTT',
+            'ACCTGA' + 'CCGCAC' + 'TTGTTT',
+            'ACTGTGACCTTGTTTTGAACT',
+            'TAGATTATGGTGCTG',
+            'TAGATTCCCCTCTAT',
+            'ACT' + 'GTGACCTCATATCAGGGGTTTACT' + 'GTGACCTCATATTAG' + 'GGGTTTACT' + 'TTGACCTCATATTGGTGA' + 'ATT',
+            'AAATAAAATAGA' + 'ATGGTGTGCTGC'
+        ]
+
+    def testOrfEndsCircular(self):
+        for bases in self.cases:
+            expected = sequence.getOrfEndsCircular(sequence.makeCodons(bases))
+            self.assertEqual(expected, getOrfEndsCircular(_codesFor(bases)))
+
+    def testAllOrfEndsCircular(self):
+        for bases in self.cases:
+            expected = sequence.getAllOrfEndsCircular(sequence.makeCodons(bases))
+            self.assertEqual(expected, getAllOrfEndsCircular(_codesFor(bases)))
+
+    def testWrapAround(self):
+        self.assertEqual([(4, 1)], getOrfEndsCircular(_codesFor('ACCTGA' + 'CCGCAC' + 'TTGTTT')))
+        self.assertEqual([(2, 0), (3, 0), (4, 0)], getAllOrfEndsCircular(_codesFor('TAGATTATGGTGCTG')))
+
+    def testNoStops(self):
+        self.assertEqual([], getOrfEndsCircular(_codesFor('ACTATGGTGCTG')))
+        self.assertRaises(ValueError, getAllOrfEndsCircular, _codesFor('ACTATGGTGCTG'))
+
+    def testLastCodonIsOnlyStop(self):
+        # the pure-Python scanner can't handle this case (IndexError)
+        self.assertEqual([(1, 3)], getOrfEndsCircular(_codesFor('CCCATGGGGTAA')))
+
+    def testRandomSequences(self):
+        import random
+        rand = random.Random(17)
+        for _ in range(50):
+            bases = ''.join(rand.choice('ACGT') for _ in range(3 * rand.randint(1, 60)))
+            codons, codes = sequence.makeCodons(bases), _codesFor(bases)
+            if codons[-1] in sequence.STOPS and not any(c in sequence.STOPS for c in codons[:-1]):
+                continue
+            self.assertEqual(sequence.getOrfEndsCircular(codons), getOrfEndsCircular(codes))
+            if any(c in sequence.STOPS for c in codons):
+                self.assertEqual(sequence.getAllOrfEndsCircular(codons), getAllOrfEndsCircular(codes))
+
+
+
+testClasses = [CodonCodesTest, VectorizedOrfsTest]